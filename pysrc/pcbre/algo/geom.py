@@ -1,3 +1,7 @@
+from collections import namedtuple
+
+import numpy
+
 from pcbre.matrix import project_point_line, line_distance_segment, Vec2
 from pcbre.model.const import IntersectionClass
 from shapely.geometry import Point as ShapelyPoint
@@ -48,7 +52,7 @@ def dist_pad_pad(p1, p2):
     :param p2:
     :return:
     """
-    if not p1.is_through():
+    if not p1.is_through() and not p2.is_through():
         if p1.layer != p2.layer:
             return float("inf")
 
@@ -58,14 +62,24 @@ def dist_pad_pad(p1, p2):
         return d - p1.w / 2 - p2.w / 2
 
     else:
+        # Layers were already checked, a through-hole pad's trace_repr is
+        # only on one of the layers it contacts
         t1 = p1.trace_repr
         t2 = p2.trace_repr
-        return dist_trace_trace(t1, t2)
+        d = line_distance_segment(t1.p0, t1.p1, t2.p0, t2.p1)
+        return d - t1.thickness / 2 - t2.thickness / 2
 
 
 def dist_via_pad(v1, p1):
-    d = (v1.pt - p1.center).mag()
-    return d - p1.w / 2 - v1.r
+    if not p1.is_through() and p1.layer not in v1.viapair.all_layers:
+        return float("inf")
+
+    if p1.w == p1.l:
+        d = (v1.pt - p1.center).mag()
+        return d - p1.w / 2 - v1.r
+
+    ptr = p1.trace_repr
+    return dist_pt_line_seg(v1.pt, ptr.p0, ptr.p1) - ptr.thickness / 2 - v1.r
 
 
 def dist_trace_pad(trace, p1):
@@ -83,7 +97,8 @@ def dist_trace_pad(trace, p1):
         )
     else:
         ptr = p1.trace_repr
-        return dist_trace_trace(ptr, trace)
+        d = line_distance_segment(ptr.p0, ptr.p1, trace.p0, trace.p1)
+        return d - ptr.thickness / 2 - trace.thickness / 2
 
 
 def dist_polygon_polygon(p1, p2):
@@ -264,3 +279,249 @@ for i in _geom_types:
 def layer_for(geom):
     if geom:
         return _layer_for_ops[geom.ISC.value](geom)
+
+
+# layers_for finds all layers the geometry may make contact on
+def _layers_for_XX(geom):
+    return (geom.layer,)
+
+
+_layers_for_polygon = _layers_for_trace = _layers_for_XX
+
+
+def _layers_for_pad(pad):
+    if pad.is_through():
+        return pad.parent._side_layer_oracle.stackup.layers
+    return (pad.layer,)
+
+
+def _layers_for_via(via):
+    return via.viapair.all_layers
+
+
+def _layers_for_virtual_line(vl):
+    return (vl.p0_layer, vl.p1_layer)
+
+
+_layers_for_ops = {}
+for i in _geom_types:
+    _layers_for_ops[i.value] = globals()["_layers_for_%s" % i.name.lower()]
+
+
+def layers_for(geom):
+    return _layers_for_ops[geom.ISC.value](geom)
+
+
+#
+# Batched distance kernels
+#
+# Traces, vias and pads are all capsules: a line segment (zero length for
+# vias and round pads) swept by a radius. A set of capsules is packed as
+# struct-of-arrays so that many distances are computed in a handful of numpy
+# operations instead of one python call per pair.
+#
+
+# p0, p1: (N, 2) float arrays of segment endpoints
+# r: (N,) float array of radii
+# layer_lo, layer_hi: (N,) int arrays, inclusive range of stackup layer
+#                     indices the capsule makes contact on
+CapsuleArrays = namedtuple("CapsuleArrays", ["p0", "p1", "r", "layer_lo", "layer_hi"])
+
+CAPSULE_CLASSES = frozenset(
+    (IntersectionClass.TRACE, IntersectionClass.VIA, IntersectionClass.PAD)
+)
+
+_ALL_LAYERS = (0, numpy.iinfo(numpy.int32).max)
+
+
+def _capsule_for(geom, order):
+    isc = geom.ISC
+    if isc == IntersectionClass.TRACE:
+        lo = hi = order(geom.layer)
+        return geom.p0, geom.p1, geom.thickness / 2, lo, hi
+
+    elif isc == IntersectionClass.VIA:
+        first, second = geom.viapair.layers
+        return geom.pt, geom.pt, geom.r, order(first), order(second)
+
+    elif isc == IntersectionClass.PAD:
+        if geom.is_through():
+            lo, hi = _ALL_LAYERS
+        else:
+            lo = hi = order(geom.layer)
+
+        if geom.w == geom.l:
+            return geom.center, geom.center, geom.w / 2, lo, hi
+
+        t = geom.trace_repr
+        return t.p0, t.p1, t.thickness / 2, lo, hi
+
+    raise ValueError("%r can't be represented as a capsule" % geom)
+
+
+def capsule_arrays(geoms):
+    """
+    Pack traces, vias and pads into struct-of-arrays form
+
+    :param geoms: iterable of geometry, all of a class in CAPSULE_CLASSES
+    :rtype: CapsuleArrays
+    """
+    orders = {}
+
+    def order(layer):
+        try:
+            return orders[layer]
+        except KeyError:
+            o = orders[layer] = layer.order
+            return o
+
+    rows = [_capsule_for(g, order) for g in geoms]
+    n = len(rows)
+
+    p0 = numpy.empty((n, 2), dtype=numpy.float64)
+    p1 = numpy.empty((n, 2), dtype=numpy.float64)
+    r = numpy.empty(n, dtype=numpy.float64)
+    layer_lo = numpy.empty(n, dtype=numpy.int32)
+    layer_hi = numpy.empty(n, dtype=numpy.int32)
+
+    for i, (a, b, radius, lo, hi) in enumerate(rows):
+        p0[i] = a.x, a.y
+        p1[i] = b.x, b.y
+        r[i] = radius
+        layer_lo[i] = lo
+        layer_hi[i] = hi
+
+    return CapsuleArrays(p0, p1, r, layer_lo, layer_hi)
+
+
+def _cross_many(a, b):
+    return a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+
+
+def dist_pt_seg_many(pt, s0, s1):
+    """
+    Distance from points to line segments, elementwise with broadcasting
+
+    :param pt: (N, 2) array of points
+    :param s0: (N, 2) array of segment start points
+    :param s1: (N, 2) array of segment end points
+    :return: (N,) array of distances
+    """
+    v = s1 - s0
+    w = pt - s0
+
+    length_square = numpy.einsum("...i,...i->...", v, v)
+    t = numpy.divide(
+        numpy.einsum("...i,...i->...", w, v),
+        length_square,
+        out=numpy.zeros(numpy.broadcast(w[..., 0], v[..., 0]).shape),
+        where=length_square != 0,
+    )
+    numpy.clip(t, 0, 1, out=t)
+
+    delta = w - t[..., None] * v
+    return numpy.hypot(delta[..., 0], delta[..., 1])
+
+
+def dist_seg_seg_many(a0, a1, b0, b1):
+    """
+    Distance between pairs of line segments, elementwise with broadcasting.
+    Batched equivalent of pcbre.matrix.line_distance_segment
+
+    :return: (N,) array of distances, 0 where segments cross
+    """
+    d = numpy.minimum(
+        numpy.minimum(dist_pt_seg_many(a0, b0, b1), dist_pt_seg_many(a1, b0, b1)),
+        numpy.minimum(dist_pt_seg_many(b0, a0, a1), dist_pt_seg_many(b1, a0, a1)),
+    )
+
+    va = a1 - a0
+    vb = b1 - b0
+    w = b0 - a0
+
+    denom = _cross_many(va, vb)
+    nonparallel = denom != 0
+    safe = numpy.where(nonparallel, denom, 1)
+
+    u = _cross_many(w, vb) / safe
+    v = _cross_many(w, va) / safe
+
+    crossing = nonparallel & (u >= 0) & (u <= 1) & (v >= 0) & (v <= 1)
+    return numpy.where(crossing, 0.0, d)
+
+
+def dist_capsule_many(a, b):
+    """
+    Distance between capsules, elementwise with broadcasting. Capsules that
+    share no layer are infinitely far apart.
+
+    :type a: CapsuleArrays
+    :type b: CapsuleArrays
+    :return: array of distances, negative where capsules overlap
+    """
+    d = dist_seg_seg_many(a.p0, a.p1, b.p0, b.p1) - a.r - b.r
+
+    shared = (a.layer_lo <= b.layer_hi) & (b.layer_lo <= a.layer_hi)
+    return numpy.where(shared, d, numpy.inf)
+
+
+def _capsule_rows(c, sel):
+    return CapsuleArrays(*(i[sel] for i in c))
+
+
+def distance_many(geom, others):
+    """
+    Distance from geom to each of others. Capsule geometry (traces, vias,
+    pads) is evaluated in one batch, anything else falls back to distance()
+
+    :param geom: geometry object
+    :param others: sequence of geometry objects
+    :return: (N,) array of distances in the order of others
+    """
+    out = numpy.empty(len(others), dtype=numpy.float64)
+    if not len(others):
+        return out
+
+    if geom.ISC not in CAPSULE_CLASSES:
+        out[:] = [distance(geom, o) for o in others]
+        return out
+
+    batch = []
+    for n, o in enumerate(others):
+        if o.ISC in CAPSULE_CLASSES:
+            batch.append(n)
+        else:
+            out[n] = distance(geom, o)
+
+    if batch:
+        c = capsule_arrays([geom] + [others[n] for n in batch])
+        head = _capsule_rows(c, slice(0, 1))
+        rest = _capsule_rows(c, slice(1, None))
+        out[batch] = dist_capsule_many(head, rest)
+
+    return out
+
+
+def distance_pairs(a, b):
+    """
+    Elementwise distance between two equal-length sequences of geometry
+
+    :return: (N,) array where element n is distance(a[n], b[n])
+    """
+    assert len(a) == len(b)
+
+    out = numpy.empty(len(a), dtype=numpy.float64)
+
+    batch = []
+    for n, (i, j) in enumerate(zip(a, b)):
+        if i.ISC in CAPSULE_CLASSES and j.ISC in CAPSULE_CLASSES:
+            batch.append(n)
+        else:
+            out[n] = distance(i, j)
+
+    if batch:
+        ca = capsule_arrays([a[n] for n in batch])
+        cb = capsule_arrays([b[n] for n in batch])
+        out[batch] = dist_capsule_many(ca, cb)
+
+    return out
@@ -0,0 +1,79 @@
+from collections import defaultdict
+
+
+class UnionFind:
+    """
+    Disjoint-set forest over hashable items, with path compression and union
+    by rank. Used to label connected groups of geometry.
+    """
+
+    def __init__(self, items=()):
+        self.__parent = {}
+        self.__rank = {}
+
+        for i in items:
+            self.add(i)
+
+    def __len__(self):
+        return len(self.__parent)
+
+    def __contains__(self, item):
+        return item in self.__parent
+
+    def add(self, item):
+        if item not in self.__parent:
+            self.__parent[item] = item
+            self.__rank[item] = 0
+
+    def find(self, item):
+        """
+        :param item:
+        :return: representative item of the set containing item
+        """
+        parent = self.__parent
+
+        root = item
+        while parent[root] != root:
+            root = parent[root]
+
+        # Path compression, point everything on the path at the root
+        while parent[item] != root:
+            parent[item], item = root, parent[item]
+
+        return root
+
+    def union(self, a, b):
+        """
+        Merge the sets containing a and b
+
+        :return: representative item of the merged set
+        """
+        ra = self.find(a)
+        rb = self.find(b)
+
+        if ra == rb:
+            return ra
+
+        rank_a = self.__rank[ra]
+        rank_b = self.__rank[rb]
+
+        if rank_a < rank_b:
+            ra, rb = rb, ra
+        elif rank_a == rank_b:
+            self.__rank[ra] += 1
+
+        self.__parent[rb] = ra
+        return ra
+
+    def connected(self, a, b):
+        return self.find(a) == self.find(b)
+
+    def groups(self):
+        """
+        :return: list of sets, one per disjoint set
+        """
+        out = defaultdict(set)
+        for i in self.__parent:
+            out[self.find(i)].add(i)
+
+        return list(out.values())
@@ -2,11 +2,14 @@ import weakref
 import itertools
 import operator
 
-from collections import defaultdict
+from collections import defaultdict, deque
+
+import numpy
 from rtree import index
 
-from pcbre.matrix import Point2
+from pcbre.matrix import Point2, Rect
 from pcbre.algo.geom import (
+    CAPSULE_CLASSES,
     dist_via_via,
     dist_via_trace,
     dist_trace_trace,
@@ -14,12 +17,17 @@ from pcbre.algo.geom import (
     dist_trace_pad,
     dist_pad_pad,
     distance,
+    distance_many,
+    distance_pairs,
+    layers_for,
     point_inside,
     can_self_intersect,
     intersect,
 )
+from pcbre.algo.unionfind import UnionFind
 from pcbre.model import serialization as ser
 from pcbre.model.artwork_geom import Trace, Via, Polygon, Airwire
+from pcbre.model.columns import TraceColumns, ViaColumns
 from pcbre.model.component import Component
 from pcbre.model.const import IntersectionClass
 from pcbre.model.dipcomponent import DIPComponent
@@ -30,6 +38,17 @@ from pcbre.model.smd4component import SMD4Component
 from pcbre.model.util import ImmutableSetProxy
 
 
+# Pick priority of geometry classes sharing a layer in query_point. Smaller
+# features that are drawn on top come first.
+_POINT_CLASS_PRIORITY = {
+    IntersectionClass.VIA: 0,
+    IntersectionClass.PAD: 1,
+    IntersectionClass.VIRTUAL_LINE: 2,
+    IntersectionClass.TRACE: 3,
+    IntersectionClass.POLYGON: 4,
+}
+
+
 # kref Rules of engagement:
 #
 # Once an item is added to artwork, it should be considered geometrically and
@@ -41,23 +60,55 @@ class ArtworkIndex:
     Artwork index provides a wrapper on the Rtree spatial query
     library. Specifically, it resolves query results to physical geom objects,
     as well as uses the "fast" query paths.
+
+    Geometry is partitioned into one Rtree per (layer, IntersectionClass), so
+    that layered queries never visit geometry that lives on other layers. Vias
+    and through-hole pads contact every layer they pass through, and are kept
+    in a single through-layer tree that every layered query visits. Objects
+    that can't intersect anything (components) are kept in their own tree.
+
+    Airwires only make contact at their endpoints, so rather than their bbox,
+    each endpoint is indexed on the layer it is anchored to.
     """
 
+    THROUGH = "through"
+    UNLAYERED = "unlayered"
+
+    __THROUGH_CLASSES = frozenset((IntersectionClass.VIA, IntersectionClass.PAD))
+
     def __init__(self):
-        self.__index = index.Index()
+        self.__trees = {}
+        self.__tree_sizes = defaultdict(int)
+        self.__layer_keys = defaultdict(set)
         self.__idx = 0
 
-        self.__obj_to_idx = weakref.WeakKeyDictionary()
         self.__idx_to_obj = weakref.WeakValueDictionary()
 
-    def __get_idx(self, k):
-        try:
-            return self.__obj_to_idx[k]
-        except KeyError:
-            r = self.__obj_to_idx[k] = self.__idx
-            self.__idx_to_obj[r] = k
-            self.__idx += 1
-            return r
+        # obj -> (idx, ((tree key, rect in index order), ...))
+        self.__obj_to_entries = weakref.WeakKeyDictionary()
+
+    def __add_entries(self, geom):
+        """
+        Assign geom an id, and record where it is stored in the index
+
+        :return: (idx, entries)
+        """
+        assert geom not in self.__obj_to_entries
+
+        idx = self.__idx
+        self.__idx += 1
+        self.__idx_to_obj[idx] = geom
+
+        entries = tuple(
+            (key, self.__rect_index_order(rect))
+            for key, rect in self.entries_for(geom)
+        )
+
+        self.__obj_to_entries[geom] = idx, entries
+        return idx, entries
+
+    def __contains__(self, geom):
+        return geom in self.__obj_to_entries
 
     def __get_obj(self, idx):
         try:
@@ -69,30 +120,180 @@ class ArtworkIndex:
     def __rect_index_order(rect):
         return (rect.left, rect.bottom, rect.right, rect.top)
 
+    @staticmethod
+    def entries_for(geom):
+        """
+        Determine where a piece of geometry is stored in the index
+
+        :param geom: geometry to key
+        :return: tuple of (tree key, rect) pairs
+        """
+        isc = geom.ISC
+        if isc == IntersectionClass.VIA:
+            return ((ArtworkIndex.THROUGH, geom.bbox),)
+
+        elif isc == IntersectionClass.PAD and geom.is_through():
+            return ((ArtworkIndex.THROUGH, geom.bbox),)
+
+        elif isc == IntersectionClass.VIRTUAL_LINE:
+            return (
+                ((geom.p0_layer, isc), Rect.fromCenterSize(geom.p0)),
+                ((geom.p1_layer, isc), Rect.fromCenterSize(geom.p1)),
+            )
+
+        elif isc == IntersectionClass.NONE:
+            return ((ArtworkIndex.UNLAYERED, geom.bbox),)
+
+        return (((geom.layer, isc), geom.bbox),)
+
+    def __tree(self, key):
+        try:
+            return self.__trees[key]
+        except KeyError:
+            return self.__set_tree(key, index.Index())
+
+    def __set_tree(self, key, tree):
+        self.__trees[key] = tree
+        if isinstance(key, tuple):
+            self.__layer_keys[key[0]].add(key)
+        return tree
+
+    def __trees_for_layers(self, layers, classes):
+        if self.THROUGH in self.__trees and (
+            classes is None or not self.__THROUGH_CLASSES.isdisjoint(classes)
+        ):
+            yield self.__trees[self.THROUGH]
+
+        for layer in layers:
+            for key in self.__layer_keys.get(layer, ()):
+                if classes is None or key[1] in classes:
+                    yield self.__trees[key]
+
+    def __resolve(self, trees, bbox):
+        r = self.__rect_index_order(bbox)
+
+        idxs = set()
+        for tree in trees:
+            idxs.update(tree.intersection(r))
+
+        return (self.__get_obj(idx) for idx in idxs)
+
     def insert(self, geom):
-        self.__index.insert(self.__get_idx(geom), self.__rect_index_order(geom.bbox))
+        idx, entries = self.__add_entries(geom)
+
+        for key, r in entries:
+            self.__tree(key).insert(idx, r)
+            self.__tree_sizes[key] += 1
+
+    def insert_many(self, geoms):
+        """
+        Insert many objects at once.
+
+        Trees that would at least double in size are rebuilt from scratch
+        with the rtree stream loader, which bulk-loads using STR packing. This
+        is both much faster than repeated insertion and yields a better
+        packed tree. Trees that only grow a little are inserted into as usual.
+
+        :param geoms: iterable of geometry objects
+        """
+        pending = defaultdict(list)
+        for geom in geoms:
+            idx, entries = self.__add_entries(geom)
+
+            for key, r in entries:
+                pending[key].append((idx, r, None))
+
+        for key, items in pending.items():
+            size = self.__tree_sizes[key]
+
+            if size > len(items):
+                tree = self.__trees[key]
+                for idx, r, _ in items:
+                    tree.insert(idx, r)
+
+            else:
+                stream = list(items)
+                if size:
+                    tree = self.__trees[key]
+                    stream.extend(
+                        (i.id, tuple(i.bbox), None)
+                        for i in tree.intersection(tree.bounds, objects=True)
+                    )
+
+                self.__set_tree(key, index.Index(iter(stream)))
+
+            self.__tree_sizes[key] = size + len(items)
 
     def intersect(self, bbox):
-        idxs = self.__index.intersection(self.__rect_index_order(bbox))
-        return (self.__get_obj(idx) for idx in idxs)
+        """
+        Find all indexed objects whose bbox intersects bbox, on any layer
 
-    def nearest(self, bbox):
-        idxs = self.__index.nearest(self.__rect_index_order(bbox))
-        return (self.__get_obj(idx) for idx in idxs)
+        :param bbox: query rectangle
+        :return: generator of geometry objects
+        """
+        return self.__resolve(list(self.__trees.values()), bbox)
+
+    def intersect_layers(self, bbox, layers, classes=None):
+        """
+        Find all objects whose bbox intersects bbox, and that may make contact
+        on any of the specified layers. Through-layer geometry is always
+        considered a candidate.
+
+        :param bbox: query rectangle
+        :param layers: iterable of stackup layers to search
+        :param classes: optional collection of IntersectionClass to restrict
+                        the layered search to
+        :return: generator of geometry objects
+        """
+        return self.__resolve(list(self.__trees_for_layers(layers, classes)), bbox)
+
+    def intersect_unlayered(self, bbox):
+        """
+        Find all non-intersecting objects (components) whose bbox intersects
+        bbox
+
+        :param bbox: query rectangle
+        :return: generator of objects
+        """
+        trees = [self.__trees[k] for k in (self.UNLAYERED,) if k in self.__trees]
+        return self.__resolve(trees, bbox)
 
     def remove(self, geom):
-        idx = self.__obj_to_idx[geom]
-        del self.__obj_to_idx[geom]
+        idx, entries = self.__obj_to_entries.pop(geom)
         del self.__idx_to_obj[idx]
 
-        self.__index.delete(idx, self.__rect_index_order(geom.bbox))
+        for key, r in entries:
+            self.__trees[key].delete(idx, r)
+            self.__tree_sizes[key] -= 1
 
 
 class Artwork:
-    def __init__(self, project):
+    def __init__(self, project, columnar=False):
+        """
+        :param project:
+        :param columnar: keep trace and via geometry in column stores
+                         (trace_columns and via_columns) instead of on each
+                         object. Uses far less memory per object, and lets
+                         consumers read geometry as numpy arrays.
+        """
         self.__project = project
         self.__index = ArtworkIndex()
 
+        if columnar:
+            self.trace_columns = TraceColumns()
+            self.via_columns = ViaColumns()
+            self.__columns = {Trace: self.trace_columns, Via: self.via_columns}
+        else:
+            self.trace_columns = None
+            self.via_columns = None
+            self.__columns = {}
+
+        self.__triangulation_pool = None
+        self.__journal = None
+
+        # Held weakly, views come and go while the project stays
+        self.__listeners = weakref.WeakSet()
+
         self.__vias = set()
         self.__airwires = set()
         self.__traces = set()
@@ -114,6 +315,134 @@ class Artwork:
         self.polygons = ImmutableSetProxy(self.__polygons)
         self.polygons_generation = 0
 
+        # Net -> set of all geometry (including pads) on the net
+        self.__net_geom = defaultdict(set)
+
+    def __register_net(self, geom):
+        # Geometry without a net isn't on any net to look up
+        if geom.net is None:
+            return
+
+        self.__net_geom[geom.net].add(geom)
+
+    def __unregister_net(self, geom):
+        if geom.net is None:
+            return
+
+        members = self.__net_geom[geom.net]
+        members.remove(geom)
+        if not members:
+            del self.__net_geom[geom.net]
+
+    def __set_net(self, geom, net):
+        """
+        Reassign the net of geom, keeping the net membership registry
+        up to date if geom is part of the artwork
+        """
+        if self.__journal is not None:
+            self.__journal.record_net(geom)
+
+        # Geometry in the index is registered under its net, if it has one
+        if geom in self.__index:
+            self.__unregister_net(geom)
+            geom.net = net
+            self.__register_net(geom)
+        else:
+            geom.net = net
+
+    def __type_store(self, aw):
+        """
+        :param aw: single-net piece of geometry
+        :return: (set holding the geometry type, name of its generation counter)
+        """
+        if isinstance(aw, Trace):
+            return self.__traces, "traces_generation"
+
+        elif isinstance(aw, Via):
+            return self.__vias, "vias_generation"
+
+        elif isinstance(aw, Polygon):
+            return self.__polygons, "polygons_generation"
+
+        elif isinstance(aw, Airwire):
+            return self.__airwires, "airwires_generation"
+
+        raise NotImplementedError()
+
+    def __added(self, aw):
+        """
+        Per-type bookkeeping once aw is in its type set
+        """
+        columns = self.__columns.get(type(aw))
+        if columns is not None:
+            aw._attach(columns)
+
+        if self.__triangulation_pool is not None and isinstance(aw, Polygon):
+            self.__triangulation_pool.submit(aw)
+
+        if self.__journal is not None:
+            self.__journal.record_add(aw)
+
+        for listener in list(self.__listeners):
+            listener.artwork_added(aw)
+
+    def __removed(self, aw):
+        if type(aw) in self.__columns:
+            aw._detach()
+
+        if self.__triangulation_pool is not None and isinstance(aw, Polygon):
+            self.__triangulation_pool.cancel(aw)
+
+        if self.__journal is not None:
+            self.__journal.record_remove(aw)
+
+        for listener in list(self.__listeners):
+            listener.artwork_removed(aw)
+
+    @property
+    def triangulation_pool(self):
+        return self.__triangulation_pool
+
+    def set_triangulation_pool(self, pool):
+        """
+        Triangulate polygons in the background as they are added. Polygons
+        already present that don't have a triangulation are submitted
+        immediately.
+
+        :type pool: pcbre.model.triangulation.TriangulationPool
+        """
+        self.__triangulation_pool = pool
+        if pool is not None:
+            pool.submit_many(self.__polygons)
+
+    @property
+    def journal(self):
+        return self.__journal
+
+    def set_journal(self, journal):
+        """
+        Record all further changes to the artwork in journal
+
+        :type journal: pcbre.model.journal.Journal
+        """
+        self.__journal = journal
+
+    def add_listener(self, listener):
+        """
+        Tell listener about every single-net piece of geometry added to or
+        removed from the artwork, through its artwork_added(aw) and
+        artwork_removed(aw) methods. Components are not reported.
+
+        The listener is held weakly.
+        """
+        self.__listeners.add(listener)
+
+    def remove_listener(self, listener):
+        self.__listeners.discard(listener)
+
+    def __bump_generation(self, name):
+        setattr(self, name, getattr(self, name) + 1)
+
     def add_artwork(self, aw):
         """
         Add any single-net piece of geometry to the board artwork
@@ -125,28 +454,73 @@ class Artwork:
         assert aw.net is not None
         assert aw.net._project is self.__project
 
-        if isinstance(aw, Trace):
-            self.__traces.add(aw)
-            self.traces_generation += 1
+        store, generation = self.__type_store(aw)
+        store.add(aw)
+        self.__added(aw)
+        self.__bump_generation(generation)
 
-        elif isinstance(aw, Via):
-            self.__vias.add(aw)
-            self.vias_generation += 1
+        self.__index.insert(aw)
+        self.__register_net(aw)
 
-        elif isinstance(aw, Polygon):
-            self.__polygons.add(aw)
-            self.polygons_generation += 1
+        aw._project = self.__project
 
-        elif isinstance(aw, Airwire):
-            self.__airwires.add(aw)
-            self.airwires_generation += 1
+    def add_many(self, items):
+        """
+        Add many pieces of geometry and components to the board artwork in
+        one batch. All geometry must already be assigned a net.
 
-        else:
-            raise NotImplementedError()
+        The spatial index is bulk-loaded rather than built by one insertion
+        per object, and each generation counter is bumped at most once.
 
-        self.__index.insert(aw)
+        :param items: iterable of single-net geometry and components
+        :return:
+        """
+        items = list(items)
 
-        aw._project = self.__project
+        for aw in items:
+            if not isinstance(aw, Component):
+                assert aw.net is not None
+                assert aw.net._project is self.__project
+
+        self.__insert_many(items)
+
+    def __insert_many(self, items):
+        indexed = []
+        generations = set()
+
+        for aw in items:
+            assert aw is not None
+            assert aw._project is None
+
+            if isinstance(aw, Component):
+                # Pads resolve their layers through the project
+                aw._project = self.__project
+
+                self.__components.add(aw)
+                if self.__journal is not None:
+                    self.__journal.record_add(aw)
+                indexed.append(aw)
+                indexed.extend(aw.get_pads())
+                generations.add("components_generation")
+                continue
+
+            store, generation = self.__type_store(aw)
+            store.add(aw)
+            self.__added(aw)
+            indexed.append(aw)
+            generations.add(generation)
+
+        self.__index.insert_many(indexed)
+
+        for aw in indexed:
+            if not isinstance(aw, Component):
+                self.__register_net(aw)
+
+        for aw in items:
+            aw._project = self.__project
+
+        for generation in generations:
+            self.__bump_generation(generation)
 
     def add_component(self, cmp):
         """
@@ -157,9 +531,13 @@ class Artwork:
         self.__components.add(cmp)
         cmp._project = self.__project
 
+        if self.__journal is not None:
+            self.__journal.record_add(cmp)
+
         self.__index.insert(cmp)
         for pad in cmp.get_pads():
             self.__index.insert(pad)
+            self.__register_net(pad)
 
         self.components_generation += 1
 
@@ -177,10 +555,15 @@ class Artwork:
         for pad in cmp.get_pads():
             self.remove_aw_nets(pad, suppress_presence_error=False)
             self.__index.remove(pad)
+            self.__unregister_net(pad)
+            self.__remove_anchored_airwires(pad)
 
         self.__index.remove(cmp)
         self.__components.remove(cmp)
 
+        if self.__journal is not None:
+            self.__journal.record_remove(cmp)
+
         self.components_generation += 1
 
     def remove_artwork(self, aw):
@@ -192,34 +575,18 @@ class Artwork:
         self.remove_aw_nets(aw)
 
         self.__index.remove(aw)
+        self.__unregister_net(aw)
 
-        if isinstance(aw, Trace):
-            self.__traces.remove(aw)
-            self.traces_generation += 1
-
-        elif isinstance(aw, Via):
-            self.__vias.remove(aw)
-            self.vias_generation += 1
-
-        elif isinstance(aw, Polygon):
-            self.__polygons.remove(aw)
-            self.polygons_generation += 1
-
-        elif isinstance(aw, Airwire):
-            self.__airwires.remove(aw)
-            self.airwires_generation += 1
-
-        else:
-            raise NotImplementedError()
+        store, generation = self.__type_store(aw)
+        store.remove(aw)
+        self.__removed(aw)
+        self.__bump_generation(generation)
 
         # If its not an airwire we're removing
         # We need to find any airwires that rely on the geom
         # and remove them
         if not isinstance(aw, Airwire):
-            for airwire in set(self.__airwires):
-                if intersect(aw, airwire):
-                    self.__airwires.remove(airwire)
-                    self.airwires_generation += 1
+            self.__remove_anchored_airwires(aw)
 
         # If no remaining geometry is on the net, we need to drop it
         n = self.get_geom_for_net(aw_net)
@@ -229,6 +596,28 @@ class Artwork:
 
         aw._project = None
 
+    def __remove_anchored_airwires(self, geom):
+        """
+        Remove any airwires with an endpoint anchored on geom. Only airwires
+        with an endpoint inside the footprint of geom are tested.
+        """
+        candidates = list(
+            self.__index.intersect_layers(
+                geom.bbox,
+                layers_for(geom),
+                classes=(IntersectionClass.VIRTUAL_LINE,),
+            )
+        )
+
+        for airwire in candidates:
+            if intersect(geom, airwire):
+                self.__airwires.remove(airwire)
+                self.__removed(airwire)
+                self.__index.remove(airwire)
+                self.__unregister_net(airwire)
+                airwire._project = None
+                self.airwires_generation += 1
+
     def remove(self, aw):
         if isinstance(aw, Component):
             self.remove_component(aw)
@@ -241,6 +630,76 @@ class Artwork:
         else:
             self.merge_artwork(aw)
 
+    def merge_many(self, items):
+        """
+        Merge many pieces of geometry and components into the design in one
+        batch, assigning nets and merging nets as merge() would.
+
+        Everything is bulk-inserted first, then connectivity of the new
+        geometry is resolved in a single pass. New geometry and the nets of
+        existing geometry it touches are labeled with a union-find, so each
+        resulting group costs at most one net merge (or one new net)
+        regardless of how many new objects it contains.
+
+        :param items: iterable of single-net geometry and components
+        :return:
+        """
+        items = list(items)
+
+        # Geometry without a net is held in the None bucket of the net
+        # registry until it is resolved below
+        self.__insert_many(items)
+
+        new_geom = []
+        for aw in items:
+            if isinstance(aw, Component):
+                new_geom.extend(aw.get_pads())
+            else:
+                new_geom.append(aw)
+
+        new_set = set(new_geom)
+
+        groups = UnionFind(new_geom)
+        for k in new_geom:
+            if k.net is not None:
+                groups.add(k.net)
+                groups.union(k, k.net)
+
+            for other in self.__index.intersect_layers(k.bbox, layers_for(k)):
+                if other is k:
+                    continue
+
+                # Existing geometry is represented by its net
+                if other in new_set or other.net is None:
+                    node = other
+                else:
+                    node = other.net
+                groups.add(node)
+
+                if groups.connected(k, node):
+                    continue
+
+                if distance(k, other) <= 0:
+                    groups.union(k, node)
+
+        for group in groups.groups():
+            nets = [i for i in group if isinstance(i, Net)]
+            geoms = [i for i in group if not isinstance(i, Net)]
+
+            if not geoms:
+                continue
+
+            if len(nets) > 1:
+                new_net = self.merge_nets_many(nets)
+            elif nets:
+                new_net = nets[0]
+            else:
+                new_net = Net()
+                self.__project.nets.add_net(new_net)
+
+            for g in geoms:
+                self.__set_net(g, new_net)
+
     @property
     def __all_pads(self):
         for c in self.components:
@@ -257,7 +716,7 @@ class Artwork:
         return gen()
 
     def get_geom_for_net(self, net):
-        return [i for i in self.get_all_artwork() if i.net is net]
+        return list(self.__net_geom.get(net, ()))
 
     def merge_nets(self, net1, net2):
         """
@@ -268,14 +727,22 @@ class Artwork:
         :param net2: source Net object
         :return: None
         """
-        for aw in self.get_all_artwork():
-            if aw.net == net2:
-                aw.net = net1
+        moved = self.__net_geom.pop(net2, ())
+        for aw in moved:
+            aw.net = net1
+
+        if self.__journal is not None:
+            for aw in moved:
+                self.__journal.record_net(aw)
+
+        if moved:
+            self.__net_geom[net1].update(moved)
 
         self.__project.nets.remove_net(net2)
 
     def merge_nets_many(self, nets):
-        queue = list(nets)
+        # Merge into the largest net, so the fewest objects are relabeled
+        queue = sorted(nets, key=lambda n: len(self.__net_geom.get(n, ())))
         acc = queue.pop()
 
         while queue:
@@ -284,30 +751,115 @@ class Artwork:
 
         return acc
 
-    def query_point(self, pt, layers_include=None, layers_exclude=None):
+    def query_point_all(self, pt, layers_include=None, layers_exclude=None):
         """
-        Queries a single point to identify geometry at that location
+        Queries a single point to identify all geometry at that location
+
+        Results are ordered by pick priority. Geometry on the first searched
+        layer comes first; within a layer, vias and pads come before airwires,
+        traces and polygons. Components are always last.
 
         :param pt: Point to query
         :type pt: (float, float)
-        :param layers_include:
-        :param layers_exclude:
-        :return:
+        :param layers_include: layers to search, in priority order. Defaults to
+                               all stackup layers, top first
+        :param layers_exclude: layers to omit from the search
+        :return: list of artwork objects and components
         """
         pt = Point2(pt)
 
-        # layers_include / layers_exclude specify IDs of the layers to search,
-        # or exclude from the search since exclude implicitly means "all layers
+        # layers_include / layers_exclude specify the layers to search, or
+        # exclude from the search since exclude implicitly means "all layers
         # minus the specified", the combination of both is invalid
         assert layers_include is None or layers_exclude is None
 
-        for aw in self.get_all_artwork():
-            if point_inside(aw, pt):
-                return aw
+        if layers_include is not None:
+            layers = list(layers_include)
+        else:
+            layers = list(self.__project.stackup.layers)
+
+        if layers_exclude is not None:
+            layers = [i for i in layers if i not in layers_exclude]
+
+        layer_rank = {}
+        for n, layer in enumerate(layers):
+            layer_rank.setdefault(layer, n)
+
+        def rank_for(geom_layers):
+            ranks = [layer_rank[i] for i in geom_layers if i in layer_rank]
+            if not ranks:
+                return None
+            return min(ranks)
+
+        bbox = Rect.fromCenterSize(pt)
+
+        hits = []
+        for aw in self.__index.intersect_layers(bbox, layers):
+            rank = rank_for(layers_for(aw))
+            if rank is None or not point_inside(aw, pt):
+                continue
+
+            hits.append(((rank, _POINT_CLASS_PRIORITY[aw.ISC]), aw))
+
+        cmp_hits = []
+        for cmp in self.__index.intersect_unlayered(bbox):
+            rank = rank_for(cmp.on_layers())
+            if rank is None or not cmp.point_inside(pt):
+                continue
+
+            cmp_hits.append((rank, cmp))
+
+        hits.sort(key=operator.itemgetter(0))
+        cmp_hits.sort(key=operator.itemgetter(0))
+
+        return [i for _, i in hits] + [i for _, i in cmp_hits]
+
+    def query_rect(self, rect):
+        """
+        Find the artwork that may show within a rectangle, e.g. to only draw
+        what is on screen
+
+        :param rect: query rectangle
+        :return: list of vias, traces, polygons and airwires whose bbox
+                 intersects rect
+        """
+        # Pads are drawn with their components. Airwires are indexed by their
+        # endpoints only, and may cross rect with both endpoints outside it
+        out = [
+            aw for aw in self.__index.intersect(rect)
+            if aw.ISC not in (IntersectionClass.PAD,
+                              IntersectionClass.VIRTUAL_LINE,
+                              IntersectionClass.NONE)
+        ]
+        out.extend(aw for aw in self.airwires if aw.bbox.intersects(rect))
+        return out
+
+    def query_rect_components(self, rect):
+        """
+        :param rect: query rectangle
+        :return: list of components whose bbox, or the bbox of any of whose
+                 pads, intersects rect
+        """
+        # Dicts are used as insertion ordered sets
+        out = dict.fromkeys(self.__index.intersect_unlayered(rect))
+        for geom in self.__index.intersect(rect):
+            if geom.ISC == IntersectionClass.PAD:
+                out[geom.parent] = None
+        return list(out)
+
+    def query_point(self, pt, layers_include=None, layers_exclude=None):
+        """
+        Queries a single point to identify geometry at that location
 
-        for cmp in self.components:
-            if cmp.point_inside(pt):
-                return cmp
+        :param pt: Point to query
+        :type pt: (float, float)
+        :param layers_include:
+        :param layers_exclude:
+        :return: highest priority object at pt (see query_point_all), or None
+        """
+        r = self.query_point_all(pt, layers_include, layers_exclude)
+        if r:
+            return r[0]
 
         return None
 
@@ -334,7 +886,7 @@ class Artwork:
             new_net = Net()
             self.__project.nets.add_net(new_net)
 
-        new_geom.net = new_net
+        self.__set_net(new_geom, new_net)
 
     def remove_aw_nets(self, geom, suppress_presence_error=False):
         """
@@ -359,82 +911,147 @@ class Artwork:
             if not suppress_presence_error:
                 raise
 
-        # Build list of all geometry on the net
-        all_geom = []
-        for aw in self.get_all_artwork():
-            if aw.net == geom.net and aw is not geom:
-                all_geom.append(aw)
+        # Only neighbours on the same net can be split from each other
+        seeds = [i for i in connected if i.net is geom.net]
 
-        subgroups = self.compute_connected(all_geom)
+        for group in self.__split_groups(geom, seeds):
+            newnet = Net()
+            self.__project.nets.add_net(newnet)
+            for g in group:
+                self.__set_net(g, newnet)
 
-        # Sanity check
-        for g in subgroups:
-            assert geom not in g
-            for gg in g:
-                assert gg.net == geom.net
+        self.__set_net(geom, None)
 
-        def net_gen():
-            yield geom.net
+    def __touching(self, geom, exclude):
+        """
+        Generator of geometry on the same net that touches geom, ignoring
+        exclude
+        """
+        for other in self.__index.intersect_layers(geom.bbox, layers_for(geom)):
+            if other is exclude or other is geom or other.net is not geom.net:
+                continue
 
-            newnet = Net()
-            self.__project.nets.add_net(newnet)
-            yield newnet
+            if distance(geom, other) <= 0:
+                yield other
 
-        for group, net in zip(subgroups, net_gen()):
-            for g in group:
-                g.net = net
+    def __split_groups(self, geom, seeds):
+        """
+        Determine which of seeds are disconnected from each other once geom is
+        removed.
+
+        A breadth-first search is run from every seed in round-robin. Searches
+        that meet are merged, and the search stops as soon as only one is
+        left running. Any search that runs out of frontier before that has
+        fully explored a piece that was split off. The cost is proportional to
+        the size of the split-off pieces, not the size of the net.
+
+        :param geom: geometry being removed
+        :param seeds: geometry that touched geom
+        :return: list of sets of geometry that must move to new nets
+        """
+        if len(seeds) < 2:
+            return []
+
+        searches = UnionFind(range(len(seeds)))
+        owner = {}
+        frontier = {}
+        members = {}
+
+        for n, s in enumerate(seeds):
+            owner[s] = n
+            frontier[n] = deque([s])
+            members[n] = [s]
+
+        def merge(a, b):
+            ra = searches.find(a)
+            rb = searches.find(b)
+            if ra == rb:
+                return
+
+            root = searches.union(ra, rb)
+            other = rb if root == ra else ra
+
+            frontier[root].extend(frontier.pop(other))
+            members[root].extend(members.pop(other))
+
+        split = []
+        while len(frontier) > 1:
+            for n in list(frontier):
+                if n not in frontier or len(frontier) == 1:
+                    continue
 
-        geom.net = None
+                queue = frontier[n]
+                if not queue:
+                    # Exhausted, this piece is fully explored and isolated
+                    del frontier[n]
+                    split.append(set(members.pop(n)))
+                    continue
+
+                k = queue.popleft()
+                for other in self.__touching(k, geom):
+                    m = owner.get(other)
+                    if m is None:
+                        # n may have been merged away during this expansion
+                        r = searches.find(n)
+                        owner[other] = r
+                        frontier[r].append(other)
+                        members[r].append(other)
+                    else:
+                        merge(n, m)
+
+        return split
 
     def compute_connected(self, all_geom, progress_cb=lambda x, y: 0):
         """
         Compute connected sets from all_geom
+
+        Uses the spatial index to find candidate pairs, testing each pair at
+        most once. Distances between traces, vias and pads are evaluated in a
+        single batch, the remaining pairs are tested one at a time, skipping
+        those already known to be connected.
+
         :param all_geom:
-        :return:
+        :return: list of sets of connected geometry
         """
+        all_geom = list(all_geom)
+        order = {g: n for n, g in enumerate(all_geom)}
 
-        qh = set(all_geom)
-        labno = 0
-        geom_to_label = dict()
-        label_to_geom = defaultdict(set)
-        seen = set()
+        groups = UnionFind(all_geom)
 
-        size = len(qh)
-        while qh:
-            progress_cb(size - len(qh), size)
-            k = qh.pop()
-            label = None
+        batch_a = []
+        batch_b = []
+        slow = []
 
-            connected = self.intersect_with(k, seen)
-            seen.add(k)
+        size = len(all_geom)
+        for n, k in enumerate(all_geom):
+            progress_cb(n, size)
 
-            for n in connected:
-                eg = geom_to_label[n]
+            for other in self.__index.intersect_layers(k.bbox, layers_for(k)):
+                # Only pair with geometry that has already been visited,
+                # the candidate relation is symmetric so each pair is seen
+                # from both ends
+                m = order.get(other)
+                if m is None or m >= n:
+                    continue
 
-                if label is None:
-                    # If we don't have a label then take the label of what
-                    # we're connected to
-                    label_to_geom[eg].add(k)
-                    geom_to_label[k] = eg
-                    label = eg
+                if k.ISC in CAPSULE_CLASSES and other.ISC in CAPSULE_CLASSES:
+                    batch_a.append(k)
+                    batch_b.append(other)
+                else:
+                    slow.append((k, other))
 
-                elif eg != label:
-                    # If we do have a label, but this group isn't us
-                    # Update all such that it has the same group
-                    update_set = label_to_geom[eg]
-                    del label_to_geom[eg]
-                    label_to_geom[label].update(update_set)
+        for k, other, d in zip(batch_a, batch_b, distance_pairs(batch_a, batch_b)):
+            if d <= 0:
+                groups.union(k, other)
 
-                    for i in update_set:
-                        geom_to_label[i] = label
+        for k, other in slow:
+            if groups.connected(k, other):
+                continue
 
-            # Still no label
-            if label is None:
-                geom_to_label[k] = labno
-                label_to_geom[labno].add(k)
-                labno += 1
+            if distance(k, other) <= 0:
+                groups.union(k, other)
 
-        return list(label_to_geom.values())
+        return groups.groups()
 
     def rebuild_connectivity(self, progress_cb=lambda x, y: 0):
         connectivity = self.compute_connected(
@@ -454,7 +1071,7 @@ class Artwork:
             for g in groups_sorted[:-1]:
                 for i in g:
                     if i.net == net:
-                        i.net = None
+                        self.__set_net(i, None)
 
         # Second, now for all groups, we build a list of all nets on the
         # group. We choose the highest priority net and assign it to the whole
@@ -468,7 +1085,7 @@ class Artwork:
                 n0 = nets.pop()
 
             for i in group:
-                i.net = n0
+                self.__set_net(i, n0)
 
     def merge_artwork(self, geom):
         """
@@ -509,7 +1126,7 @@ class Artwork:
         :return:
         """
 
-        bbox_items = self.__index.intersect(a.bbox)
+        bbox_items = self.__index.intersect_layers(a.bbox, layers_for(a))
 
         pruned_list = b.intersection(bbox_items)
 
@@ -530,11 +1147,11 @@ class Artwork:
         assert bbox_prune
 
         if bbox_prune:
-            ilist = self.__index.intersect(geom.bbox)
-            ilist = [i for i in ilist if i.ISC != IntersectionClass.NONE]
+            ilist = list(self.__index.intersect_layers(geom.bbox, layers_for(geom)))
+            dists = distance_many(geom, ilist)
 
             return sorted(
-                [(distance(geom, other), other) for other in ilist],
+                zip(dists.tolist(), ilist),
                 key=operator.itemgetter(0),
             )
 
@@ -632,106 +1249,270 @@ class Artwork:
 
         return sorted(results, key=operator.itemgetter(0))
 
-    def serialize(self):
+    def serialize(self, sids=False):
+        """
+        :param sids: also store the SID of every object, so that journal
+                     entries can refer to them
+        """
+        return self.snapshot(sids)()
+
+    def snapshot(self, sids=False):
+        """
+        Capture the artwork for serialization. Only the capture runs on the
+        calling thread, which must be the one editing the artwork. It costs
+        a pass over the artwork, but no serialization.
+
+        :param sids: see serialize()
+        :return: function(progress=None) returning the serialized artwork.
+                 It may run on any thread while the artwork is edited.
+                 progress(done, total) is called as it goes, and may raise
+                 to abort.
+        """
+        return self.__capture_items(
+            list(self.vias), list(self.traces), list(self.polygons),
+            list(self.airwires), list(self.components), sids,
+        )
+
+    def __capture_rows(self, items, columns, fields):
+        """
+        :return: function returning, per item, a tuple of the named fields.
+                 Items in a column store are read from a copy of their rows
+                 taken now, so that the store can change meanwhile.
+        """
+        if columns is None:
+            # Geometry of objects that aren't in a column store never
+            # changes once they are in the artwork
+            def rows():
+                for i in items:
+                    yield tuple(getattr(i, f) for f in fields)
+
+            return rows
+
+        slots = [i._slot for i in items]
+        arrays = [getattr(columns, f)[slots] for f in fields]
+
+        def rows():
+            for n in range(len(slots)):
+                yield tuple(a[n] for a in arrays)
+
+        return rows
+
+    def __capture_items(self, vias, traces, polygons, airwires, components,
+                        sids):
+        scontext = self.__project.scontext
+
         _aw = ser.Artwork.new_message()
-        _aw.init("vias", len(self.vias))
-        _aw.init("traces", len(self.traces))
-        _aw.init("polygons", len(self.polygons))
-        _aw.init("components", len(self.components))
-        _aw.init("airwires", len(self.airwires))
-
-        # Serialization done here to reduce instance size
-        for n, i in enumerate(self.vias):
-            v = _aw.vias[n]
-            v.point = serialize_point2(i.pt)
-            v.r = i.r
-            v.viapairSid = self.__project.scontext.sid_for(i.viapair)
-            v.netSid = self.__project.scontext.sid_for(i.net)
-
-        #
-        for n, i in enumerate(self.traces):
-            t = _aw.traces[n]
-            t.p0 = serialize_point2(i.p0)
-            t.p1 = serialize_point2(i.p1)
-            t.thickness = i.thickness
-            t.netSid = self.__project.scontext.sid_for(i.net)
-            t.layerSid = self.__project.scontext.sid_for(i.layer)
-
-        for n, i in enumerate(self.components):
+        _aw.init("vias", len(vias))
+        _aw.init("traces", len(traces))
+        _aw.init("polygons", len(polygons))
+        _aw.init("components", len(components))
+        _aw.init("airwires", len(airwires))
+
+        # Components are few and mutable, so they're written right away
+        for n, i in enumerate(components):
             t = _aw.components[n]
             i.serializeTo(t)
 
-        for n, i in enumerate(self.polygons):
-            p = _aw.polygons[n]
+        # SIDs are assigned here, on the editing thread
+        def sids_of(objs):
+            return [scontext.sid_for(i) for i in objs]
 
-            p_repr = i.get_poly_repr()
-            p.init("exterior", len(p_repr.exterior.coords))
-            for nn, ii in enumerate(p_repr.exterior.coords):
-                p.exterior[nn] = serialize_point2(Point2(ii))
+        def net_sids_of(objs):
+            return [scontext.sid_for(i.net) for i in objs]
 
-            p.init("interiors", len(p_repr.interiors))
-            for n_interior, interior in enumerate(p_repr.interiors):
-                p.interiors.init(n_interior, len(interior.coords))
-                for nn, ii in enumerate(interior.coords):
-                    p.interiors[n_interior][nn] = serialize_point2(Point2(ii))
+        stackup = self.__project.stackup
+        layer_sids = {i: scontext.sid_for(i)
+                      for i in itertools.chain(stackup.layers, stackup.via_pairs)}
 
-            p.layerSid = self.__project.scontext.sid_for(i.layer)
-            p.netSid = self.__project.scontext.sid_for(i.net)
+        def layer_sid(layer):
+            if layer not in layer_sids:
+                layer_sids[layer] = scontext.sid_for(layer)
+            return layer_sids[layer]
 
-        for n, i in enumerate(self.airwires):
-            t = _aw.airwires[n]
-            t.p0 = serialize_point2(i.p0)
-            t.p1 = serialize_point2(i.p1)
-            t.netSid = self.__project.scontext.sid_for(i.net)
-            t.p0LayerSid = self.__project.scontext.sid_for(i.p0_layer)
-            t.p1LayerSid = self.__project.scontext.sid_for(i.p1_layer)
+        groups = (vias, traces, polygons, airwires)
+        net_sids = [net_sids_of(i) for i in groups]
+        obj_sids = [sids_of(i) if sids else None for i in groups]
 
-        return _aw
+        # Layers of objects outside a column store are looked up right away
+        if self.trace_columns is not None:
+            for i in self.trace_columns.layers.objects:
+                layer_sid(i)
+            trace_layers = list(self.trace_columns.layers.objects)
+            trace_layer = trace_layers.__getitem__
+        else:
+            trace_layer = lambda x: x
+            for i in traces:
+                layer_sid(i.layer)
+
+        if self.via_columns is not None:
+            for i in self.via_columns.viapairs.objects:
+                layer_sid(i)
+            via_pairs = list(self.via_columns.viapairs.objects)
+            via_pair = via_pairs.__getitem__
+        else:
+            via_pair = lambda x: x
+            for i in vias:
+                layer_sid(i.viapair)
+
+        for i in polygons:
+            layer_sid(i.layer)
+        for i in airwires:
+            layer_sid(i.p0_layer)
+            layer_sid(i.p1_layer)
+
+        via_rows = self.__capture_rows(
+            vias, self.via_columns, ("pt", "r", "viapair"))
+        trace_rows = self.__capture_rows(
+            traces, self.trace_columns, ("p0", "p1", "thickness", "layer"))
+
+        def finish(progress=None):
+            total = len(vias) + len(traces) + len(polygons) + len(airwires)
+            done = itertools.count(1)
+
+            def step():
+                n = next(done)
+                if progress is not None and (n % 1024 == 0 or n == total):
+                    progress(n, total)
+
+            def point(p):
+                # Rows copied from a column store are arrays
+                if isinstance(p, numpy.ndarray):
+                    p = Point2(*p.tolist())
+                return serialize_point2(p)
+
+            via_net, trace_net, polygon_net, airwire_net = net_sids
+            via_sid, trace_sid, polygon_sid, airwire_sid = obj_sids
+
+            # Serialization done here to reduce instance size
+            for n, (pt, r, viapair) in enumerate(via_rows()):
+                v = _aw.vias[n]
+                v.point = point(pt)
+                v.r = float(r)
+                v.viapairSid = layer_sids[via_pair(viapair)]
+                v.netSid = via_net[n]
+                if sids:
+                    v.sid = via_sid[n]
+                step()
+
+            #
+            for n, (p0, p1, thickness, layer) in enumerate(trace_rows()):
+                t = _aw.traces[n]
+                t.p0 = point(p0)
+                t.p1 = point(p1)
+                t.thickness = float(thickness)
+                t.netSid = trace_net[n]
+                t.layerSid = layer_sids[trace_layer(layer)]
+                if sids:
+                    t.sid = trace_sid[n]
+                step()
+
+            for n, i in enumerate(polygons):
+                p = _aw.polygons[n]
+
+                p_repr = i.get_poly_repr()
+                p.init("exterior", len(p_repr.exterior.coords))
+                for nn, ii in enumerate(p_repr.exterior.coords):
+                    p.exterior[nn] = serialize_point2(Point2(ii))
+
+                p.init("interiors", len(p_repr.interiors))
+                for n_interior, interior in enumerate(p_repr.interiors):
+                    p.interiors.init(n_interior, len(interior.coords))
+                    for nn, ii in enumerate(interior.coords):
+                        p.interiors[n_interior][nn] = serialize_point2(Point2(ii))
+
+                p.clean = True
+
+                # Store the triangulation so it isn't redone on every load
+                vertices, indices = i.get_tris_arrays()
+                p.triVertices = vertices.astype("<f8").tobytes()
+                p.triIndices = indices.astype("<u4").tobytes()
+
+                p.layerSid = layer_sids[i.layer]
+                p.netSid = polygon_net[n]
+                if sids:
+                    p.sid = polygon_sid[n]
+                step()
+
+            for n, i in enumerate(airwires):
+                t = _aw.airwires[n]
+                t.p0 = serialize_point2(i.p0)
+                t.p1 = serialize_point2(i.p1)
+                t.netSid = airwire_net[n]
+                t.p0LayerSid = layer_sids[i.p0_layer]
+                t.p1LayerSid = layer_sids[i.p1_layer]
+                if sids:
+                    t.sid = airwire_sid[n]
+                step()
+
+            return _aw
+
+        return finish
 
     def deserialize(self, msg):
+        self.add_many(self.__deserialize_items(msg))
+
+    def __deserialize_items(self, msg):
+        scontext = self.__project.scontext
+        items = []
+
+        def restore_sid(i, obj):
+            if i.sid:
+                scontext.set_sid(i.sid, obj)
+
         for i in msg.vias:
             v = Via(
                 deserialize_point2(i.point),
-                self.__project.scontext.get(i.viapairSid),
+                scontext.get(i.viapairSid),
                 i.r,
-                self.__project.scontext.get(i.netSid),
+                scontext.get(i.netSid),
             )
+            restore_sid(i, v)
 
-            self.add_artwork(v)
+            items.append(v)
 
         for i in msg.traces:
             t = Trace(
                 deserialize_point2(i.p0),
                 deserialize_point2(i.p1),
                 i.thickness,
-                self.__project.scontext.get(i.layerSid),
-                self.__project.scontext.get(i.netSid),
+                scontext.get(i.layerSid),
+                scontext.get(i.netSid),
             )
+            restore_sid(i, t)
 
-            self.add_artwork(t)
+            items.append(t)
 
         for i in msg.polygons:
             exterior = [deserialize_point2(j) for j in i.exterior]
             interiors = [[deserialize_point2(k) for k in j] for j in i.interiors]
 
             p = Polygon(
-                self.__project.scontext.get(i.layerSid),
+                scontext.get(i.layerSid),
                 exterior,
                 interiors,
-                self.__project.scontext.get(i.netSid),
+                scontext.get(i.netSid),
+                clean=i.clean,
             )
 
-            self.add_artwork(p)
+            if len(i.triIndices):
+                p._set_tris_arrays(
+                    numpy.frombuffer(i.triVertices, dtype="<f8").reshape(-1, 2),
+                    numpy.frombuffer(i.triIndices, dtype="<u4").reshape(-1, 3),
+                )
+            restore_sid(i, p)
+
+            items.append(p)
 
         for i in msg.airwires:
             aw = Airwire(
                 deserialize_point2(i.p0),
                 deserialize_point2(i.p1),
-                self.__project.scontext.get(i.p0LayerSid),
-                self.__project.scontext.get(i.p1LayerSid),
-                self.__project.scontext.get(i.netSid),
+                scontext.get(i.p0LayerSid),
+                scontext.get(i.p1LayerSid),
+                scontext.get(i.netSid),
             )
-            self.add_artwork(aw)
+            restore_sid(i, aw)
+            items.append(aw)
 
         for i in msg.components:
             if i.which() == "dip":
@@ -741,4 +1522,89 @@ class Artwork:
             else:
                 raise NotImplementedError()
 
-            self.add_component(cmp)
+            items.append(cmp)
+
+        return items
+
+    def serialize_delta(self, entry):
+        """
+        Write the changes recorded in the journal since it was last cleared
+        into a journal entry. Everything that existed before then must have
+        been written with its SID, see serialize().
+
+        :param entry: JournalEntry message to fill in
+        """
+        journal = self.__journal
+        scontext = self.__project.scontext
+
+        added = list(journal.added)
+        entry.added = self.__capture_items(
+            [i for i in added if isinstance(i, Via)],
+            [i for i in added if isinstance(i, Trace)],
+            [i for i in added if isinstance(i, Polygon)],
+            [i for i in added if isinstance(i, Airwire)],
+            [i for i in added if isinstance(i, Component)],
+            True,
+        )()
+
+        entry.init("removed", len(journal.removed))
+        for n, i in enumerate(journal.removed):
+            entry.removed[n] = scontext.sid_for(i)
+
+        changes = list(journal.net_changes())
+        entry.init("netChanges", len(changes))
+        for n, geom in enumerate(changes):
+            c = entry.netChanges[n]
+            if isinstance(geom, Pad):
+                c.sid = scontext.sid_for(geom.parent)
+                c.padNo = geom.pad_no
+            else:
+                c.sid = scontext.sid_for(geom)
+            c.netSid = scontext.sid_for(geom.net)
+
+    def apply_delta(self, entry):
+        """
+        Replay a journal entry written by serialize_delta(). Nets are left to
+        the caller. Must be called while the project SContext is restoring.
+
+        Changes are applied as recorded, nets are not recomputed.
+        """
+        scontext = self.__project.scontext
+
+        for sid in entry.removed:
+            obj = scontext.get(sid)
+            self.__discard(obj)
+            scontext.forget(obj)
+
+        self.add_many(self.__deserialize_items(entry.added))
+
+        for i in entry.netChanges:
+            geom = scontext.get(i.sid)
+            if i.padNo:
+                geom, = [p for p in geom.get_pads() if p.pad_no == i.padNo]
+
+            self.__set_net(geom, scontext.get(i.netSid))
+
+    def __discard(self, aw):
+        """
+        Take aw out of the artwork without any of the net splitting or
+        airwire cleanup that remove() does
+        """
+        if isinstance(aw, Component):
+            for pad in aw.get_pads():
+                self.__index.remove(pad)
+                self.__unregister_net(pad)
+
+            self.__index.remove(aw)
+            self.__components.remove(aw)
+            self.components_generation += 1
+        else:
+            self.__index.remove(aw)
+            self.__unregister_net(aw)
+
+            store, generation = self.__type_store(aw)
+            store.remove(aw)
+            self.__removed(aw)
+            self.__bump_generation(generation)
+
+        aw._project = None
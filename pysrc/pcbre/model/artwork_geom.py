@@ -1,4 +1,9 @@
+from collections import OrderedDict, namedtuple
+
+import numpy
+
 from pcbre.matrix import Rect, Point2
+from pcbre.model.columns import net_id
 from pcbre.model.const import IntersectionClass, TFF
 
 # Shapely library is used for polygon operations
@@ -23,17 +28,94 @@ else:
 __author__ = "davidc"
 
 
+Triangle = namedtuple("Triangle", ["a", "b", "c"])
+
+
+class PolyReprCache:
+    """
+    Optional bounded LRU cache of the shapely representations of traces and
+    vias, keyed by geometry so that identical features share one polygon.
+
+    Shapely representations are built lazily on first use. When maxsize is
+    None (the default) each object keeps its representation once built.
+    Otherwise representations are only held by this cache, so at most
+    maxsize of them are alive at once.
+    """
+
+    def __init__(self, maxsize=None):
+        self.__entries = OrderedDict()
+        self.__maxsize = maxsize
+
+    @property
+    def maxsize(self):
+        return self.__maxsize
+
+    @maxsize.setter
+    def maxsize(self, value):
+        self.__maxsize = value
+        if value is None:
+            self.__entries.clear()
+        else:
+            self.__evict()
+
+    @property
+    def bounded(self):
+        return self.__maxsize is not None
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __evict(self):
+        while len(self.__entries) > self.__maxsize:
+            self.__entries.popitem(last=False)
+
+    def get(self, key, build):
+        """
+        :param key: hashable description of the geometry
+        :param build: callable returning the shapely representation
+        :return: shapely representation
+        """
+        if self.__maxsize is None:
+            return build()
+
+        try:
+            value = self.__entries[key]
+            self.__entries.move_to_end(key)
+        except KeyError:
+            value = self.__entries[key] = build()
+            self.__evict()
+
+        return value
+
+
+poly_repr_cache = PolyReprCache()
+
+
 class Geom:
-    pass
+    __slots__ = ()
 
 
 class Polygon(Geom):
     ISC = IntersectionClass.POLYGON
     TYPE_FLAGS = TFF.HAS_NET | TFF.HAS_GEOM
 
-    def __init__(self, layer, exterior, interiors=[], net=None):
+    def __init__(self, layer, exterior, interiors=[], net=None, clean=False):
+        """
+        :param layer:
+        :param exterior: outline points
+        :param interiors: list of hole outlines
+        :param net:
+        :param clean: exterior and interiors are already a cleaned outline
+                      (as produced by get_poly_repr), so cleanup can be
+                      skipped if the outline is valid
+        """
+        geometry = ShapelyPolygon(exterior, interiors)
+
         # Buffer 0 forces geom cleanup
-        self.__geometry = ShapelyPolygon(exterior, interiors).buffer(0)
+        if not clean or not geometry.is_valid:
+            geometry = geometry.buffer(0)
+
+        self.__geometry = geometry
 
         minx, miny, maxx, maxy = self.__geometry.bounds
 
@@ -48,41 +130,220 @@ class Polygon(Geom):
     def get_poly_repr(self):
         return self.__geometry
 
-    def get_tris_repr(self):
+    def get_tris_arrays(self):
+        """
+        :return: (vertices, indices), see triangulate()
+        """
         if self.__triangulation is None:
-            cdt = p2t.CDT([Point2(*i) for i in self.__geometry.exterior.coords[:-1]])
-            for interior in self.__geometry.interiors:
-                cdt.add_hole([Point2(*i) for i in interior.coords[:-1]])
-
-            self.__triangulation = cdt.triangulate()
+            self.__triangulation = triangulate(
+                self.__geometry.exterior.coords[:-1],
+                [i.coords[:-1] for i in self.__geometry.interiors],
+            )
 
         return self.__triangulation
 
+    def get_tris_repr(self):
+        """
+        :return: list of triangles, each with a, b, c Point2 corners
+        """
+        vertices, indices = self.get_tris_arrays()
+        points = [Point2(x, y) for x, y in vertices.tolist()]
+        return [Triangle(*(points[i] for i in t)) for t in indices.tolist()]
+
+    def has_tris(self):
+        return self.__triangulation is not None
+
+    def _set_tris_arrays(self, vertices, indices):
+        """
+        Provide a triangulation computed elsewhere (loaded from the project
+        file, or from a worker) so get_tris_arrays doesn't have to run it.
+        """
+        self.__triangulation = vertices, indices
+
+
+def triangulate(exterior, interiors):
+    """
+    Constrained Delaunay triangulation of a polygon with holes
+
+    :param exterior: sequence of (x, y) outline points, not closed
+    :param interiors: sequence of hole outlines, in the same form
+    :return: (vertices, indices). vertices is an (N, 2) float64 array of
+             unique points, indices is an (M, 3) uint32 array of triangle
+             corners indexing into vertices
+    """
+    cdt = p2t.CDT([Point2(*i) for i in exterior])
+    for interior in interiors:
+        cdt.add_hole([Point2(*i) for i in interior])
+
+    lookup = {}
+    points = []
+    corners = []
+    for t in cdt.triangulate():
+        for p in t.a, t.b, t.c:
+            key = (p.x, p.y)
+            try:
+                corners.append(lookup[key])
+            except KeyError:
+                corners.append(lookup.setdefault(key, len(points)))
+                points.append(key)
+
+    vertices = numpy.array(points, dtype=numpy.float64).reshape(-1, 2)
+    indices = numpy.array(corners, dtype=numpy.uint32).reshape(-1, 3)
+    return vertices, indices
+
 
 class Trace(Geom):
+    """
+    Straight trace segment with round ends.
+
+    When added to an artwork that uses a column store, the geometry is moved
+    into the store (see _attach) and the Trace only remains as a handle to its
+    row. Geometry is immutable while attached. Endpoints are rebuilt from the
+    row when first read, and kept.
+    """
+
     ISC = IntersectionClass.TRACE
     TYPE_FLAGS = TFF.HAS_GEOM | TFF.HAS_NET
 
+    __slots__ = (
+        "__p0",
+        "__p1",
+        "__thickness",
+        "__layer",
+        "__net",
+        "__bbox",
+        "__poly_repr",
+        "_project",
+        "_columns",
+        "_slot",
+        "__weakref__",
+    )
+
     def __init__(self, p0, p1, thickness, layer, net=None):
-        self.p0 = p0
-        self.p1 = p1
+        self._columns = None
+        self._slot = -1
 
-        self.thickness = thickness
+        self.__p0 = p0
+        self.__p1 = p1
 
-        self.net = net
-        self.layer = layer
+        self.__thickness = thickness
+
+        self.__net = net
+        self.__layer = layer
 
         self._project = None
 
-        self.bbox = Rect.fromPoints(self.p0, self.p1)
-        self.bbox.feather(self.thickness, self.thickness)
+        self.__bbox = self.__build_bbox()
+
+        # Built on first use, see get_poly_repr
+        self.__poly_repr = None
+
+    def __build_bbox(self):
+        bbox = Rect.fromPoints(self.p0, self.p1)
+        bbox.feather(self.thickness, self.thickness)
+        return bbox
+
+    def __build_poly_repr(self):
+        return ShapelyLineString([self.p0, self.p1]).buffer(self.thickness / 2)
+
+    def __poly_key(self):
+        p0 = self.p0
+        p1 = self.p1
+        return (Trace, p0.x, p0.y, p1.x, p1.y, self.thickness)
+
+    @property
+    def p0(self):
+        # Attached handles build their points on first read, and keep them
+        p0 = self.__p0
+        if p0 is None:
+            p0 = self.__p0 = Point2(*self._columns.p0[self._slot].tolist())
+        return p0
+
+    @property
+    def p1(self):
+        p1 = self.__p1
+        if p1 is None:
+            p1 = self.__p1 = Point2(*self._columns.p1[self._slot].tolist())
+        return p1
+
+    @property
+    def thickness(self):
+        if self._columns is None:
+            return self.__thickness
+        return float(self._columns.thickness[self._slot])
+
+    @property
+    def layer(self):
+        if self._columns is None:
+            return self.__layer
+        return self._columns.layers.objects[self._columns.layer[self._slot]]
+
+    @property
+    def net(self):
+        return self.__net
+
+    @net.setter
+    def net(self, value):
+        self.__net = value
+        if self._columns is not None:
+            self._columns.net[self._slot] = net_id(value)
+
+    @property
+    def bbox(self):
+        # Kept while attached too, geometry can't change then and the bbox is
+        # read by every index query
+        if self.__bbox is None:
+            self.__bbox = self.__build_bbox()
+        return self.__bbox
+
+    def get_poly_repr(self):
+        poly_repr = self.__poly_repr
+        if poly_repr is None:
+            poly_repr = poly_repr_cache.get(self.__poly_key(), self.__build_poly_repr)
+
+            # Attached objects don't hold anything beyond their row
+            if self._columns is None and not poly_repr_cache.bounded:
+                self.__poly_repr = poly_repr
+
+        return poly_repr
+
+    def _attach(self, columns):
+        """
+        Move geometry into a column store
+
+        :type columns: pcbre.model.columns.TraceColumns
+        """
+        assert self._columns is None
 
-        self.__poly_repr = ShapelyLineString([self.p0, self.p1]).buffer(
-            self.thickness / 2
+        slot = columns.alloc(self)
+        columns.store(
+            slot, self.__p0, self.__p1, self.__thickness, self.__layer, self.__net
         )
 
-    def get_poly_repr(self):
-        return self.__poly_repr
+        self._columns = columns
+        self._slot = slot
+
+        self.__p0 = self.__p1 = self.__thickness = self.__layer = None
+        self.__poly_repr = None
+
+    def _detach(self):
+        """
+        Move geometry back out of the column store
+        """
+        assert self._columns is not None
+
+        p0, p1, thickness, layer = self.p0, self.p1, self.thickness, self.layer
+
+        self._columns.free(self._slot)
+        self._columns = None
+        self._slot = -1
+
+        self.__p0 = p0
+        self.__p1 = p1
+        self.__thickness = thickness
+        self.__layer = layer
+
+        self.__bbox = self.__build_bbox()
 
     def __repr__(self):
         netname = self.net.name if self.net is not None else "none"
@@ -112,23 +373,135 @@ class Airwire(Geom):
 
 
 class Via(Geom):
+    """
+    Via between the layers of a viapair. Like Trace, geometry is moved into
+    a column store while attached to one.
+    """
+
     ISC = IntersectionClass.VIA
     TYPE_FLAGS = TFF.HAS_GEOM | TFF.HAS_NET
 
+    __slots__ = (
+        "__pt",
+        "__r",
+        "__viapair",
+        "__net",
+        "__bbox",
+        "__poly_repr",
+        "_project",
+        "_columns",
+        "_slot",
+        "__weakref__",
+    )
+
     def __init__(self, pt, viapair, r, net=None):
-        self.pt = pt
-        self.r = r
-        self.viapair = viapair
-        self.net = net
+        self._columns = None
+        self._slot = -1
 
-        self.bbox = Rect.fromCenterSize(pt, r * 2, r * 2)
+        self.__pt = pt
+        self.__r = r
+        self.__viapair = viapair
+        self.__net = net
 
         self._project = None
 
-        self.__poly_repr = ShapelyPoint(pt).buffer(self.r)
+        self.__bbox = self.__build_bbox()
+
+        # Built on first use, see get_poly_repr
+        self.__poly_repr = None
+
+    def __build_bbox(self):
+        return Rect.fromCenterSize(self.pt, self.r * 2, self.r * 2)
+
+    def __build_poly_repr(self):
+        return ShapelyPoint(self.pt).buffer(self.r)
+
+    def __poly_key(self):
+        pt = self.pt
+        return (Via, pt.x, pt.y, self.r)
+
+    @property
+    def pt(self):
+        # Attached handles build the point on first read, and keep it
+        pt = self.__pt
+        if pt is None:
+            pt = self.__pt = Point2(*self._columns.pt[self._slot].tolist())
+        return pt
+
+    @property
+    def r(self):
+        if self._columns is None:
+            return self.__r
+        return float(self._columns.r[self._slot])
+
+    @property
+    def viapair(self):
+        if self._columns is None:
+            return self.__viapair
+        return self._columns.viapairs.objects[self._columns.viapair[self._slot]]
+
+    @property
+    def net(self):
+        return self.__net
+
+    @net.setter
+    def net(self, value):
+        self.__net = value
+        if self._columns is not None:
+            self._columns.net[self._slot] = net_id(value)
+
+    @property
+    def bbox(self):
+        # Kept while attached too, geometry can't change then and the bbox is
+        # read by every index query
+        if self.__bbox is None:
+            self.__bbox = self.__build_bbox()
+        return self.__bbox
 
     def get_poly_repr(self):
-        return self.__poly_repr
+        poly_repr = self.__poly_repr
+        if poly_repr is None:
+            poly_repr = poly_repr_cache.get(self.__poly_key(), self.__build_poly_repr)
+
+            if self._columns is None and not poly_repr_cache.bounded:
+                self.__poly_repr = poly_repr
+
+        return poly_repr
+
+    def _attach(self, columns):
+        """
+        Move geometry into a column store
+
+        :type columns: pcbre.model.columns.ViaColumns
+        """
+        assert self._columns is None
+
+        slot = columns.alloc(self)
+        columns.store(slot, self.__pt, self.__r, self.__viapair, self.__net)
+
+        self._columns = columns
+        self._slot = slot
+
+        self.__pt = self.__r = self.__viapair = None
+        self.__poly_repr = None
+
+    def _detach(self):
+        """
+        Move geometry back out of the column store
+        """
+        assert self._columns is not None
+
+        pt, r, viapair = self.pt, self.r, self.viapair
+
+        self._columns.free(self._slot)
+        self._columns = None
+        self._slot = -1
+
+        self.__pt = pt
+        self.__r = r
+        self.__viapair = viapair
+
+        self.__bbox = self.__build_bbox()
 
     def __repr__(self):
         return "<Via %s r:%f ly=(%s:%s) net=%s>" % (
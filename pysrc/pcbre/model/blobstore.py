@@ -0,0 +1,112 @@
+import hashlib
+import os
+import tempfile
+
+
+# Scans are split into chunks of this size, so that an edited image only
+# adds the chunks that differ
+CHUNK_SIZE = 4 * 1024 * 1024
+
+
+class BlobStore:
+    """
+    Content-addressed store of immutable chunks in a directory.
+
+    Each chunk is a file named by the hex SHA-256 of its contents, so writing
+    a chunk that is already present is a no-op and any number of projects
+    may share one store. Chunks are never removed by the store, since it
+    can't know which projects still refer to them.
+    """
+
+    def __init__(self, location, root=None):
+        """
+        :param location: directory of the store. Stored as given in the
+                         project file, so a relative location moves with it.
+        :param root: directory a relative location is resolved against,
+                     defaults to the working directory
+        """
+        self.location = location
+        self.root = root
+
+    @staticmethod
+    def sidecar(project_path):
+        """
+        :return: store in a directory next to the project file
+        """
+        return BlobStore(
+            os.path.basename(project_path) + ".blobs",
+            root=os.path.dirname(os.path.abspath(project_path)),
+        )
+
+    @property
+    def path(self):
+        if self.root is None:
+            return self.location
+        return os.path.join(self.root, self.location)
+
+    def rebase(self, root):
+        """
+        Resolve a relative location against root from now on, keeping the
+        same directory. Used when a project is saved somewhere else.
+        """
+        if not os.path.isabs(self.location):
+            self.location = os.path.relpath(self.path, root)
+        self.root = root
+
+    @staticmethod
+    def hash(chunk):
+        return hashlib.sha256(chunk).hexdigest()
+
+    def __chunk_path(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+    def __contains__(self, key):
+        return os.path.exists(self.__chunk_path(key))
+
+    def has_all(self, keys):
+        return all(k in self for k in keys)
+
+    def put_chunk(self, chunk):
+        """
+        :return: key of chunk
+        """
+        key = self.hash(chunk)
+        path = self.__chunk_path(key)
+        if os.path.exists(path):
+            return key
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+
+        # Write to a temporary name first so that a chunk under its final
+        # name is always complete
+        fd, tmpname = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(chunk)
+            os.replace(tmpname, path)
+        except:
+            os.unlink(tmpname)
+            raise
+
+        return key
+
+    def get_chunk(self, key):
+        with open(self.__chunk_path(key), "rb") as f:
+            return f.read()
+
+    def put(self, data):
+        """
+        Store data, writing only chunks the store doesn't already have
+
+        :return: list of chunk keys
+        """
+        view = memoryview(data)
+        return [self.put_chunk(view[i:i + CHUNK_SIZE])
+                for i in range(0, len(view), CHUNK_SIZE)]
+
+    def get(self, keys):
+        """
+        :return: data stored as the chunks keys
+        """
+        return b"".join(self.get_chunk(k) for k in keys)
@@ -0,0 +1,156 @@
+import numpy
+
+
+class ColumnStore:
+    """
+    Growable struct-of-arrays table. Each field is a contiguous numpy array
+    indexed by slot. Freed slots are reused before the table grows.
+
+    Arrays are only meaningful up to self.size, and only for slots where
+    self.live is set. Consumers (renderers, queries) may read the arrays
+    directly, but must not write to them.
+    """
+
+    # Tuple of (name, dtype, per-row shape)
+    FIELDS = ()
+
+    def __init__(self, capacity=64):
+        self.__free = []
+        self.__count = 0
+        self.size = 0
+
+        # Bumped on every alloc and free, so array readers can cache
+        self.generation = 0
+
+        self.live = numpy.zeros(capacity, dtype=numpy.bool_)
+        self.handles = [None] * capacity
+
+        for name, dtype, shape in self.FIELDS:
+            setattr(self, name, numpy.zeros((capacity,) + shape, dtype=dtype))
+
+    def __len__(self):
+        return self.__count
+
+    @property
+    def capacity(self):
+        return len(self.live)
+
+    def __grow(self):
+        new_capacity = self.capacity * 2
+
+        def grown(a):
+            out = numpy.zeros((new_capacity,) + a.shape[1:], dtype=a.dtype)
+            out[: len(a)] = a
+            return out
+
+        self.live = grown(self.live)
+        self.handles.extend([None] * (new_capacity - len(self.handles)))
+
+        for name, _, _ in self.FIELDS:
+            setattr(self, name, grown(getattr(self, name)))
+
+    def alloc(self, handle):
+        """
+        :param handle: object that owns the slot
+        :return: slot number
+        """
+        if self.__free:
+            slot = self.__free.pop()
+        else:
+            if self.size == self.capacity:
+                self.__grow()
+            slot = self.size
+            self.size += 1
+
+        self.live[slot] = True
+        self.handles[slot] = handle
+        self.__count += 1
+        self.generation += 1
+        return slot
+
+    def free(self, slot):
+        assert self.live[slot]
+
+        self.live[slot] = False
+        self.handles[slot] = None
+        self.__free.append(slot)
+        self.__count -= 1
+        self.generation += 1
+
+    def live_slots(self):
+        """
+        :return: array of slot numbers that are in use
+        """
+        return numpy.flatnonzero(self.live[: self.size])
+
+
+class _InternTable:
+    """
+    Maps objects that many rows share (layers, viapairs) to small integers
+    """
+
+    def __init__(self):
+        self.__ids = {}
+        self.objects = []
+
+    def id_for(self, obj):
+        try:
+            return self.__ids[obj]
+        except KeyError:
+            n = self.__ids[obj] = len(self.objects)
+            self.objects.append(obj)
+            return n
+
+
+def net_id(net):
+    return net._id if net is not None else -1
+
+
+class TraceColumns(ColumnStore):
+    """
+    Column store for traces. layer is an index into self.layers.objects, net
+    is the Net._id at the time the net was assigned, or -1.
+    """
+
+    FIELDS = (
+        ("p0", numpy.float64, (2,)),
+        ("p1", numpy.float64, (2,)),
+        ("thickness", numpy.float64, ()),
+        ("layer", numpy.int32, ()),
+        ("net", numpy.int64, ()),
+    )
+
+    def __init__(self, capacity=64):
+        super(TraceColumns, self).__init__(capacity)
+        self.layers = _InternTable()
+
+    def store(self, slot, p0, p1, thickness, layer, net):
+        self.p0[slot] = p0.x, p0.y
+        self.p1[slot] = p1.x, p1.y
+        self.thickness[slot] = thickness
+        self.layer[slot] = self.layers.id_for(layer)
+        self.net[slot] = net_id(net)
+
+
+class ViaColumns(ColumnStore):
+    """
+    Column store for vias. viapair is an index into self.viapairs.objects,
+    net is the Net._id at the time the net was assigned, or -1.
+    """
+
+    FIELDS = (
+        ("pt", numpy.float64, (2,)),
+        ("r", numpy.float64, ()),
+        ("viapair", numpy.int32, ()),
+        ("net", numpy.int64, ()),
+    )
+
+    def __init__(self, capacity=64):
+        super(ViaColumns, self).__init__(capacity)
+        self.viapairs = _InternTable()
+
+    def store(self, slot, pt, r, viapair, net):
+        self.pt[slot] = pt.x, pt.y
+        self.r[slot] = r
+        self.viapair[slot] = self.viapairs.id_for(viapair)
+        self.net[slot] = net_id(net)
@@ -119,7 +119,7 @@ class DIPComponent(Component):
 
     @property
     def theta_bbox(self):
-        return Rect.fromCenterSize(self.center, self.body_width(), self.body_length())
+        return Rect.fromCenterSize(Point2(0, 0), self.body_width(), self.body_length())
 
     def serializeTo(self, dip_msg):
         super(DIPComponent, self).serializeTo(dip_msg.common)
@@ -0,0 +1,110 @@
+from collections import OrderedDict
+
+
+# Default memory budget of a project's decoded image cache, in bytes
+DEFAULT_BUDGET = 1024 * 1024 * 1024
+
+
+class ImageCache:
+    """
+    Least recently used cache of large values, such as decoded images or
+    textures, bounded by their total size rather than their number.
+
+    Values are loaded on demand and may be evicted at any time once they are
+    no longer the most recently used, so holders must be able to load them
+    again.
+    """
+
+    def __init__(self, budget=DEFAULT_BUDGET, on_evict=None):
+        """
+        :param budget: total size of the cached values, in bytes
+        :param on_evict: called with each value evicted or discarded, to
+                         release resources held by it
+        """
+        self.__budget = budget
+        self.__on_evict = on_evict
+        self.__entries = OrderedDict()
+        self.__size = 0
+
+    @property
+    def budget(self):
+        return self.__budget
+
+    @budget.setter
+    def budget(self, value):
+        self.__budget = value
+        self.__shrink()
+
+    @property
+    def size(self):
+        """
+        :return: total size of the cached values, in bytes
+        """
+        return self.__size
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __contains__(self, key):
+        return key in self.__entries
+
+    def get(self, key, load=None, size=None):
+        """
+        :param key: hashable key of the value
+        :param load: called to load the value if it isn't cached
+        :param size: called with a loaded value to get its size in bytes,
+                     defaults to its nbytes
+        :return: the cached or newly loaded value, or None if it isn't cached
+                 and there's nothing to load it with
+        """
+        entry = self.__entries.get(key)
+        if entry is not None:
+            self.__entries.move_to_end(key)
+            return entry[0]
+
+        if load is None:
+            return None
+
+        value = load()
+        nbytes = value.nbytes if size is None else size(value)
+        self.__entries[key] = (value, nbytes)
+        self.__size += nbytes
+        self.__shrink()
+
+        return value
+
+    def peek(self, key):
+        """
+        :return: the cached value of key without marking it used, or None
+        """
+        entry = self.__entries.get(key)
+        return entry[0] if entry is not None else None
+
+    def discard(self, key):
+        entry = self.__entries.pop(key, None)
+        if entry is not None:
+            self.__release(entry)
+
+    def discard_where(self, predicate):
+        """
+        Discard all values whose key matches predicate
+        """
+        for key in [k for k in self.__entries if predicate(k)]:
+            self.discard(key)
+
+    def clear(self):
+        while self.__entries:
+            _, entry = self.__entries.popitem(last=False)
+            self.__release(entry)
+
+    def __release(self, entry):
+        self.__size -= entry[1]
+        if self.__on_evict is not None:
+            self.__on_evict(entry[0])
+
+    def __shrink(self):
+        # The most recently used value is kept even if it alone is over
+        # budget, since it's about to be used
+        while self.__size > self.__budget and len(self.__entries) > 1:
+            _, entry = self.__entries.popitem(last=False)
+            self.__release(entry)
@@ -0,0 +1,157 @@
+import concurrent.futures
+import hashlib
+import multiprocessing
+import os
+
+import cv2
+import numpy
+
+from pcbre.model.imagelayer import ImageLayer
+from pcbre.model.imagepyramid import ImagePyramid, default_cache_dir
+
+# Largest width or height of an image that can be imported
+MAX_DIMENSION = 1 << 16
+
+
+class ImageImportError(Exception):
+    def __init__(self, filename, reason):
+        # Passed on so that the error survives pickling out of a worker
+        super(ImageImportError, self).__init__(filename, reason)
+        self.filename = filename
+        self.reason = reason
+
+    def __str__(self):
+        return "%s: %s" % (os.path.basename(self.filename), self.reason)
+
+
+def check_dimensions(filename, shape):
+    """
+    :raises ImageImportError: if an image of shape can't be used as a layer
+    """
+    height, width = shape[:2]
+    if max(width, height) > MAX_DIMENSION:
+        raise ImageImportError(
+            filename,
+            "%d x %d pixels, larger than %d pixels on a side"
+            % (width, height, MAX_DIMENSION),
+        )
+
+
+def _import_file(filename, cache_dir):
+    """
+    Read, decode and check an image file, and build its pyramid. Runs in a
+    worker process.
+
+    :return: (raw image file, shape, content key)
+    """
+    with open(filename, "rb") as f:
+        data = f.read()
+
+    try:
+        im = cv2.imdecode(numpy.frombuffer(data, dtype=numpy.uint8),
+                          cv2.IMREAD_COLOR)
+    except cv2.error as e:
+        raise ImageImportError(filename, str(e).strip())
+
+    if im is None:
+        raise ImageImportError(filename, "not a readable image")
+
+    check_dimensions(filename, im.shape)
+
+    # The same key as ImageLayer.content_key, so that the layer finds the
+    # pyramid when it's first drawn
+    key = hashlib.sha256(data).hexdigest()
+    path = os.path.join(cache_dir, key)
+    if ImagePyramid.open(path) is None:
+        ImagePyramid.build(path, im)
+
+    return data, im.shape, key
+
+
+class ImageImport:
+    """
+    Imports image files as image layers on a pool of worker processes.
+
+    Each file is decoded in a worker, checked, and its pyramid built there,
+    so that every level down to a small preview is ready to draw as soon as
+    the layer is added. The layers are only created by finish(), and aren't
+    added to the project.
+    """
+
+    def __init__(self, filenames, max_workers=None, executor=None,
+                 cache_dir=None):
+        """
+        :param filenames: image files to import
+        :param max_workers: number of worker processes, defaults to CPU count
+        :param executor: optional concurrent.futures executor to use instead
+                         of creating a process pool
+        :param cache_dir: directory pyramids are cached in, defaults to
+                          default_cache_dir()
+        """
+        self.filenames = list(filenames)
+
+        self.__own_executor = executor is None
+        if executor is None:
+            # Spawn rather than fork, the GUI process has GL and Qt state
+            # that mustn't be duplicated into workers
+            executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        self.__executor = executor
+
+        if cache_dir is None:
+            cache_dir = default_cache_dir()
+
+        self.__futures = [executor.submit(_import_file, f, cache_dir)
+                          for f in self.filenames]
+
+    @property
+    def progress(self):
+        """
+        :return: (files done, total files)
+        """
+        return sum(f.done() for f in self.__futures), len(self.__futures)
+
+    @property
+    def done(self):
+        return all(f.done() for f in self.__futures)
+
+    def cancel(self):
+        """
+        Skip the files that haven't been started yet
+        """
+        for f in self.__futures:
+            f.cancel()
+
+    def finish(self):
+        """
+        Wait for the import to end
+
+        :return: (list of ImageLayer, list of ImageImportError), the layers
+                 in the order their files were given. Cancelled files are in
+                 neither.
+        """
+        layers = []
+        errors = []
+
+        for filename, future in zip(self.filenames, self.__futures):
+            try:
+                data, shape, key = future.result()
+            except concurrent.futures.CancelledError:
+                continue
+            except ImageImportError as e:
+                errors.append(e)
+                continue
+            except (IOError, OSError) as e:
+                errors.append(ImageImportError(filename, str(e)))
+                continue
+
+            il = ImageLayer(os.path.basename(filename), data)
+            il._set_decode_info(shape, key)
+            layers.append(il)
+
+        if self.__own_executor:
+            self.__executor.shutdown(wait=False)
+
+        return layers, errors
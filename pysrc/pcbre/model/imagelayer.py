@@ -1,8 +1,10 @@
+import hashlib
 import os.path
 import numpy
 import cv2
 import pcbre.model.serialization as ser
 from pcbre.matrix import projectPoint, Point2
+from pcbre.model.imagecache import ImageCache
 from pcbre.model.serialization import (
     deserialize_matrix,
     serialize_matrix,
@@ -14,6 +16,10 @@ from pcbre.model.serialization import (
 from pcbre.model.util import ImmutableListProxy
 
 
+# Decoded images of layers that aren't part of a project
+_detached_decodes = ImageCache()
+
+
 class KeyPoint:
     def __init__(self, worldpos):
         self._project = None
@@ -219,13 +225,26 @@ class RectAlignment:
         )
 
 
+def _decode_image(data):
+    """
+    :return: the image file data decoded to a BGR array
+    """
+    return cv2.imdecode(numpy.frombuffer(data, dtype=numpy.uint8), 1)
+
+
 class ImageLayer:
     def __init__(self, name, data, transform_matrix=numpy.identity(3)):
         self.name = name
         self._project = None
         self.transform_matrix = transform_matrix
         self.__cached_decode = None
+        self.__shape = None
+        self.__cached_p2norm = None
+        self.__cached_norm2p = None
         self.__data = data
+        self.__data_source = None
+        self.__chunks = None
+        self.__content_key = None
         self.__alignment = None
 
     @staticmethod
@@ -267,30 +286,147 @@ class ImageLayer:
         """
         :return: raw (compressed) image file
         """
+        if self.__data is None and self.__data_source is not None:
+            self.__data = self.__data_source()
+            self.__data_source = None
+
         return self.__data
 
+    def _set_data_source(self, source, chunks=None):
+        """
+        Defer loading the image file until it is first needed
+
+        :param source: callable returning the raw image file
+        :param chunks: blob store keys the image file is stored as, if any
+        """
+        self.__data = None
+        self.__data_source = source
+        self.__chunks = chunks
+
+    @property
+    def blob_chunks(self):
+        """
+        :return: keys of the chunks the image file was last stored as in a
+                 blob store, or None if it hasn't been
+        """
+        return self.__chunks
+
+    def _set_decode_info(self, shape, content_key):
+        """
+        Provide the shape and content key of the image when they are already
+        known, e.g. from an import, so that neither needs the image decoded
+        or hashed again
+        """
+        self.__shape = tuple(shape)
+        self.__content_key = content_key
+
+    @property
+    def content_key(self):
+        """
+        :return: hex key identifying the image contents, for caches of data
+                 derived from the image
+        """
+        if self.__content_key is None:
+            if self.__chunks is not None:
+                # The chunk keys already hash the data, don't read it
+                h = hashlib.sha256("\n".join(self.__chunks).encode("ascii"))
+            else:
+                h = hashlib.sha256(self.data)
+            self.__content_key = h.hexdigest()
+
+        return self.__content_key
+
+    def decode(self):
+        """
+        :return: the decoded image, without keeping it around if it isn't
+                 already
+        """
+        if self.__cached_decode is not None:
+            return self.__cached_decode
+
+        im = _decode_image(self.data)
+        self.__shape = im.shape
+        return im
+
+    def _image_source(self):
+        """
+        Resolve everything needed to decode the image on the calling thread,
+        so that the decode can run on a worker thread without touching the
+        layer or the file the project was opened from, which may be released
+        meanwhile.
+
+        :return: (content key, callable returning the decoded image)
+        """
+        key = self.content_key
+
+        if self.__cached_decode is not None:
+            im = self.__cached_decode
+            return key, lambda: im
+
+        if self.__data is None and self.__chunks is not None \
+                and self.__data_source is not None:
+            # Blob store reads don't depend on the project file
+            source = self.__data_source
+            return key, lambda: _decode_image(source())
+
+        data = self.data
+        return key, lambda: _decode_image(data)
+
+    def __decode_cached(self):
+        im = self.decode()
+        im.flags.writeable = False
+        return im
+
     @property
     def decoded_image(self):
-        if self.__cached_decode is None:
-            im_data = numpy.frombuffer(self.data, dtype=numpy.uint8)
-            im = cv2.imdecode(im_data, 1)
-            im.flags.writeable = False
-            self.__cached_decode = im
-            print(im)
+        """
+        :return: the decoded image. Decodes are kept in the image cache of the
+                 project, and are decoded again once evicted from it.
+        """
+        if self.__cached_decode is not None:
+            return self.__cached_decode
 
-        return self.__cached_decode
+        if self._project is not None:
+            cache = self._project.image_cache
+        else:
+            cache = _detached_decodes
+
+        return cache.get(self, self.__decode_cached)
+
+    def release_decode(self):
+        """
+        Drop the decoded image from the image cache, e.g. when the layer is
+        no longer shown
+        """
+        if self._project is not None:
+            self._project.image_cache.discard(self)
+        _detached_decodes.discard(self)
+
+    @property
+    def shape(self):
+        """
+        :return: shape of the decoded image, decoding it only the first time
+        """
+        if self.__cached_decode is not None:
+            return self.__cached_decode.shape
+
+        if self.__shape is None:
+            self.__shape = self.decoded_image.shape
+
+        return self.__shape
 
     def __calculate_transform_matrix(self):
-        if hasattr(self, "__cached_p2norm"):
+        if self.__cached_p2norm is not None:
             return
 
         # Calculate a default transform matrix
-        max_dim = float(max(self.__cached_decode.shape))
+        shape = self.shape
+        max_dim = float(max(shape))
         sf = 2. / max_dim
         tmat = numpy.array(
             [
-                [sf, 0, -self.__cached_decode.shape[1] / max_dim],
-                [0, sf, -self.__cached_decode.shape[0] / max_dim],
+                [sf, 0, -shape[1] / max_dim],
+                [0, sf, -shape[0] / max_dim],
                 [0, 0, 1],
             ],
             dtype=numpy.float32,
@@ -324,8 +460,18 @@ class ImageLayer:
 
     def serialize(self):
         msg = ser.Image.new_message()
+        self.serializeTo(msg)()
+        return msg
+
+    def serializeTo(self, msg):
+        """
+        Write the image layer to msg, except for the image file itself
+
+        :return: function writing the image file to msg. The image file never
+                 changes, so this may run on another thread.
+        """
         msg.sid = self._project.scontext.sid_for(self)
-        msg.data = self.data
+
         msg.name = self.name
         m = serialize_matrix(self.transform_matrix)
         msg.transform.matrix = m
@@ -342,12 +488,41 @@ class ImageLayer:
         else:
             raise NotImplementedError("Don't know how to serialize %s" % self.alignment)
 
-        return msg
+        store = self._project.blob_store
+
+        def write_data():
+            if store is not None:
+                # Only hash and write the image if the store is missing any
+                # of it
+                if self.__chunks is None or not store.has_all(self.__chunks):
+                    self.__chunks = store.put(self.data or b"")
+
+            if store is None or not self.__chunks:
+                msg.data = self.data or b""
+            else:
+                msg.init("dataChunks", len(self.__chunks))
+                for n, key in enumerate(self.__chunks):
+                    msg.dataChunks[n] = key
+
+        return write_data
 
     @staticmethod
     def deserialize(project, msg):
         transform = deserialize_matrix(msg.transform.matrix)
-        obj = ImageLayer(msg.name, msg.data, transform)
+        obj = ImageLayer(msg.name, None, transform)
+
+        # Copying the image out of the message or blob store is deferred
+        # until it is used
+        if len(msg.dataChunks):
+            store = project.blob_store
+            if store is None:
+                raise IOError("Image %s is stored in a blob store, but the "
+                              "project has none" % msg.name)
+
+            chunks = list(msg.dataChunks)
+            obj._set_data_source(lambda: store.get(chunks), chunks)
+        else:
+            obj._set_data_source(lambda: project._read_source(lambda: msg.data))
 
         project.scontext.set_sid(msg.sid, obj)
         obj._project = project
@@ -374,4 +549,7 @@ class ImageLayer:
         return "<ImageLayer: %s>" % self.name
 
     def set_decoded_data(self, ar):
+        # Explicitly set images can't be decoded again, so they aren't cached
         self.__cached_decode = ar
+        self.__cached_p2norm = None
+        self.release_decode()
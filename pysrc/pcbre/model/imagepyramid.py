@@ -0,0 +1,303 @@
+import json
+import math
+import os
+import shutil
+import tempfile
+import threading
+
+import cv2
+
+
+# Edge length of a pyramid tile, in pixels. Small enough that a tile is a
+# cheap texture upload, large enough that a screen needs only a few dozen
+TILE_SIZE = 512
+
+# Tiles are stored as PNG, favouring build speed over size
+_PNG_PARAMS = [cv2.IMWRITE_PNG_COMPRESSION, 1]
+
+# Disk space the cached pyramids may take before the least recently used are
+# removed
+CACHE_MAX_BYTES = 4 * 1024 ** 3
+
+# Pyramids opened or built by this process, which are never pruned from
+# under it
+_in_use = set()
+_cache_lock = threading.Lock()
+
+
+def default_cache_dir():
+    """
+    :return: directory pyramids are cached in unless told otherwise
+    """
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "pcbre", "pyramids")
+
+
+def _dir_size(path):
+    total = 0
+    for d, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(d, name))
+            except OSError:
+                pass
+    return total
+
+
+def prune_cache(cache_dir, max_bytes=None):
+    """
+    Remove the least recently used pyramids in cache_dir, going by the mtime
+    of their directories, until the rest fit in max_bytes. Pyramids used by
+    this process are kept.
+
+    :param max_bytes: defaults to CACHE_MAX_BYTES
+    :return: list of the removed pyramid directories
+    """
+    if max_bytes is None:
+        max_bytes = CACHE_MAX_BYTES
+
+    with _cache_lock:
+        try:
+            names = os.listdir(cache_dir)
+        except OSError:
+            return []
+
+        entries = []
+        for name in names:
+            path = os.path.join(cache_dir, name)
+            if not os.path.isdir(path):
+                continue
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                continue
+            entries.append((mtime, path, _dir_size(path)))
+
+        total = sum(size for _, _, size in entries)
+
+        removed = []
+        for _, path, size in sorted(entries):
+            if total <= max_bytes:
+                break
+            if path in _in_use:
+                continue
+
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            removed.append(path)
+
+        return removed
+
+
+def _write_atomic(path, data):
+    fd, tmpname = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmpname, path)
+    except:
+        os.unlink(tmpname)
+        raise
+
+
+class ImagePyramid:
+    """
+    An image stored as square tiles at power-of-two levels of detail.
+
+    Level 0 is the full resolution image, each following level is half the
+    size of the one before, down to a level that fits in a single tile. Only
+    the tiles that are visible at the current zoom need to be read, so images
+    far beyond the GPU texture size limit can be shown.
+
+    Pyramids are built once per image and cached on disk under the content
+    key of the image, so they are shared by every project using the image.
+    The cache is pruned to CACHE_MAX_BYTES whenever a pyramid is added to it.
+    """
+
+    def __init__(self, path, width, height, tile_size, levels):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.levels = levels
+
+    @staticmethod
+    def open_or_build(il, cache_dir=None):
+        """
+        :param il: ImageLayer to open the pyramid of
+        :param cache_dir: directory pyramids are cached in, defaults to
+                          default_cache_dir()
+        :return: ImagePyramid of the layer's image, built if not yet cached
+        """
+        return ImagePyramid.open_or_build_source(
+            il.content_key, il.decode, cache_dir
+        )
+
+    @staticmethod
+    def open_or_build_source(content_key, decode, cache_dir=None):
+        """
+        :param content_key: content key of the image, see
+                            ImageLayer.content_key
+        :param decode: called to get the decoded image if the pyramid needs
+                       to be built
+        :param cache_dir: directory pyramids are cached in, defaults to
+                          default_cache_dir()
+        :return: ImagePyramid of the image, built if not yet cached
+        """
+        if cache_dir is None:
+            cache_dir = default_cache_dir()
+
+        path = os.path.join(cache_dir, content_key)
+        with _cache_lock:
+            _in_use.add(path)
+
+        pyramid = ImagePyramid.open(path)
+        if pyramid is None:
+            pyramid = ImagePyramid.build(path, decode())
+
+            # Only ever grows here
+            prune_cache(cache_dir)
+        else:
+            # Marks the pyramid as recently used, for pruning
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+
+        return pyramid
+
+    @staticmethod
+    def open(path):
+        """
+        :return: the pyramid at path, or None if there is no complete one
+        """
+        try:
+            with open(os.path.join(path, "meta.json")) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        return ImagePyramid(path, meta["width"], meta["height"], meta["tile"],
+                            meta["levels"])
+
+    @staticmethod
+    def build(path, im, tile_size=None):
+        """
+        Build a pyramid from a decoded image
+
+        :param path: directory to build the pyramid in
+        :param im: decoded image, as returned by cv2.imdecode
+        :param tile_size: defaults to TILE_SIZE
+        :return: ImagePyramid
+        """
+        if tile_size is None:
+            tile_size = TILE_SIZE
+
+        height, width = im.shape[:2]
+        level = 0
+        while True:
+            level_dir = os.path.join(path, str(level))
+            os.makedirs(level_dir, exist_ok=True)
+
+            h, w = im.shape[:2]
+            for ty in range(0, h, tile_size):
+                for tx in range(0, w, tile_size):
+                    ok, buf = cv2.imencode(
+                        ".png", im[ty:ty + tile_size, tx:tx + tile_size],
+                        _PNG_PARAMS)
+                    assert ok
+                    _write_atomic(os.path.join(
+                        level_dir, "%d_%d.png" % (ty // tile_size,
+                                                  tx // tile_size)),
+                        buf.tobytes())
+
+            if max(w, h) <= tile_size:
+                break
+
+            im = cv2.resize(im, ((w + 1) // 2, (h + 1) // 2),
+                            interpolation=cv2.INTER_AREA)
+            level += 1
+
+        # The metadata is written last, a pyramid without it is incomplete
+        # and is rebuilt
+        meta = {"width": width, "height": height, "tile": tile_size,
+                "levels": level + 1}
+        _write_atomic(os.path.join(path, "meta.json"),
+                      json.dumps(meta).encode("ascii"))
+
+        return ImagePyramid(path, width, height, tile_size, level + 1)
+
+    def level_size(self, level):
+        """
+        :return: (width, height) of the image at level
+        """
+        w, h = self.width, self.height
+        for _ in range(level):
+            w, h = (w + 1) // 2, (h + 1) // 2
+        return w, h
+
+    def tile_count(self, level):
+        """
+        :return: (columns, rows) of tiles at level
+        """
+        w, h = self.level_size(level)
+        return (-(-w // self.tile_size), -(-h // self.tile_size))
+
+    def tile(self, level, tx, ty):
+        """
+        :return: decoded tile at column tx, row ty of level. Tiles on the right
+                 and bottom edges may be smaller than the tile size.
+        """
+        path = os.path.join(self.path, str(level), "%d_%d.png" % (ty, tx))
+        im = cv2.imread(path, cv2.IMREAD_COLOR)
+        if im is None:
+            raise IOError("Missing pyramid tile %s" % path)
+        return im
+
+    def tile_rect(self, level, tx, ty):
+        """
+        :return: (x0, y0, x1, y1) area of the full resolution image covered by
+                 a tile, in pixels
+        """
+        w, h = self.level_size(level)
+        sx = self.width / float(w)
+        sy = self.height / float(h)
+
+        ts = self.tile_size
+        return (tx * ts * sx, ty * ts * sy,
+                min((tx + 1) * ts, w) * sx, min((ty + 1) * ts, h) * sy)
+
+    def level_for_scale(self, pixels_per_screen_pixel):
+        """
+        :param pixels_per_screen_pixel: full resolution image pixels covered
+                                        by one screen pixel
+        :return: coarsest level that still has at least one pixel per screen
+                 pixel
+        """
+        if pixels_per_screen_pixel <= 1:
+            return 0
+
+        level = int(math.floor(math.log2(pixels_per_screen_pixel)))
+        return min(level, self.levels - 1)
+
+    def visible_tiles(self, level, rect):
+        """
+        :param rect: (x0, y0, x1, y1) area of the full resolution image, in
+                     pixels
+        :return: list of (tx, ty) of the tiles at level that intersect rect
+        """
+        w, h = self.level_size(level)
+        sx = w / float(self.width)
+        sy = h / float(self.height)
+        cols, rows = self.tile_count(level)
+        ts = self.tile_size
+
+        x0, y0, x1, y1 = rect
+        tx0 = max(0, int(math.floor(x0 * sx / ts)))
+        ty0 = max(0, int(math.floor(y0 * sy / ts)))
+        tx1 = min(cols - 1, int(math.floor(x1 * sx / ts)))
+        ty1 = min(rows - 1, int(math.floor(y1 * sy / ts)))
+
+        return [(tx, ty) for ty in range(ty0, ty1 + 1)
+                for tx in range(tx0, tx1 + 1)]
@@ -0,0 +1,108 @@
+import os
+import struct
+import zlib
+
+
+# A journaled save compacts into a full snapshot once the journal holds this
+# many entries, or grows past this fraction of the snapshot size
+COMPACT_ENTRIES = 256
+COMPACT_RATIO = 0.5
+
+# Each record is framed by its length and CRC-32, so that a record torn by a
+# crash mid-append can be told apart from a complete one
+_RECORD_HEADER = struct.Struct("<QI")
+
+
+def journal_path(path):
+    """
+    :return: path of the journal kept next to the project file at path
+    """
+    return path + ".journal"
+
+
+def append_record(path, data):
+    """
+    Append one record to a journal file, and wait until it is on disk
+    """
+    with open(path, "ab") as f:
+        f.write(_RECORD_HEADER.pack(len(data), zlib.crc32(data)))
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_records(path):
+    """
+    Read all complete records from a journal file. Reading stops at the first
+    record that is truncated or doesn't match its checksum.
+
+    :return: (list of record bytes, length of the file covered by them)
+    """
+    records = []
+    good_length = 0
+
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(_RECORD_HEADER.size)
+            if len(header) < _RECORD_HEADER.size:
+                break
+
+            length, crc = _RECORD_HEADER.unpack(header)
+            data = f.read(length)
+            if len(data) < length or zlib.crc32(data) != crc:
+                break
+
+            records.append(data)
+            good_length += _RECORD_HEADER.size + length
+
+    return records, good_length
+
+
+class Journal:
+    """
+    Artwork changes made since a project was last written, so that a
+    journaled save only has to append them rather than rewrite the whole
+    project. Filled in by Artwork as it is modified.
+    """
+
+    def __init__(self):
+        # Dicts are used as insertion ordered sets
+        self.added = {}
+        self.removed = {}
+        self.renetted = {}
+
+    def record_add(self, obj):
+        self.added[obj] = None
+
+    def record_remove(self, obj):
+        # Something added and removed again since the last write was never
+        # journaled, so there's nothing to remove
+        if obj in self.added:
+            del self.added[obj]
+        else:
+            self.removed[obj] = None
+
+    def record_net(self, geom):
+        self.renetted[geom] = None
+
+    def net_changes(self):
+        """
+        :return: geometry whose change of net must be journaled. New geometry
+                 is journaled with its net, so it is skipped, as is anything
+                 no longer in the artwork.
+        """
+        for geom in self.renetted:
+            owner = getattr(geom, "parent", geom)
+            if (owner in self.added or owner in self.removed
+                    or owner._project is None):
+                continue
+
+            yield geom
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.renetted)
+
+    def clear(self):
+        self.added.clear()
+        self.removed.clear()
+        self.renetted.clear()
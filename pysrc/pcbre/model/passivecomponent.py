@@ -1,5 +1,5 @@
 from enum import Enum
-from pcbre.matrix import Vec2, Rect
+from pcbre.matrix import Point2, Vec2, Rect
 from pcbre.model.const import OnSide
 from pcbre.model.pad import Pad
 
@@ -87,7 +87,7 @@ class PassiveComponent(Component):
     def theta_bbox(self):
         l = max(self.pin_d + self.pin_corner_vec.x, self.body_corner_vec.x)
         w = max(self.pin_corner_vec.y, self.body_corner_vec.y)
-        return Rect.fromCenterSize(self.center, l * 2, w * 2)
+        return Rect.fromCenterSize(Point2(0, 0), l * 2, w * 2)
 
     def serializeTo(self, msg):
         pass
@@ -1,4 +1,8 @@
+import io
+import mmap
 import os
+import random
+import threading
 
 import pcbre.model.serialization as ser
 
@@ -6,8 +10,18 @@ from pcbre.qt_compat import QtCore
 from pcbre.model.const import SIDE
 from pcbre.model.net import Net
 from pcbre.model.artwork import Artwork
+from pcbre.model.blobstore import BlobStore
 from pcbre.model.change import ModelChange, ChangeType
+from pcbre.model.imagecache import ImageCache
 from pcbre.model.imagelayer import ImageLayer, KeyPoint
+from pcbre.model.journal import (
+    COMPACT_ENTRIES,
+    COMPACT_RATIO,
+    Journal,
+    append_record,
+    journal_path,
+    read_records,
+)
 from pcbre.model.serialization import SContext
 from pcbre.model.stackup import Layer, ViaPair
 from pcbre.model.util import ImmutableListProxy
@@ -16,6 +30,127 @@ from pcbre.model.util import ImmutableListProxy
 MAGIC = b"PCBRE\x00"
 VERSION_MAGIC = b"\x01\x00"
 
+# Image data alone can exceed capnp's default read limit of 64MiB
+_TRAVERSAL_LIMIT = 2 ** 62
+
+
+class SaveCancelled(Exception):
+    pass
+
+
+def _replace_file(path, write):
+    """
+    Write a file with write(f) under a temporary name, then move it over
+    path. The file it replaces is kept as path.bak.
+    """
+    tmpname = path + ".saving"
+    try:
+        with open(tmpname, "w+b", buffering=0) as f:
+            write(f)
+            os.fsync(f.fileno())
+    except:
+        if os.path.exists(tmpname):
+            os.unlink(tmpname)
+        raise
+
+    try:
+        if os.path.exists(path):
+            os.replace(path, path + ".bak")
+        os.replace(tmpname, path)
+    except (IOError, OSError):
+        raise IOError("Couldn't manipulate backup file")
+
+
+class SaveTask:
+    """
+    Serializes and writes a snapshot of a project, see Project.save_async.
+
+    run() does the work, and may be on a worker thread. The project itself
+    is only updated by finish(), which has to be called on the thread that
+    edits the project.
+    """
+
+    def __init__(self, snapshot, path, done):
+        """
+        :param snapshot: function(progress) returning the project message
+        :param path: file to write
+        :param done: called by finish() with whether the file was saved
+        """
+        self.__snapshot = snapshot
+        self.__path = path
+        self.__done = done
+
+        self.__cancelled = threading.Event()
+        self.__finished = threading.Event()
+        self.__thread = None
+        self.__applied = False
+        self.__error = None
+
+        # (done, total), written by the worker
+        self.progress = (0, 0)
+
+    def __progress(self, done, total):
+        self.progress = (done, total)
+        if self.__cancelled.is_set():
+            raise SaveCancelled()
+
+    def __write(self, f):
+        f.write(MAGIC + VERSION_MAGIC)
+
+        message = self.__snapshot(self.__progress)
+        message.write(f)
+
+        # Last chance to cancel before the existing file is replaced
+        self.__progress(*self.progress)
+
+    def run(self):
+        try:
+            _replace_file(self.__path, self.__write)
+        except BaseException as e:
+            self.__error = e
+        finally:
+            self.__finished.set()
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.run, daemon=True)
+        self.__thread.start()
+
+    def cancel(self):
+        """
+        Abandon the save if the file hasn't been replaced yet
+        """
+        self.__cancelled.set()
+
+    @property
+    def done(self):
+        return self.__finished.is_set()
+
+    def wait(self):
+        """
+        Wait for the save to end, and update the project
+        """
+        self.__finished.wait()
+
+        if not self.__applied:
+            self.__applied = True
+            self.__done(self.__error is None)
+
+    def finish(self):
+        """
+        Wait for the save to end, and update the project
+
+        :return: True if saved, False if cancelled
+        :raises: any error raised while saving
+        """
+        self.wait()
+
+        if isinstance(self.__error, SaveCancelled):
+            return False
+        elif self.__error is not None:
+            raise self.__error
+
+        return True
+
 
 class ProjectConfig(dict):
     def serialize(self):
@@ -189,18 +324,32 @@ class Imagery:
         return self.keypoints.index(kp)
 
     def serialize(self):
+        return self.snapshot()()
+
+    def snapshot(self):
+        """
+        Serialize everything but the image files
+
+        :return: function returning the serialized imagery, which may run on
+                 another thread
+        """
         imagery = ser.Imagery.new_message()
 
         imagery.init("imagelayers", len(self.imagelayers))
-        for n, i in enumerate(self.imagelayers):
-            imagery.imagelayers[n] = i.serialize()
+        write_data = [i.serializeTo(imagery.imagelayers[n])
+                      for n, i in enumerate(self.imagelayers)]
 
         imagery.init("keypoints", len(self.keypoints))
 
         for n, i in enumerate(self.keypoints):
             imagery.keypoints[n] = i.serialize()
 
-        return imagery
+        def finish():
+            for i in write_data:
+                i()
+            return imagery
+
+        return finish
 
     def deserialize(self, msg):
         # Keypoints may be used by the imagelayers during deserialize
@@ -254,10 +403,16 @@ class Nets(QtCore.QObject):
         self.changed.emit(ModelChange(self, net, ChangeType.REMOVE))
         self.__nets.remove(net)
 
-    def serialize(self):
+    def serialize(self, nets=None):
+        """
+        :param nets: nets to write, defaults to all of them
+        """
+        if nets is None:
+            nets = self.nets
+
         _nets = ser.Nets.new_message()
-        _nets.init("netList", len(self.nets))
-        for n, i in enumerate(self.nets):
+        _nets.init("netList", len(nets))
+        for n, i in enumerate(nets):
             _nets.netList[n].sid = self.__project.scontext.sid_for(i)
             _nets.netList[n].name = i.name
             _nets.netList[n].nclass = i.net_class
@@ -270,58 +425,320 @@ class Nets(QtCore.QObject):
             self.__project.scontext.set_sid(i.sid, n)
             self.add_net(n)
 
+    def state(self):
+        """
+        :return: dict of net to the (name, class) that serialize() would
+                 write, for finding nets changed since
+        """
+        return {n: (n.name, n.net_class) for n in self.__nets}
+
+    def apply_delta(self, msg):
+        """
+        Add or rename the nets of a journal entry
+        """
+        scontext = self.__project.scontext
+        for i in msg.netList:
+            n = scontext.sid_to_obj.get(i.sid)
+            if n is None:
+                n = Net(name=i.name, net_class=i.nclass)
+                scontext.set_sid(i.sid, n)
+                self.add_net(n)
+            else:
+                n.name = i.name
+                n.net_class = i.nclass
+
 
 class Project:
-    def __init__(self):
+    def __init__(self, columnar_artwork=False):
+        """
+        :param columnar_artwork: store trace and via geometry in column
+                                 stores, see Artwork. Saves most of the
+                                 memory of boards with many traces, at the
+                                 cost of slower first access to geometry.
+        """
         self.scontext = SContext()
 
         self.filepath = None
 
+        # BlobStore that image data is saved to, rather than embedded in the
+        # project file. See BlobStore.sidecar.
+        self.blob_store = None
+
+        # Decoded images of the image layers, bounded by the cache's budget.
+        # See ImageLayer.decoded_image.
+        self.image_cache = ImageCache()
+
         self.imagery = Imagery(self)
 
         self.stackup = Stackup(self)
-        self.artwork = Artwork(self)
+        self.__artwork = Artwork(self, columnar=columnar_artwork)
 
         self.nets = Nets(self)
 
+        # Serialized artwork not yet turned into objects, see artwork
+        self.__artwork_msg = None
+
+        # (mmap, reader context) that a lazily opened project reads from
+        self.__source = None
+        self.__source_closed = False
+
+        # Changes since the snapshot at filepath, once the project keeps a
+        # journal. See save_journaled().
+        self.__journal = None
+        self.__journal_base = 0
+        self.__journal_entries = 0
+        self.__journal_nets = None
+        self.__journal_structure = None
+
+        self.__save_task = None
+
+    @property
+    def artwork(self):
+        """
+        Artwork of a project that was opened from a file is only deserialized
+        when first used
+        """
+        if self.__artwork_msg is not None:
+            msg = self.__artwork_msg
+
+            with self.scontext.restoring():
+                self._read_source(lambda: self.__artwork.deserialize(msg))
+
+            self.__artwork_msg = None
+
+        return self.__artwork
+
+    def _read_source(self, read):
+        """
+        Run read(), which reads from the message the project was opened from.
+        Reading from the message once the file has been released would access
+        unmapped memory, so this raises instead.
+        """
+        if self.__source_closed:
+            raise IOError("Project source file has already been closed")
+
+        return read()
+
+    def _materialize(self):
+        """
+        Load everything that is still only referenced from the file the
+        project was opened from, and release the file.
+        """
+        # Artwork holds SIDs that must be known before any new SID is
+        # handed out, so it has to be in place before serializing
+        self.artwork
+
+        for i in self.imagery.imagelayers:
+            # Data kept in a blob store doesn't depend on the project file
+            if i.blob_chunks is None:
+                i.data
+
+        self.__release_source()
+
+    def __release_source(self):
+        if self.__source is None:
+            return
+
+        mapping, reader = self.__source
+        self.__source = None
+        self.__source_closed = True
+
+        reader.__exit__(None, None, None)
+        try:
+            mapping.close()
+        except BufferError:
+            # Something still holds a view into the map, it will be closed
+            # once collected
+            pass
+
     @property
     def can_save(self):
         return self.filepath is not None
 
     @staticmethod
-    def create():
-        pass
-        return Project()
+    def create(**kwargs):
+        """
+        :param kwargs: see Project.__init__
+        """
+        return Project(**kwargs)
+
+    def _serialize(self, journal_base=0):
+        """
+        :param journal_base: identifies the snapshot to its journal entries,
+                             0 if it won't have a journal
+        """
+        return self._snapshot(journal_base)()
+
+    def _snapshot(self, journal_base=0):
+        """
+        Capture the project for serialization, see Artwork.snapshot
+
+        :param journal_base: see _serialize
+        :return: function(progress=None) returning the serialized project
+        """
+        self._materialize()
 
-    def _serialize(self):
         project = ser.Project.new_message()
         project.stackup = self.stackup.serialize()
-        project.imagery = self.imagery.serialize()
+        imagery = self.imagery.snapshot()
         project.nets = self.nets.serialize()
-        project.artwork = self.artwork.serialize()
+        artwork = self.artwork.snapshot(sids=bool(journal_base))
+        project.journalBase = journal_base
+
+        if self.blob_store is not None:
+            project.blobStore = self.blob_store.location
 
-        return project
+        def finish(progress=None):
+            project.imagery = imagery()
+            project.artwork = artwork(progress)
+            return project
+
+        return finish
 
     @staticmethod
-    def _deserialize(msg):
-        p = Project()
+    def _deserialize(msg, lazy=False, **kwargs):
+        """
+        :param msg: serialized project
+        :param lazy: defer building artwork objects until first use. msg
+                     must then remain readable until the project is
+                     materialized.
+        """
+        p = Project(**kwargs)
+        if msg.blobStore:
+            p.blob_store = BlobStore(msg.blobStore)
+
         with p.scontext.restoring():
             p.stackup.deserialize(msg.stackup)
             p.imagery.deserialize(msg.imagery)
             p.nets.deserialize(msg.nets)
-            p.artwork.deserialize(msg.artwork)
+
+            if not lazy:
+                p.artwork.deserialize(msg.artwork)
+
+        if lazy:
+            p.__artwork_msg = msg.artwork
+
+        p.__journal_base = msg.journalBase
+
         return p
 
     @staticmethod
-    def open(path):
-        f = open(path, "rb", buffering=0)
-        self = Project.open_fd(f)
+    def open(path, **kwargs):
+        """
+        :param kwargs: passed on to Project.__init__, for instance
+                       columnar_artwork=True to open a large board in column
+                       stores
+        """
+        with open(path, "rb", buffering=0) as f:
+            self = Project.open_fd(f, **kwargs)
+
         self.filepath = path
 
+        # A relative blob store is found next to the project file. Image data
+        # is only read from it later, so it can still be resolved here.
+        if self.blob_store is not None:
+            self.blob_store.root = os.path.dirname(os.path.abspath(path))
+
+        if self.__journal_base:
+            self.__replay_journal(journal_path(path))
+
         return self
 
+    def __replay_journal(self, jpath):
+        """
+        Apply the journal entries written since the snapshot the project was
+        opened from, and continue the journal from there
+        """
+        records, good_length = [], 0
+        if os.path.exists(jpath):
+            records, good_length = read_records(jpath)
+
+        entries = 0
+        if records:
+            # Must be in place before restoring the entries
+            artwork = self.artwork
+
+            for data in records:
+                with ser.JournalEntry.from_bytes(
+                    data, traversal_limit_in_words=_TRAVERSAL_LIMIT
+                ) as entry:
+                    # Left over from before a compaction that was interrupted
+                    if entry.base != self.__journal_base:
+                        continue
+
+                    with self.scontext.restoring():
+                        self.nets.apply_delta(entry.nets)
+                        artwork.apply_delta(entry)
+
+                        for sid in entry.removedNets:
+                            net = self.scontext.get(sid)
+                            self.nets.remove_net(net)
+                            self.scontext.forget(net)
+
+                    entries += 1
+
+            if not entries:
+                good_length = 0
+
+        # Cut off anything after the last good entry, such as an entry torn
+        # by a crash, so that later entries are appended after it
+        if os.path.exists(jpath) and os.path.getsize(jpath) != good_length:
+            os.truncate(jpath, good_length)
+
+        self.__start_journal(self.__journal_base)
+        self.__journal_entries = entries
+
+    def __start_journal(self, base):
+        self.__journal = Journal()
+        self.__artwork.set_journal(self.__journal)
+        self.__journal_base = base
+        self.__journal_entries = 0
+        self.__journal_nets = self.nets.state()
+        self.__journal_structure = self.__structure()
+
+    def __structure(self):
+        """
+        :return: value that changes when the stackup or imagery change. These
+                 aren't journaled, so a change forces a full snapshot.
+        """
+        return (
+            tuple((i, i.name, tuple(i.color)) for i in self.stackup.layers),
+            tuple(self.stackup.via_pairs),
+            tuple(
+                (i, i.name, i.transform_matrix.tobytes(), i.alignment)
+                for i in self.imagery.imagelayers
+            ),
+            tuple(
+                (i, i.world_position.x, i.world_position.y)
+                for i in self.imagery.keypoints
+            ),
+        )
+
+    def __needs_compaction(self, jpath):
+        if self.__journal is None:
+            return True
+
+        if self.__journal_structure != self.__structure():
+            return True
+
+        if self.__journal_entries >= COMPACT_ENTRIES:
+            return True
+
+        try:
+            return (os.path.getsize(jpath) >
+                    COMPACT_RATIO * os.path.getsize(self.filepath))
+        except OSError:
+            return not os.path.exists(self.filepath)
+
     @staticmethod
-    def open_fd(fd):
+    def open_fd(fd, **kwargs):
+        """
+        Open a project from a file object. If the file can be memory mapped,
+        the message is read in place from the map rather than copied into
+        memory, and image data and artwork are loaded on first use.
+
+        :param kwargs: see Project.open
+        """
         magic = fd.read(8)
         if magic[:6] != MAGIC:
             raise ValueError("Unknown File Type")
@@ -330,46 +747,166 @@ class Project:
         if vers != VERSION_MAGIC:
             raise ValueError("Unknown File Version")
 
-        _project = ser.Project.read(fd)
-        self = Project._deserialize(_project)
+        try:
+            mapping = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+            mapping = None
+
+        if mapping is None:
+            _project = ser.Project.read(fd, traversal_limit_in_words=_TRAVERSAL_LIMIT)
+            return Project._deserialize(_project, **kwargs)
+
+        reader = ser.Project.from_bytes(
+            memoryview(mapping)[len(magic):],
+            traversal_limit_in_words=_TRAVERSAL_LIMIT,
+        )
+        _project = reader.__enter__()
+
+        self = Project._deserialize(_project, lazy=True, **kwargs)
+        self.__source = mapping, reader
         return self
 
-    def save_fd(self, fd):
+    def save_fd(self, fd, journal_base=0):
         fd.write(MAGIC + VERSION_MAGIC)
 
-        message = self._serialize()
+        message = self._serialize(journal_base)
         message.write(fd)
 
     def save(self, path=None, update_path=False):
+        task = self.__begin_save(path, update_path)
+        task.run()
+        task.finish()
+
+    def save_async(self, path=None, update_path=False):
+        """
+        Save on a worker thread. The project is captured before this
+        returns; editing may continue while it is serialized and written,
+        and isn't part of this save.
+
+        The file is only replaced once it has been written completely, so a
+        save that is cancelled or fails leaves the existing file as it was.
+
+        :return: SaveTask. Its finish() has to be called on the editing
+                 thread once it is done.
+        """
+        task = self.__begin_save(path, update_path)
+        task.start()
+        return task
+
+    @property
+    def save_task(self):
+        """
+        :return: SaveTask of a save that hasn't been finished, or None
+        """
+        return self.__save_task
+
+    def __begin_save(self, path, update_path):
         if path is None:
             path = self.filepath
 
         if path is None:
             raise ValueError("Must have either a filename, or a save-as path")
 
-        bakname = path + ".bak"
-        try:
-            if os.path.exists(bakname):
-                os.unlink(bakname)
-
-            if os.path.exists(path):
-                os.rename(path, bakname)
-        except (IOError, OSError):
-            raise IOError("Couldn't manipulate backup file")
-
-        with open(path, "w+b", buffering=0) as f:
-            try:
-                self.save_fd(f)
-            except:
-                os.unlink(path)
-                os.rename(bakname, path)
-                raise
-
-            if update_path:
+        # One save at a time
+        if self.__save_task is not None:
+            self.__save_task.wait()
+
+        if self.blob_store is not None:
+            self.blob_store.rebase(os.path.dirname(os.path.abspath(path)))
+
+        # A full save of a journaled project starts a new, empty journal
+        compact = self.__journal is not None and (
+            update_path or path == self.filepath
+        )
+        journal_base = (random.getrandbits(64) or 1) if compact else 0
+
+        snapshot = self._snapshot(journal_base)
+
+        if compact:
+            # Changes made from here on belong in the new journal
+            old_journal = self.__journal
+            self.__start_journal(journal_base)
+
+        def done(saved):
+            self.__save_task = None
+
+            if saved and update_path:
                 self.filepath = path
 
+            if not compact:
+                return
+
+            if saved:
+                # Entries of the old journal no longer match the snapshot,
+                # so a crash before this is harmless
+                jpath = journal_path(path)
+                if os.path.exists(jpath):
+                    os.unlink(jpath)
+            elif old_journal is not None:
+                # The changes since the last journal entry are in neither
+                # file, so the next journaled save has to be a full one
+                self.__journal = None
+                self.__artwork.set_journal(None)
+
+        self.__save_task = SaveTask(snapshot, path, done)
+        return self.__save_task
+
+    def save_journaled(self):
+        """
+        Save by appending the changes made since the last save to a journal
+        next to the project file, rather than rewriting the whole project.
+        Opening the project replays the journal.
+
+        The first journaled save writes a full snapshot instead, as does any
+        save after the stackup or imagery changed or once the journal has
+        grown large enough that it should be compacted.
+        """
+        if self.filepath is None:
+            raise ValueError("Must have a filename to save a journal to")
+
+        # A full save still being written may remove the journal
+        if self.__save_task is not None:
+            self.__save_task.wait()
+
+        jpath = journal_path(self.filepath)
+
+        if self.__needs_compaction(jpath):
+            if self.__journal is None:
+                self.__start_journal(0)
+
+            self.save()
+            return
+
+        # Geometry SIDs have to be known before new SIDs are handed out
+        artwork = self.artwork
+
+        nets = self.nets.state()
+        changed_nets = [n for n, v in nets.items()
+                        if self.__journal_nets.get(n) != v]
+        removed_nets = [n for n in self.__journal_nets if n not in nets]
+
+        if not (self.__journal or changed_nets or removed_nets):
+            return
+
+        entry = ser.JournalEntry.new_message()
+        entry.base = self.__journal_base
+        entry.nets = self.nets.serialize(changed_nets)
+
+        entry.init("removedNets", len(removed_nets))
+        for n, net in enumerate(removed_nets):
+            entry.removedNets[n] = self.scontext.sid_for(net)
+
+        artwork.serialize_delta(entry)
+
+        append_record(jpath, entry.to_bytes())
+
+        self.__journal.clear()
+        self.__journal_nets = nets
+        self.__journal_entries += 1
+
     def close(self):
-        pass
+        self.__release_source()
+        self.image_cache.clear()
 
 
 def openProject():
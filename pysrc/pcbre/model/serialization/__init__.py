@@ -20,6 +20,7 @@ from .schema_capnp import (
     Point2f,
     Keypoint,
     ImageTransform,
+    JournalEntry,
 )
 
 
@@ -74,7 +75,7 @@ def serialize_matrix(mat):
 
 def __deserialize_matrix_n(msg, nterms):
     ar = numpy.array(
-        [getattr(msg, "t%d" % i) for i in range(nterms)], dtype=numpy.float
+        [getattr(msg, "t%d" % i) for i in range(nterms)], dtype=float
     )
     return ar
 
@@ -179,3 +180,12 @@ class SContext:
 
     def get(self, sid):
         return self.sid_to_obj[sid]
+
+    def forget(self, m):
+        """
+        Drop the SID of an object that no longer exists, so the SID may be
+        restored onto another object
+        """
+        sid = self.obj_to_sid.pop(self.key(m), None)
+        if sid is not None:
+            del self.sid_to_obj[sid]
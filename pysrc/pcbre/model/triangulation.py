@@ -0,0 +1,135 @@
+import concurrent.futures
+import multiprocessing
+import threading
+from collections import deque
+
+from pcbre.model.artwork_geom import triangulate
+
+
+def _outline(polygon):
+    poly_repr = polygon.get_poly_repr()
+    exterior = [tuple(i) for i in poly_repr.exterior.coords[:-1]]
+    interiors = [[tuple(i) for i in r.coords[:-1]] for r in poly_repr.interiors]
+    return exterior, interiors
+
+
+class TriangulationPool:
+    """
+    Triangulates polygons on a pool of worker processes.
+
+    Work is submitted as polygons are added to the artwork. Results are only
+    applied to polygons when collect() is called, so that polygons are never
+    modified from another thread. Polygons whose triangulation fails in a
+    worker are left untriangulated, so get_tris_arrays() runs it again
+    synchronously and the error surfaces where it did before.
+    """
+
+    def __init__(self, max_workers=None, executor=None):
+        """
+        :param max_workers: number of worker processes, defaults to CPU count
+        :param executor: optional concurrent.futures executor to use instead
+                         of creating a process pool
+        """
+        self.__max_workers = max_workers
+        self.__executor = executor
+
+        self.__pending = {}
+
+        # Filled from executor callback threads, drained by collect()
+        self.__completed = deque()
+        self.__lock = threading.Lock()
+
+    def __get_executor(self):
+        if self.__executor is None:
+            # Spawn rather than fork, the GUI process has GL and Qt state
+            # that mustn't be duplicated into workers
+            self.__executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.__max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+
+        return self.__executor
+
+    @property
+    def busy(self):
+        return bool(self.__pending)
+
+    def pending(self, polygon):
+        """
+        :return: True if polygon is waiting on a worker
+        """
+        return polygon in self.__pending
+
+    def submit(self, polygon):
+        """
+        Queue a polygon for triangulation, unless it already has one
+        """
+        if polygon.has_tris() or polygon in self.__pending:
+            return
+
+        exterior, interiors = _outline(polygon)
+        future = self.__get_executor().submit(triangulate, exterior, interiors)
+        self.__pending[polygon] = future
+
+        def done(f):
+            with self.__lock:
+                self.__completed.append((polygon, f))
+
+        future.add_done_callback(done)
+
+    def submit_many(self, polygons):
+        for p in polygons:
+            self.submit(p)
+
+    def cancel(self, polygon):
+        """
+        Stop waiting on a polygon, for instance because it was removed
+        """
+        future = self.__pending.pop(polygon, None)
+        if future is not None:
+            future.cancel()
+
+    def collect(self):
+        """
+        Apply finished triangulations to their polygons.
+
+        :return: list of polygons that gained a triangulation
+        """
+        with self.__lock:
+            completed = list(self.__completed)
+            self.__completed.clear()
+
+        out = []
+        for polygon, future in completed:
+            # Cancelled, or resubmitted since
+            if self.__pending.get(polygon) is not future:
+                continue
+
+            del self.__pending[polygon]
+
+            if future.cancelled() or future.exception() is not None:
+                continue
+
+            if not polygon.has_tris():
+                polygon._set_tris_arrays(*future.result())
+                out.append(polygon)
+
+        return out
+
+    def wait(self, timeout=None):
+        """
+        Block until all submitted work has finished, then collect()
+
+        :return: list of polygons that gained a triangulation
+        """
+        concurrent.futures.wait(list(self.__pending.values()), timeout=timeout)
+        return self.collect()
+
+    def shutdown(self):
+        for future in self.__pending.values():
+            future.cancel()
+        self.__pending.clear()
+
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=False)
+            self.__executor = None
@@ -24,6 +24,9 @@ if requested_binding == "pyqt5":
     def getOpenFileName(*args, **kwargs):
         return QtWidgets.QFileDialog.getOpenFileName(*args, **kwargs)
 
+    def getOpenFileNames(*args, **kwargs):
+        return QtWidgets.QFileDialog.getOpenFileNames(*args, **kwargs)
+
     def getSaveFileName(*args, **kwargs):
         return QtWidgets.QFileDialog.getSaveFileName(*args, **kwargs)
 
@@ -5,7 +5,9 @@ uniform mat3 mat;
 INPUT_TYPE vec2 pos_a;
 INPUT_TYPE vec2 pos_b;
 INPUT_TYPE float thickness;
+INPUT_TYPE float selected;
 uniform vec4 color;
+uniform vec4 color_sel;
 
 in vec2 lvertex;
 in int ptid;
@@ -37,5 +39,9 @@ void main(void)
     vec3 calc = mat * vec3(pos + endcap_r * (thickness * lvertex), 1);
     gl_Position = vec4(calc.x, calc.y, 0, 1);
 
-    color_vtx = color;
+    if (selected > 0.5) {
+        color_vtx = color_sel;
+    } else {
+        color_vtx = color;
+    }
 }
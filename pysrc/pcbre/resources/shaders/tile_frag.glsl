@@ -0,0 +1,13 @@
+#version 150
+
+uniform sampler2D tex1;
+uniform float alpha;
+
+in vec2 pos;
+out vec4 FragColor;
+
+void main(void)
+{
+    vec4 tex = texture(tex1, pos);
+    FragColor = vec4(tex.r, tex.g, tex.b, alpha);
+}
@@ -1,7 +1,7 @@
 from itertools import chain
 
-from pcbre.qt_compat import getOpenFileName, QtWidgets
-from pcbre.model.imagelayer import ImageLayer
+from pcbre.qt_compat import getOpenFileNames, QtCore, QtWidgets
+from pcbre.model.imageimport import ImageImport
 from pcbre.ui.dialogs.layeralignmentdialog.dialog import LayerAlignmentDialog
 
 __author__ = "davidc"
@@ -9,7 +9,7 @@ __author__ = "davidc"
 
 class AddImageDialogAction(QtWidgets.QAction):
     """
-    This action shows a QT file selection dialog and adds an image to the
+    This action shows a QT file selection dialog and adds images to the
     project.
     """
 
@@ -38,19 +38,54 @@ class AddImageDialogAction(QtWidgets.QAction):
             "%s (%s)" % (i[0], " ".join(i[1])) for i in known_image_types
         )
 
-        fname, _ = getOpenFileName(self.window, "Open Image", filter=filter_string)
+        fnames, _ = getOpenFileNames(
+            self.window, "Open Images", filter=filter_string
+        )
 
-        if not fname:
+        if not fnames:
             return
 
-        il = ImageLayer.fromFile(self.window.project, fname)
+        # Decoding large scans takes a while, do all of them at once in the
+        # background
+        task = ImageImport(fnames)
 
-        if not il:
-            print("ImageLayer returned none...")
-            return
+        pd = QtWidgets.QProgressDialog(
+            "Importing images....", "Cancel", 0, len(fnames), self.window
+        )
+        pd.setWindowModality(QtCore.Qt.WindowModal)
+        pd.setMinimumDuration(500)
+        pd.canceled.connect(task.cancel)
+
+        timer = QtCore.QTimer(pd)
+
+        def poll():
+            done, total = task.progress
+            pd.setValue(done)
+
+            if not task.done:
+                return
+
+            timer.stop()
+            pd.canceled.disconnect(task.cancel)
+            pd.close()
+            pd.deleteLater()
+
+            self.__add_layers(*task.finish())
+
+        timer.timeout.connect(poll)
+        timer.start(50)
+
+    def __add_layers(self, layers, errors):
+        if errors:
+            QtWidgets.QMessageBox.warning(
+                self.window,
+                "Some images were not imported",
+                "\n".join(str(e) for e in errors),
+            )
 
-        # Allow the user to align the image
-        dlg = LayerAlignmentDialog(self.window, self.window.project, il)
-        res = dlg.exec_()
-        if res == QtWidgets.QDialog.Accepted:
-            self.window.project.imagery.add_imagelayer(il)
+        for il in layers:
+            # Allow the user to align the image
+            dlg = LayerAlignmentDialog(self.window, self.window.project, il)
+            res = dlg.exec_()
+            if res == QtWidgets.QDialog.Accepted:
+                self.window.project.imagery.add_imagelayer(il)
@@ -1,4 +1,4 @@
-from pcbre.qt_compat import QtWidgets
+from pcbre.qt_compat import QtCore, QtWidgets
 
 __author__ = "davidc"
 
@@ -7,6 +7,43 @@ pcbre_filter = "PCBRE Project Files (*.pcbre)"
 # class OpenAction(QtWidgets.QAction):
 
 
+def save_in_background(window, path=None, update_path=False):
+    """
+    Save the project of window on a worker thread. Editing continues
+    meanwhile, progress is shown in a dialog that can cancel the save.
+    """
+    task = window.project.save_async(path, update_path)
+
+    pd = QtWidgets.QProgressDialog("Saving....", "Cancel", 0, 0, window)
+    pd.setWindowModality(QtCore.Qt.NonModal)
+    pd.setMinimumDuration(500)
+    pd.canceled.connect(task.cancel)
+
+    timer = QtCore.QTimer(pd)
+
+    def poll():
+        done, total = task.progress
+        if total:
+            pd.setMaximum(total)
+            pd.setValue(done)
+
+        if not task.done:
+            return
+
+        timer.stop()
+        pd.canceled.disconnect(task.cancel)
+        pd.close()
+        pd.deleteLater()
+
+        try:
+            task.finish()
+        except (IOError, OSError) as e:
+            QtWidgets.QMessageBox.critical(window, "Save failed", str(e))
+
+    timer.timeout.connect(poll)
+    timer.start(50)
+
+
 class SaveAction(QtWidgets.QAction):
     def __init__(self, window):
         self.window = window
@@ -15,7 +52,7 @@ class SaveAction(QtWidgets.QAction):
         )
 
     def __action(self):
-        self.window.project.save()
+        save_in_background(self.window)
 
 
 class SaveAsDialogAction(QtWidgets.QAction):
@@ -35,7 +72,7 @@ class SaveAsDialogAction(QtWidgets.QAction):
         )
 
         if filename:
-            self.window.project.save(filename, update_path=True)
+            save_in_background(self.window, filename, update_path=True)
 
 
 def checkCloseSave(window):
@@ -1,4 +1,4 @@
-from pcbre.qt_compat import QtGui, QtWidgets
+from pcbre.qt_compat import QtGui, QtWidgets, getSaveFileName
 from pcbre.ui.icon import Icon
 
 __author__ = "davidc"
@@ -127,3 +127,44 @@ class ToggleDrawOtherLayersAction(QtWidgets.QAction):
 
     def update_from_prop(self):
         self.setChecked(self.va.viewState.draw_other_layers)
+
+
+class ToggleFrameStatsAction(QtWidgets.QAction):
+    def __init__(self, mw, va):
+        QtWidgets.QAction.__init__(self, "Show Frame Statistics", mw)
+        self.va = va
+
+        self.setCheckable(True)
+        self.setShortcut(QtGui.QKeySequence("ctrl+shift+f"))
+
+        self.update_from_prop()
+        self.triggered.connect(self.__set_prop)
+
+    def __set_prop(self):
+        self.va.show_frame_stats = self.isChecked()
+
+    def update_from_prop(self):
+        self.setChecked(self.va.show_frame_stats)
+
+
+class ExportFrameStatsAction(QtWidgets.QAction):
+    def __init__(self, mw, va):
+        QtWidgets.QAction.__init__(
+            self, "Export Frame Statistics...", mw, triggered=self.__action
+        )
+        self.mw = mw
+        self.va = va
+
+    def __action(self):
+        filename, _ = getSaveFileName(
+            self.mw,
+            "Export Frame Statistics",
+            filter="CSV Files (*.csv);;JSON Files (*.json)",
+        )
+        if not filename:
+            return
+
+        try:
+            self.va.gls.frame_stats.export(filename)
+        except (IOError, OSError) as e:
+            QtWidgets.QMessageBox.critical(self.mw, "Export failed", str(e))
@@ -11,8 +11,8 @@ from pcbre.model.dipcomponent import DIPComponent
 from pcbre.model.passivecomponent import PassiveComponent
 from pcbre.model.smd4component import SMD4Component
 from pcbre.model.stackup import Layer
+from pcbre.model.triangulation import TriangulationPool
 
-from pcbre.util import Timer
 from pcbre.ui.gl.glshared import GLShared
 from pcbre.ui.gl.textrender import TextBatcher
 from pcbre.ui.tools.airwiretool import AIRWIRE_COLOR
@@ -37,6 +37,13 @@ from pcbre.view.componentview import PadRender, DIPRender, SMDRender, PassiveRen
 MOVE_MODIFIER_KEY = QtCore.Qt.Key_Space
 MOVE_MOUSE_BUTTON = QtCore.Qt.LeftButton
 
+# Geometry this close to the edge of the view, in pixels, is still drawn, so
+# that outlines and highlights that reach past a bbox aren't cut off
+CULL_MARGIN = 32
+
+# Seconds between updates of the frame statistics display
+HUD_INTERVAL = 0.25
+
 
 def fixed_center_dot(viewState, m, view_center=None):
 
@@ -178,6 +185,9 @@ class BaseViewWidget(QtOpenGL.QGLWidget):
 
         self.selectionList = set()
 
+        # Bumped on every change of selectionList
+        self.selection_generation = 0
+
         self.open_time = time.time()
 
         # OpenGL shared resources object. Initialized during initializeGL
@@ -244,16 +254,30 @@ class BaseViewWidget(QtOpenGL.QGLWidget):
         else:
             self.selectionList = set(l)
 
-        if old != self.selectionList:
+        added = self.selectionList - old
+        removed = old - self.selectionList
+        if added or removed:
+            self.selection_generation += 1
+            self.selection_changed(added, removed)
             self.update()
 
+    def selection_changed(self, added, removed):
+        """
+        Called with the artwork that was selected and deselected whenever the
+        selection changes, so that views can update what they draw
+
+        :param added: set of newly selected objects
+        :param removed: set of objects no longer selected
+        """
+        pass
+
     def setInteractionDelegate(self, ed):
         """
 
         :param ed:
         :type ed: pcbre.ui.tools.basetool.BaseToolController
         """
-        self.selectionList = set()
+        self.setSelectionList(None)
 
         if self.interactionDelegate == ed:
             return
@@ -434,17 +458,38 @@ class BoardViewWidget(BaseViewWidget):
         self.smd_renderer = SMDRender(self)
         self.trace_renderer = TraceRender(self)
 
+        # Frees the GPU slots of traces as they leave the board
+        self.project.artwork.add_listener(self.trace_renderer)
+
         self.via_renderer = THRenderer(self)
         self.pad_via_batch = self.via_renderer.batch()
+
+        # Follows via changes through the artwork's listeners
         self.__via_project_batch = ViaBoardBatcher(self.via_renderer, self.project)
 
         self.text_batch = TextBatcher(self.gls.text)
         self.cmp_text_batch = ComponentTextBatcher(self, self.project, self.gls.text)
 
-        self.poly_renderer = CachedPolygonRenderer(self)
+        # Polygons are triangulated in worker processes, results are picked
+        # up at the start of each frame
+        self.triangulation_pool = TriangulationPool()
+        self.project.artwork.set_triangulation_pool(self.triangulation_pool)
+
+        self.poly_renderer = CachedPolygonRenderer(self, self.triangulation_pool)
         self.hairline_renderer = HairlineRenderer(self)
         self.passive_renderer = PassiveRender(self)
 
+        # On-screen frame statistics, shown on demand
+        self.__hud = None
+
+        # Visible artwork of the last frame, kept until the view or artwork
+        # changes
+        self.__scene_key = None
+        self.__scene_number = 0
+        self.__scene_traces = {}
+        self.__scene_polygons = []
+        self.__scene_airwires = []
+
         # Initial view is a normalized 1-1-1 area.
         # Shift to be 10cm max
         self.viewState.transform = translate(-0.9, -0.9).dot(scale(1. / 100000))
@@ -474,12 +519,24 @@ class BoardViewWidget(BaseViewWidget):
 
     def image_view_cache_load(self, il):
         key = id(il)
-        if key not in self.image_view_cache:
+        iv = self.image_view_cache.get(key)
+        if iv is None or iv.il is not il:
+            self.__prune_image_views()
+
             iv = ImageView(il)
             iv.initGL(self.gls)
             self.image_view_cache[key] = iv
 
-        return self.image_view_cache[key]
+        return iv
+
+    def __prune_image_views(self):
+        # Views of layers that left the project would otherwise keep their
+        # textures until evicted
+        current = set(self.project.imagery.imagelayers)
+        for key, iv in list(self.image_view_cache.items()):
+            if iv.il not in current:
+                del self.image_view_cache[key]
+                iv.release()
 
     def reinit(self):
         self.pad_renderer.initializeGL(self, self.gls)
@@ -493,9 +550,64 @@ class BoardViewWidget(BaseViewWidget):
         self.hairline_renderer.initializeGL()
 
         for i in list(self.image_view_cache.values()):
-            i.initGL()
+            i.initGL(self.gls)
+
+    def selection_changed(self, added, removed):
+        # Renderers keep the selection state of what they draw, only what
+        # changed is passed on
+        self.trace_renderer.select(added, True)
+        self.trace_renderer.select(removed, False)
+        self.__via_project_batch.select(added, True)
+        self.__via_project_batch.select(removed, False)
+
+    def __update_scene(self, visible_rect):
+        """
+        Sort the visible artwork by type, unless neither the visible area nor
+        the artwork changed since the last frame
+        """
+        artwork = self.project.artwork
+        key = (
+            (visible_rect.left, visible_rect.bottom,
+             visible_rect.right, visible_rect.top),
+            artwork.traces_generation,
+            artwork.polygons_generation,
+            artwork.airwires_generation,
+            tuple(self.__layer_visible_lut),
+        )
+        if key == self.__scene_key:
+            return
+
+        self.__scene_key = key
+        self.__scene_number += 1
+
+        traces = {}
+        polygons = []
+        airwires = []
+        for i in self.getVisibleArtwork(visible_rect):
+            if isinstance(i, Trace):
+                if self.layer_visible(i.layer):
+                    traces.setdefault(i.layer, []).append(i)
+            elif isinstance(i, Polygon):
+                if self.layer_visible(i.layer):
+                    polygons.append(i)
+            elif isinstance(i, Airwire):
+                airwires.append(i)
+            elif isinstance(i, Via):
+                pass
+            else:
+                raise NotImplementedError()
+
+        self.__scene_traces = traces
+        self.__scene_polygons = polygons
+        self.__scene_airwires = airwires
+
+    def getVisibleArtwork(self, rect=None):
+        """
+        :param rect: world area to cull the artwork to, defaults to all of it
+        """
+        if rect is not None:
+            return self.project.artwork.query_rect(rect)
 
-    def getVisibleArtwork(self):
         objects = []
         objects += self.project.artwork.vias
         objects += self.project.artwork.traces
@@ -546,13 +658,75 @@ class BoardViewWidget(BaseViewWidget):
     def layer_visible_m(self, l):
         return self.viewState.current_layer in l or self.viewState.draw_other_layers
 
+    def pick_layers(self):
+        """
+        :return: visible layers in pick priority order. The current layer is
+                 drawn over all others, so it comes first.
+        """
+        current = self.viewState.current_layer
+        if not self.viewState.draw_other_layers:
+            return [current] if current is not None else []
+
+        layers = [i for i in self.project.stackup.layers if i is not current]
+        if current is not None:
+            layers.insert(0, current)
+
+        return layers
+
+    @property
+    def show_frame_stats(self):
+        return self.__hud is not None
+
+    @show_frame_stats.setter
+    def show_frame_stats(self, value):
+        if value and self.__hud is None:
+            self.__hud = QtWidgets.QLabel(self)
+            self.__hud.setFont(QtGui.QFontDatabase.systemFont(
+                QtGui.QFontDatabase.FixedFont))
+            self.__hud.setStyleSheet(
+                "QLabel { background-color: black; color: white; padding: 4px; }"
+            )
+            self.__hud.setAttribute(QtCore.Qt.WA_TransparentForMouseEvents)
+            self.__hud.move(8, 8)
+            self.__hud_updated = None
+            self.__hud.show()
+        elif not value and self.__hud is not None:
+            self.__hud.deleteLater()
+            self.__hud = None
+
+        self.update()
+
+    def __update_hud(self):
+        now = time.monotonic()
+        if self.__hud_updated is not None and now - self.__hud_updated < HUD_INTERVAL:
+            return
+
+        self.__hud_updated = now
+        self.__hud.setText(self.gls.frame_stats.hud_text())
+        self.__hud.adjustSize()
+
     def render(self):
-        t_render_start = time.time()
+        stats = self.gls.frame_stats
+        stats.begin_frame()
+
+        self.__render(stats)
 
+        stats.end_frame()
+
+        if self.__hud is not None:
+            self.__update_hud()
+
+    def __render(self, stats):
         gl_matrix = self.viewState.glMatrix
 
         self.update_layer_visible_cache()
 
+        self.triangulation_pool.collect()
+        if self.triangulation_pool.busy:
+            # Poll for more results, polygons are drawn as outlines until
+            # their triangles arrive
+            QtCore.QTimer.singleShot(50, self.update)
+
         # zero accuum buffers for restarts
         self.trace_renderer.restart()
         self.text_batch.restart()
@@ -568,62 +742,65 @@ class BoardViewWidget(BaseViewWidget):
             return
 
         # Render all images down onto the layer
-        with Timer() as il_timer:
+        with stats.phase("images"):
             if self.viewState.show_images and (len(stackup_layer.imagelayers) > 0):
                 images = list(stackup_layer.imagelayers)
                 if images:
                     i = self.viewState.layer_permute % len(images)
                     images_cycled = images[i:] + images[:i]
+                    complete = True
                     for l in images_cycled:
-                        self.image_view_cache_load(l).render(gl_matrix)
+                        if not self.image_view_cache_load(l).render(gl_matrix):
+                            complete = False
+
+                    if not complete:
+                        # Redraw at the frame rate while images load and fade in
+                        QtCore.QTimer.singleShot(16, self.update)
 
         # Now render features
         self.lt = time.time()
 
         GL.glBlendFunc(GL.GL_SRC_ALPHA, GL.GL_ONE_MINUS_SRC_ALPHA)
 
-        artwork = self.getVisibleArtwork()
+        # Only what's on screen is batched and drawn
+        visible_rect = self.viewState.visible_rect(CULL_MARGIN)
 
         # Build rendering batches
-        with Timer() as t_aw:
-            sx = set()
-            for i in artwork:
-                rs = RENDER_SELECTED if i in self.selectionList else 0
+        with stats.phase("artwork batch"):
+            self.__update_scene(visible_rect)
 
-                if isinstance(i, Trace):
-                    if self.layer_visible(i.layer):
-                        sx.add((i, rs))
+            for i in self.__scene_polygons:
+                rs = RENDER_SELECTED if i in self.selectionList else 0
+                self.poly_renderer.deferred(i, rs, RENDER_HINT_NORMAL)
 
-                elif isinstance(i, Polygon):
-                    if self.layer_visible(i.layer):
-                        self.poly_renderer.deferred(i, rs, RENDER_HINT_NORMAL)
-                elif isinstance(i, Airwire):
-                    self.hairline_renderer.deferred(
-                        i.p0, i.p1, AIRWIRE_COLOR, None, RENDER_HINT_NORMAL
-                    )
-                elif isinstance(i, Via):
-                    pass
-                else:
-                    raise NotImplementedError()
+            for i in self.__scene_airwires:
+                self.hairline_renderer.deferred(
+                    i.p0, i.p1, AIRWIRE_COLOR, None, RENDER_HINT_NORMAL
+                )
 
-            with Timer() as t_vt_gen:
-                self.__via_project_batch.update_if_necessary(self.selectionList)
+            with stats.phase("via batch"):
+                self.__via_project_batch.update_if_necessary()
 
-            with Timer() as t_tr_gen:
-                for i, rs in sx:
-                    self.trace_renderer.deferred(i, rs, RENDER_HINT_NORMAL)
+            # Traces stay with the renderer until the scene changes, and it
+            # tracks their selection itself
+            with stats.phase("trace batch"):
+                for layer in self.project.stackup.layers:
+                    self.trace_renderer.set_scene(
+                        layer, self.__scene_traces.get(layer, ()),
+                        self.__scene_number,
+                    )
 
-        with Timer() as cmp_timer:
-            for cmp in self.project.artwork.components:
+        with stats.phase("components"):
+            for cmp in self.project.artwork.query_rect_components(visible_rect):
                 render_state = 0
                 if cmp in self.selectionList:
                     render_state |= RENDER_SELECTED
                 self.render_component(gl_matrix, cmp, render_state)
 
-            with Timer() as t_cmp_gen:
+            with stats.phase("component text"):
                 self.cmp_text_batch.update_if_necessary()
 
-        with Timer() as other_timer:
+        with stats.phase("overlay"):
             super(BoardViewWidget, self).render()
 
         def ly_order_func(layer):
@@ -633,27 +810,21 @@ class BoardViewWidget(BaseViewWidget):
 
             return -layer.order
 
-        with Timer() as gl_draw_timer:
+        with stats.phase("draw"):
             # Draw all the layers
             layers = sorted(self.project.stackup.layers, key=ly_order_func)
 
-            t_tr_draw = Timer()
-            t_tex_draw = Timer()
-
             for layer in layers:
-                with t_tr_draw:
+                with stats.phase("layer %s" % layer.name):
                     self.trace_renderer.render_deferred_layer(gl_matrix, layer)
-
-                self.poly_renderer.render(gl_matrix, layer)
-                with t_tex_draw:
+                    self.poly_renderer.render(gl_matrix, layer)
                     self.text_batch.render(key=layer)
-                self.hairline_renderer.render_group(gl_matrix, layer)
+                    self.hairline_renderer.render_group(gl_matrix, layer)
 
-            with Timer() as t_vt_draw:
+            with stats.phase("vias"):
                 for i in self.project.stackup.via_pairs:
                     self.__via_project_batch.render_viapair(gl_matrix, i)
 
-            with Timer():
                 # A hack: all vias associated with pads are lumped into a
                 # seperate batch.
                 self.pad_via_batch.prepare()
@@ -661,7 +832,7 @@ class BoardViewWidget(BaseViewWidget):
 
             # Final rendering
             # Render the non-layer text
-            with t_tex_draw:
+            with stats.phase("text"):
                 self.cmp_text_batch.render_layer(gl_matrix, SIDE.Top, False)
                 self.cmp_text_batch.render_layer(gl_matrix, SIDE.Bottom, False)
                 self.text_batch.render()
@@ -670,16 +841,6 @@ class BoardViewWidget(BaseViewWidget):
 
             self.hairline_renderer.render_group(self.viewState.glWMatrix, "OVERLAY_VS")
 
-            GL.glFinish()
-
-        all_time = time.time() - t_render_start
-        print(
-            "Render time all: %f ot: %f cmp: %f aw: %f gl: %f"
-            % (
-                all_time,
-                other_timer.interval,
-                cmp_timer.interval,
-                t_aw.interval,
-                gl_draw_timer.interval,
-            )
-        )
+            # Waits for the GPU, so the draw phase includes its work
+            with stats.phase("gl finish"):
+                GL.glFinish()
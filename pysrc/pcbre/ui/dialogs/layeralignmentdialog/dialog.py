@@ -132,14 +132,20 @@ class AlignmentViewWidget(BaseViewWidget):
 
         # Render the base image
         if self.model.view_mode == VIEW_MODE_UNALIGNED:
-            self.iv.render(self.viewState.glMatrix)
+            complete = self.iv.render(self.viewState.glMatrix)
         else:
             # Draw all visible layers bottom to top
             all_ils = list(reversed(self.get_flattened()))
 
+            complete = True
             for il in all_ils:
                 iv = self.get_iv(il)
-                iv.render(self.viewState.glMatrix)
+                if not iv.render(self.viewState.glMatrix):
+                    complete = False
+
+        if not complete:
+            # Redraw at the frame rate while images load and fade in
+            QtCore.QTimer.singleShot(16, self.update)
 
         for ovl in self.active_overlays:
             ovl.render(self.viewState)
@@ -184,7 +184,7 @@ class RectAlignmentModel(GenModel):
         self.__image = image
 
         # 4 corner handles, 2 (potential) anchor handles per line
-        ini_shape = image.decoded_image.shape
+        ini_shape = image.shape
         max_dim = float(max(ini_shape))
         x = ini_shape[1] / max_dim
         y = ini_shape[0] / max_dim
@@ -1,11 +1,17 @@
 import pkg_resources
+import OpenGL.GL as GL
 
+from pcbre.model.imagecache import ImageCache
 from pcbre.ui.gl.shadercache import ShaderCache
 from pcbre.ui.gl.textrender import TextRender
 from pcbre.ui.gl.textatlas import SDFTextAtlas
+from pcbre.view.framestats import FrameStats
 
 __author__ = "davidc"
 
+# GPU memory budget of the image textures of a GL context, in bytes
+TEXTURE_BUDGET = 512 * 1024 * 1024
+
 
 sans_serif_atlas = SDFTextAtlas(
     pkg_resources.resource_filename("pcbre.resources", "Vera.ttf")
@@ -16,7 +22,16 @@ class GLShared(object):
     def __init__(self):
         self.shader_cache = ShaderCache()
         self.text = TextRender(self, sans_serif_atlas)
+        self.texture_cache = None
+
+        # Kept across contexts, renderers report to it as they draw
+        self.frame_stats = FrameStats()
 
     def initializeGL(self):
+        # Textures of an earlier context are gone with it
+        self.texture_cache = ImageCache(
+            TEXTURE_BUDGET, on_evict=lambda tex: GL.glDeleteTextures([tex])
+        )
+
         self.text.initializeGL()
         self.text.updateTexture()
@@ -79,6 +79,7 @@ class TextBatch:
         self.vbo.size = None
         self.vbo.copied = False
         self.vbo.bind()
+        self.__text_render.gls.frame_stats.upload("text", arr.nbytes)
 
         self.__elem_count = len(arr)
 
@@ -95,6 +96,7 @@ class TextBatch:
             )
             GL.glUniform4f(self.__text_render.sdf_shader.uniforms.color, *self.__color)
 
+            self.__text_render.gls.frame_stats.draw("text")
             GL.glDrawArrays(GL.GL_TRIANGLES, 0, self.__elem_count)
 
 
@@ -138,6 +140,7 @@ class TextBatcher(object):
             self.vbo.copied = False
             self.vbo.bind()
             self.__vbo_needs_update = False
+            self.text_render.gls.frame_stats.upload("text", arr.nbytes)
 
         self.text_render.updateTexture()
 
@@ -156,6 +159,7 @@ class TextBatcher(object):
                 )
                 GL.glUniform4f(self.text_render.sdf_shader.uniforms.color, *tag.color)
 
+                self.text_render.gls.frame_stats.draw("text")
                 GL.glDrawArrays(GL.GL_TRIANGLES, tag.textinfo.start, tag.textinfo.count)
 
     def submit(self, ts, mat, color, k=None):
@@ -27,6 +27,8 @@ from .actions.view import (
     RotateRAction,
     ToggleShowImageryAction,
     ToggleDrawOtherLayersAction,
+    ToggleFrameStatsAction,
+    ExportFrameStatsAction,
 )
 from .boardviewwidget import BoardViewWidget
 from .panes.info import InfoWidget
@@ -54,6 +56,8 @@ class MainWindowActions:
         self.view_toggle_draw_other_layers = ToggleDrawOtherLayersAction(
             window, window.viewArea
         )
+        self.view_toggle_frame_stats = ToggleFrameStatsAction(window, window.viewArea)
+        self.view_export_frame_stats = ExportFrameStatsAction(window, window.viewArea)
 
         # PCB Actions
         self.pcb_stackup_setup_dialog = StackupSetupDialogAction(window)
@@ -146,6 +150,11 @@ class MainWindow(QtWidgets.QMainWindow):
 
     def closeEvent(self, evt):
         if checkCloseSave(self):
+            # Let a save that is still being written complete
+            if self.project.save_task is not None:
+                self.project.save_task.wait()
+
+            self.viewArea.triangulation_pool.shutdown()
             evt.accept()
         else:
             evt.ignore()
@@ -176,16 +185,21 @@ def main():
 
     ap = argparse.ArgumentParser()
     ap.add_argument("--create-if-not-exists", action="store_true")
+    ap.add_argument("--columnar-artwork", action="store_true",
+                    help="keep trace and via geometry in column stores, "
+                         "using far less memory on large boards")
     ap.add_argument("project", nargs="?")
     args = ap.parse_args()
 
+    options = {"columnar_artwork": args.columnar_artwork}
+
     if args.project is None:
-        p = P.Project.create()
+        p = P.Project.create(**options)
     else:
         if os.path.exists(args.project):
-            p = P.Project.open(args.project)
+            p = P.Project.open(args.project, **options)
         elif args.create_if_not_exists:
-            p = P.Project.create()
+            p = P.Project.create(**options)
             p.filepath = args.project
         else:
             print("File not found")
@@ -18,8 +18,14 @@ class ViewMenu(QtWidgets.QMenu):
         self.addAction(mw.actions.view_toggle_show_imagery)
         self.addAction(mw.actions.view_toggle_draw_other_layers)
 
+        self.addSeparator()
+
+        self.addAction(mw.actions.view_toggle_frame_stats)
+        self.addAction(mw.actions.view_export_frame_stats)
+
         def update_sub():
             mw.actions.view_toggle_show_imagery.update_from_prop()
             mw.actions.view_toggle_draw_other_layers.update_from_prop()
+            mw.actions.view_toggle_frame_stats.update_from_prop()
 
         self.aboutToShow.connect(update_sub)
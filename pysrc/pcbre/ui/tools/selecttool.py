@@ -54,18 +54,22 @@ class SelectToolController(BaseToolController):
         pt_w = self.view.viewState.tfV2W(pt)
 
         new = set()
+        layers = self.view.pick_layers()
 
         if self.model.vers == SelectByModes.POINT:
-            res = self.project.artwork.query_point(pt_w)
+            res = self.project.artwork.query_point(pt_w, layers_include=layers)
             if res is not None:
                 new.add(res)
 
         elif self.model.vers == SelectByModes.NET:
-            res = self.project.artwork.query_point(pt_w)
+            res = self.project.artwork.query_point(pt_w, layers_include=layers)
             if res is not None and res.TYPE_FLAGS & TFF.HAS_NET:
                 net = res.net
-                aw = self.project.artwork.get_geom_for_net(net)
-                new.update(aw)
+                if net is None:
+                    # Unconnected, such as a pad that hasn't been merged
+                    new.add(res)
+                else:
+                    new.update(self.project.artwork.get_geom_for_net(net))
 
         current = self.view.selectionList
 
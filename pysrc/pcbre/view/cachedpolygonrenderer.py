@@ -20,14 +20,17 @@ __author__ = "davidc"
 class PolygonVBOPair:
     __RESTART_INDEX = 2 ** 32 - 1
 
-    def __init__(self, view):
+    def __init__(self, view, pool=None):
         """
         :type gls: pcbre.ui.gl.glshared.GLShared
         :param gls:
+        :param pool: optional TriangulationPool computing triangles in the
+                     background
         :return:
         """
         self.__view = view
         self.__gls = view.gls
+        self.__pool = pool
 
         self.__position_list = []
         self.__position_lookup = {}
@@ -83,9 +86,12 @@ class PolygonVBOPair:
         self.__vert_vbo.copied = False
         self.__vert_vbo.bind()
         self.__vert_vbo_current = True
+        self.__gls.frame_stats.upload("polygons", ar.nbytes)
 
     def __update_index_vbo(self):
-        if self.__index_vbo_current or not len(self.__tri_index_list):
+        if self.__index_vbo_current or not (
+            self.__tri_index_list or self.__outline_index_list
+        ):
             return
 
         self.__outline_index_offset = len(self.__tri_index_list)
@@ -97,6 +103,7 @@ class PolygonVBOPair:
         self.__index_vbo.copied = False
         self.__index_vbo.bind()
         self.__index_vbo_current = True
+        self.__gls.frame_stats.upload("polygons", self.__index_vbo.data.nbytes)
 
     def __get_position_index(self, point):
         """
@@ -116,19 +123,25 @@ class PolygonVBOPair:
 
         return self.__position_lookup[norm_pos]
 
-    def __add(self, polygon):
-        tris = polygon.get_tris_repr()
+    def __add_tris(self, polygon):
+        vertices, indices = polygon.get_tris_arrays()
         tri_index_first = len(self.__tri_index_list)
 
-        for t in tris:
-            for p in t.a, t.b, t.c:
-                self.__tri_index_list.append(
-                    self.__get_position_index(Point2(p.x, p.y))
-                )
+        position_index = [
+            self.__get_position_index(Point2(x, y)) for x, y in vertices.tolist()
+        ]
+        self.__tri_index_list.extend(
+            position_index[i] for i in indices.ravel().tolist()
+        )
 
         tr = (tri_index_first, len(self.__tri_index_list))
         self.__tri_draw_ranges[polygon] = tr
 
+        self.__index_vbo_current = False
+
+        return tr
+
+    def __add_outline(self, polygon):
         outline_index_first = len(self.__outline_index_list)
         poly_repr = polygon.get_poly_repr()
         for edge in [poly_repr.exterior] + list(poly_repr.interiors):
@@ -141,16 +154,22 @@ class PolygonVBOPair:
 
         self.__index_vbo_current = False
 
-        return tr, lr
+        return lr
 
     def deferred(self, polygon, render_settings=RENDER_STANDARD):
-        if polygon in self.__tri_draw_ranges:
-            trange, lrange = (
-                self.__tri_draw_ranges[polygon],
-                self.__outline_draw_ranges[polygon],
-            )
-        else:
-            trange, lrange = self.__add(polygon)
+        lrange = self.__outline_draw_ranges.get(polygon)
+        if lrange is None:
+            lrange = self.__add_outline(polygon)
+
+        trange = self.__tri_draw_ranges.get(polygon)
+        if trange is None and not render_settings & RENDER_OUTLINES:
+            if self.__pool is not None and self.__pool.pending(polygon):
+                # Triangles are still being computed in the background, draw
+                # the outline in the meantime
+                self.__deferred_line_render_ranges[render_settings].append(lrange)
+                return
+
+            trange = self.__add_tris(polygon)
 
         if render_settings & RENDER_OUTLINES:
             self.__deferred_line_render_ranges[render_settings].append(lrange)
@@ -170,6 +189,8 @@ class PolygonVBOPair:
             else:
                 return tuple(overall_color) + (1,)
 
+        stats = self.__gls.frame_stats
+
         with self.__shader, self.__vao:
             GL.glUniformMatrix3fv(
                 self.__shader.uniforms.mat,
@@ -183,6 +204,7 @@ class PolygonVBOPair:
                 GL.glUniform4f(self.__shader.uniforms.color, *_c_for_rs(rs))
 
                 for first, last in tri_draw_list:
+                    stats.draw("polygons")
                     GL.glDrawElements(
                         GL.GL_TRIANGLES,
                         last - first,
@@ -196,6 +218,7 @@ class PolygonVBOPair:
                 GL.glUniform4f(self.__shader.uniforms.color, *_c_for_rs(rs))
                 line_draw_list = get_consolidated_draws(ranges)
                 for first, last in line_draw_list:
+                    stats.draw("polygons")
                     GL.glDrawElements(
                         GL.GL_LINE_STRIP,
                         last - first,
@@ -206,9 +229,15 @@ class PolygonVBOPair:
 
 
 class CachedPolygonRenderer:
-    def __init__(self, view):
+    def __init__(self, view, pool=None):
+        """
+        :param view:
+        :param pool: optional pcbre.model.triangulation.TriangulationPool.
+                     Polygons it is still working on are drawn as outlines.
+        """
         self.__layer_arrays = {}
         self.__view = view
+        self.__pool = pool
 
     def initializeGL(self):
         for v in self.__layer_arrays.values():
@@ -220,7 +249,9 @@ class CachedPolygonRenderer:
 
     def deferred(self, polygon, rendersettings, render_hint=RENDER_HINT_NORMAL):
         if polygon.layer not in self.__layer_arrays:
-            self.__layer_arrays[polygon.layer] = PolygonVBOPair(self.__view)
+            self.__layer_arrays[polygon.layer] = PolygonVBOPair(
+                self.__view, self.__pool
+            )
             self.__layer_arrays[polygon.layer].initializeGL()
 
         self.__layer_arrays[polygon.layer].deferred(polygon, rendersettings)
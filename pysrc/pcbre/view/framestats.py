@@ -0,0 +1,260 @@
+import contextlib
+import csv
+import json
+import time
+from collections import defaultdict, deque
+
+# Number of frames kept for display and export
+FRAME_HISTORY = 600
+
+# Frames averaged over for the on-screen display
+HUD_FRAMES = 60
+
+# Counters kept per renderer, in column order
+_COUNTERS = ("draw_calls", "instances", "upload_bytes")
+
+# Separates a phase entered within another from its parent, as in
+# "draw/layer Top"
+SUBPHASE_SEP = "/"
+
+
+def is_subphase(name):
+    return SUBPHASE_SEP in name
+
+
+class FrameRecord:
+    """
+    Timings and counters of a single frame. Phase times are in seconds, and
+    accumulate over every time a phase is entered during the frame.
+
+    Sub-phases are named parent/child. Their time is part of their parent's,
+    so only the top-level phases add up towards the total.
+    """
+
+    def __init__(self, number):
+        self.number = number
+        self.start = time.time()
+        self.total = 0.
+
+        self.phases = {}
+        self.draw_calls = defaultdict(int)
+        self.instances = defaultdict(int)
+        self.upload_bytes = defaultdict(int)
+
+    def to_dict(self):
+        return {
+            "frame": self.number,
+            "start": self.start,
+            "total_ms": self.total * 1000.,
+            "phases_ms": {k: v * 1000. for k, v in self.phases.items()
+                          if not is_subphase(k)},
+            "subphases_ms": {k: v * 1000. for k, v in self.phases.items()
+                             if is_subphase(k)},
+            "draw_calls": dict(self.draw_calls),
+            "instances": dict(self.instances),
+            "upload_bytes": dict(self.upload_bytes),
+        }
+
+
+class FrameStats:
+    """
+    Ring buffer of per-frame render statistics.
+
+    The view brackets each frame with begin_frame() and end_frame(), and
+    times the phases of drawing with phase(). Renderers report the draw
+    calls they make and the bytes they upload, under their own name, so that
+    the slowest phase or busiest renderer of a board can be found.
+    """
+
+    def __init__(self, history=FRAME_HISTORY):
+        self.__frames = deque(maxlen=history)
+        self.__count = 0
+        self.__current = FrameRecord(0)
+        self.__started = None
+
+        # Full names of the phases being timed, innermost last
+        self.__open = []
+
+    @property
+    def frames(self):
+        """
+        :return: list of the recorded FrameRecords, oldest first
+        """
+        return list(self.__frames)
+
+    @property
+    def current(self):
+        """
+        :return: FrameRecord of the frame being drawn
+        """
+        return self.__current
+
+    def begin_frame(self):
+        self.__current = FrameRecord(self.__count)
+        self.__started = time.perf_counter()
+
+    def end_frame(self):
+        """
+        :return: FrameRecord of the finished frame
+        """
+        record = self.__current
+        if self.__started is not None:
+            record.total = time.perf_counter() - self.__started
+            self.__started = None
+
+        self.__frames.append(record)
+        self.__count += 1
+
+        self.__current = FrameRecord(self.__count)
+        return record
+
+    def clear(self):
+        self.__frames.clear()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        Time the enclosed block as part of the named phase of the frame. A
+        phase entered while another is being timed is recorded as its
+        sub-phase.
+        """
+        # Names come from layer names among others, which mustn't look nested
+        name = name.replace(SUBPHASE_SEP, "_")
+        if self.__open:
+            name = self.__open[-1] + SUBPHASE_SEP + name
+
+        record = self.__current
+        self.__open.append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.__open.pop()
+            record.phases[name] = record.phases.get(name, 0.) + elapsed
+
+    def draw(self, renderer, instances=1):
+        """
+        Count a draw call
+
+        :param renderer: name of the renderer making it
+        :param instances: instances drawn by the call
+        """
+        self.__current.draw_calls[renderer] += 1
+        self.__current.instances[renderer] += instances
+
+    def upload(self, renderer, nbytes):
+        """
+        Count bytes of buffer or texture data sent to the GPU
+        """
+        self.__current.upload_bytes[renderer] += nbytes
+
+    def __columns(self, frames):
+        phases = {}
+        renderers = {}
+        for f in frames:
+            phases.update(dict.fromkeys(f.phases))
+            for counter in _COUNTERS:
+                renderers.update(dict.fromkeys(getattr(f, counter)))
+
+        # Top-level phases first, sub-phases after
+        phases = sorted(phases, key=is_subphase)
+
+        return phases, list(renderers)
+
+    def write_csv(self, f):
+        """
+        Write the recorded frames to the text file f, one row per frame.
+
+        Sub-phase columns follow the top-level ones. They are contained in
+        their parent's time, and must be left out when adding up a row.
+        """
+        frames = self.frames
+        phases, renderers = self.__columns(frames)
+
+        writer = csv.writer(f)
+        writer.writerow(
+            ["frame", "start", "total_ms"]
+            + ["%s_ms" % p for p in phases]
+            + ["%s:%s" % (c, r) for r in renderers for c in _COUNTERS]
+        )
+
+        for fr in frames:
+            writer.writerow(
+                [fr.number, "%.6f" % fr.start, "%.3f" % (fr.total * 1000.)]
+                + ["%.3f" % (fr.phases.get(p, 0.) * 1000.) for p in phases]
+                + [getattr(fr, c).get(r, 0) for r in renderers for c in _COUNTERS]
+            )
+
+    def write_json(self, f):
+        json.dump({"frames": [fr.to_dict() for fr in self.frames]}, f, indent=1)
+
+    def export(self, path):
+        """
+        Write the recorded frames to path, as JSON if it ends in .json and as
+        CSV otherwise
+        """
+        with open(path, "w", newline="") as f:
+            if path.lower().endswith(".json"):
+                self.write_json(f)
+            else:
+                self.write_csv(f)
+
+    def summary(self, n=HUD_FRAMES):
+        """
+        :return: FrameRecord holding the mean of the last n frames, or None if
+                 none were recorded
+        """
+        frames = self.frames[-n:]
+        if not frames:
+            return None
+
+        mean = FrameRecord(frames[-1].number)
+        mean.start = frames[0].start
+        mean.total = sum(f.total for f in frames) / len(frames)
+
+        phases, renderers = self.__columns(frames)
+        for p in phases:
+            mean.phases[p] = sum(f.phases.get(p, 0.) for f in frames) / len(frames)
+
+        for c in _COUNTERS:
+            counter = getattr(mean, c)
+            for r in renderers:
+                counter[r] = sum(getattr(f, c).get(r, 0) for f in frames) / len(frames)
+
+        return mean
+
+    def hud_text(self, n=HUD_FRAMES):
+        """
+        :return: multi-line summary of the last n frames for on-screen display
+        """
+        mean = self.summary(n)
+        if mean is None:
+            return "No frames recorded"
+
+        frames = self.frames[-n:]
+        lines = ["frame %7.2f ms  (mean of %d)" % (mean.total * 1000., len(frames))]
+        if len(frames) > 1:
+            span = frames[-1].start - frames[0].start
+            if span > 0:
+                lines[0] += "  %.1f fps" % ((len(frames) - 1) / span)
+
+        # Slowest phases first, each followed by its own sub-phases
+        def add_phases(parent, depth):
+            children = [(name, t) for name, t in mean.phases.items()
+                        if name.rpartition(SUBPHASE_SEP)[0] == parent]
+            for name, t in sorted(children, key=lambda i: -i[1]):
+                label = "  " * depth + name.rpartition(SUBPHASE_SEP)[2]
+                lines.append("  %-24s %7.2f ms" % (label, t * 1000.))
+                add_phases(name, depth + 1)
+
+        add_phases("", 0)
+
+        for r in sorted(mean.draw_calls, key=lambda r: -mean.draw_calls[r]):
+            lines.append(
+                "  %-12s %6.0f calls %9.0f inst %8.1f KiB up"
+                % (r, mean.draw_calls[r], mean.instances[r],
+                   mean.upload_bytes.get(r, 0) / 1024.)
+            )
+
+        return "\n".join(lines)
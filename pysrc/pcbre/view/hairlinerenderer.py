@@ -42,8 +42,11 @@ class HairlineRenderer:
             self.group_offsets = {}
 
         def build_vbo(self):
+            """
+            :return: number of bytes uploaded
+            """
             if not self.__vbo_update:
-                return
+                return 0
 
             self.__vbo_update = False
 
@@ -55,7 +58,7 @@ class HairlineRenderer:
                 built_list.extend([(i,) for i in points])
 
             if not built_list:
-                return
+                return 0
 
             ar = numpy.array(built_list, dtype=self.__dtype)
 
@@ -64,6 +67,8 @@ class HairlineRenderer:
             self.batch_vbo.copied = False
             self.batch_vbo.bind()
 
+            return ar.nbytes
+
         def last_index(self, group):
             return len(self.__groups[group])
 
@@ -161,11 +166,13 @@ class HairlineRenderer:
             batches = get_consolidated_draws(indicies)
             GL.glUniform4f(self.__shader.uniforms.color, *color)
             for first, last in batches:
+                self.__view.gls.frame_stats.draw("hairlines")
                 GL.glDrawArrays(GL.GL_LINES, offset + first * 2, (last - first) * 2)
 
     def render_group(self, mat, group):
-        self.__recurring_draws.build_vbo()
-        self.__once_draws.build_vbo()
+        uploaded = self.__recurring_draws.build_vbo() + self.__once_draws.build_vbo()
+        if uploaded:
+            self.__view.gls.frame_stats.upload("hairlines", uploaded)
 
         recur_tags = self.__draw_tags_recur[group]
         res_tags = self.__draw_resv[group]
@@ -0,0 +1,168 @@
+import concurrent.futures
+import logging
+import threading
+from collections import deque
+
+from pcbre.model.imagepyramid import ImagePyramid
+
+# Threads shared by all image loaders. Decoding and resizing release the GIL,
+# so threads run them in parallel without the cost of copying images
+# between processes.
+LOADER_THREADS = 4
+
+_log = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=LOADER_THREADS, thread_name_prefix="pcbre-image"
+            )
+        return _executor
+
+
+class ImageLoader:
+    """
+    Opens the pyramid of an image layer and reads its tiles on worker threads.
+
+    The pyramid is built first if it isn't cached yet. Tiles are read once
+    requested, and handed over by collect(), so that nothing the UI thread
+    uses is modified from another thread.
+
+    Errors opening the pyramid or reading a tile are logged once, and what
+    failed isn't tried again.
+    """
+
+    def __init__(self, il, executor=None, cache_dir=None):
+        """
+        :param il: ImageLayer to load
+        :param executor: optional concurrent.futures executor to use instead
+                         of the shared threads
+        :param cache_dir: directory pyramids are cached in, see
+                          ImagePyramid.open_or_build
+        """
+        self.__executor = executor if executor is not None else _get_executor()
+
+        # The layer may read from the project file, which the UI thread can
+        # release at any time, so its data is resolved here and workers only
+        # get what was resolved
+        content_key, decode = il._image_source()
+
+        self.__pyramid = None
+        self.__pyramid_failed = False
+        self.__pyramid_future = self.__executor.submit(
+            ImagePyramid.open_or_build_source, content_key, decode, cache_dir
+        )
+
+        self.__pending = {}
+        self.__failed = set()
+
+        # Filled from executor callback threads, drained by collect()
+        self.__completed = deque()
+        self.__lock = threading.Lock()
+
+    @property
+    def pyramid(self):
+        """
+        :return: the ImagePyramid, or None while it's still being opened or
+                 if opening it failed
+        """
+        if self.__pyramid is None and not self.__pyramid_failed and \
+                self.__pyramid_future.done():
+            try:
+                self.__pyramid = self.__pyramid_future.result()
+            except Exception:
+                _log.exception("Could not open image pyramid")
+                self.__pyramid_failed = True
+
+        return self.__pyramid
+
+    @property
+    def pyramid_failed(self):
+        """
+        :return: True if the pyramid could not be opened, it never will be
+        """
+        # Reading the pyramid picks up the result if it's in
+        return self.pyramid is None and self.__pyramid_failed
+
+    def failed(self, key):
+        """
+        :return: True if reading the tile (level, tx, ty) failed. It isn't
+                 requested again.
+        """
+        return key in self.__failed
+
+    def pending(self, key):
+        """
+        :return: True if the tile (level, tx, ty) is being read
+        """
+        return key in self.__pending
+
+    def request(self, key):
+        """
+        Start reading the tile (level, tx, ty), unless it already is
+        """
+        if key in self.__pending or key in self.__failed:
+            return
+
+        pyramid = self.pyramid
+        if pyramid is None:
+            return
+
+        future = self.__executor.submit(pyramid.tile, *key)
+        self.__pending[key] = future
+
+        def done(f):
+            with self.__lock:
+                self.__completed.append((key, f))
+
+        future.add_done_callback(done)
+
+    def retain(self, keys):
+        """
+        Stop reading tiles that aren't in keys and haven't been started yet,
+        for instance because they have scrolled out of view
+        """
+        for key in [k for k in self.__pending if k not in keys]:
+            if self.__pending[key].cancel():
+                del self.__pending[key]
+
+    def collect(self):
+        """
+        :return: list of (key, tile image) of the tiles read since the last
+                 call
+        """
+        with self.__lock:
+            completed = list(self.__completed)
+            self.__completed.clear()
+
+        out = []
+        for key, future in completed:
+            # Cancelled, or requested again since
+            if self.__pending.get(key) is not future:
+                continue
+
+            del self.__pending[key]
+
+            if future.cancelled():
+                continue
+
+            try:
+                out.append((key, future.result()))
+            except Exception:
+                _log.exception("Could not read image tile %r", key)
+                self.__failed.add(key)
+
+        return out
+
+    def wait(self, timeout=None):
+        """
+        Block until the pyramid is open and all requested tiles are read
+        """
+        futures = [self.__pyramid_future] + list(self.__pending.values())
+        concurrent.futures.wait(futures, timeout)
@@ -1,63 +1,75 @@
 import numpy
-import ctypes
+import time
+from collections import OrderedDict
+
 import OpenGL.GL as GL
 from OpenGL.arrays.vbo import VBO
 
 import pcbre.matrix
 from pcbre.ui.gl import vbobind, Texture, VAO
+from pcbre.view.imageloader import ImageLoader
+
+# Bytes of tile data uploaded to the GPU per frame. Tiles are uploaded in
+# bands of rows, so that no frame stalls on more than this.
+UPLOAD_BYTES_PER_FRAME = 2 * 1024 * 1024
+
+# Time an image takes to fade in once it can first be drawn, in seconds
+FADE_SECONDS = 0.25
+
+_FULL_TEXTURE = (0., 0., 1., 1.)
+
+
+class _TileUpload:
+    def __init__(self, im):
+        self.im = im
+        self.tex = None
+        self.row = 0
 
 
 class ImageView(object):
+    """
+    Draws an image layer from its tile pyramid, streaming in only the tiles
+    visible at the current zoom.
+
+    The pyramid and its tiles are read on worker threads, and tiles are
+    uploaded a band of rows at a time through a pixel buffer, so drawing
+    never waits on them. Until a tile is uploaded, its area is drawn from the
+    coarsest level.
+    """
+
     def __init__(self, il):
         self.il = il
-        self.im = il.decoded_image
+        self.loader = ImageLoader(il)
         self.mat = None
+        self.__textures = None
+        self.__uploads = OrderedDict()
+        self.__shown_at = None
 
-    def initGL(self, gls):
-        self._tex = Texture()
-
-        # Setup the basic texture parameters
-        with self._tex.on(GL.GL_TEXTURE_2D):
-            GL.glTexParameteri(
-                GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER, GL.GL_NEAREST
-            )
-            GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, GL.GL_LINEAR)
-
-            GL.glTexParameteri(
-                GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_S, GL.GL_CLAMP_TO_EDGE
-            )
-            GL.glTexParameteri(
-                GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_T, GL.GL_CLAMP_TO_EDGE
-            )
+    @property
+    def pyramid(self):
+        """
+        :return: ImagePyramid of the layer, or None while it is being opened
+                 or if it could not be
+        """
+        return self.loader.pyramid
 
-            # Numpy packs data tightly, whereas the openGL default is
-            # 4-byte-aligned.  Fix line alignment to 1 byte so odd-sized
-            # textures load right.
-            GL.glPixelStorei(GL.GL_UNPACK_ALIGNMENT, 1)
+    def initGL(self, gls):
+        # Tile textures are shared between all images of the context, within
+        # its texture budget
+        self.__textures = gls.texture_cache
+        self.__stats = gls.frame_stats
 
-            # Download the data to the buffer. cv2 stores data in BGR format
-            GL.glTexImage2D(
-                GL.GL_TEXTURE_2D,
-                0,
-                GL.GL_RGB,
-                self.im.shape[1],
-                self.im.shape[0],
-                0,
-                GL.GL_BGR,
-                GL.GL_UNSIGNED_BYTE,
-                self.im.ctypes.data_as(ctypes.POINTER(ctypes.c_uint8)),
-            )
+        # Partial uploads belonged to an earlier context
+        self.__uploads = OrderedDict()
 
-        self.prog = gls.shader_cache.get("image_vert", "image_frag")
+        self.prog = gls.shader_cache.get("tile_vert", "tile_frag")
 
         ar = numpy.ndarray(
             4, dtype=[("vertex", numpy.float32, 2), ("texpos", numpy.float32, 2)]
         )
 
-        sca = max(self.im.shape[0], self.im.shape[1])
-        x = self.im.shape[1] / float(sca)
-        y = self.im.shape[0] / float(sca)
-        ar["vertex"] = [(-x, -y), (-x, y), (x, -y), (x, y)]
+        # A unit quad, placed over each tile by the tile's matrix
+        ar["vertex"] = [(0, 0), (0, 1), (1, 0), (1, 1)]
         ar["texpos"] = [(0, 0), (0, 1), (1, 0), (1, 1)]
 
         self.b1 = vbobind(self.prog, ar.dtype, "vertex")
@@ -66,14 +78,226 @@ class ImageView(object):
         self.vbo = VBO(ar, GL.GL_STATIC_DRAW, GL.GL_ARRAY_BUFFER)
 
         self.mat_loc = GL.glGetUniformLocation(self.prog, "mat")
+        self.texrect_loc = GL.glGetUniformLocation(self.prog, "texrect")
         self.tex1_loc = GL.glGetUniformLocation(self.prog, "tex1")
+        self.alpha_loc = GL.glGetUniformLocation(self.prog, "alpha")
 
         self.vao = VAO()
         with self.vbo, self.vao:
             self.b1.assign()
             self.b2.assign()
 
+        self.pbo = GL.glGenBuffers(1)
+
+    def __texture_key(self, key):
+        # Keyed by the pyramid, layers showing the same image share tiles
+        return (self.pyramid.path,) + key
+
+    def __upload_rows(self, key, up, budget):
+        """
+        Upload the next rows of a tile, at most budget bytes of them unless a
+        single row is larger
+
+        :return: number of bytes uploaded
+        """
+        im = up.im
+        h, w = im.shape[:2]
+
+        if up.tex is None:
+            up.tex = Texture()
+            with up.tex.on(GL.GL_TEXTURE_2D):
+                GL.glTexParameteri(
+                    GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER, GL.GL_NEAREST
+                )
+                GL.glTexParameteri(
+                    GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER,
+                    GL.GL_LINEAR_MIPMAP_LINEAR
+                )
+
+                GL.glTexParameteri(
+                    GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_S, GL.GL_CLAMP_TO_EDGE
+                )
+                GL.glTexParameteri(
+                    GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_T, GL.GL_CLAMP_TO_EDGE
+                )
+
+                # Only allocated here, the rows follow
+                GL.glTexImage2D(
+                    GL.GL_TEXTURE_2D, 0, GL.GL_RGB, w, h, 0,
+                    GL.GL_BGR, GL.GL_UNSIGNED_BYTE, None,
+                )
+
+        rows = min(h - up.row, max(1, budget // (w * 3)))
+        band = numpy.ascontiguousarray(im[up.row:up.row + rows])
+
+        # Staged through the pixel buffer, the copy into the texture runs
+        # asynchronously to the draw calls that follow
+        GL.glBindBuffer(GL.GL_PIXEL_UNPACK_BUFFER, self.pbo)
+        GL.glBufferData(
+            GL.GL_PIXEL_UNPACK_BUFFER, band.nbytes, band, GL.GL_STREAM_DRAW
+        )
+
+        with up.tex.on(GL.GL_TEXTURE_2D):
+            # Numpy packs data tightly, whereas the openGL default is
+            # 4-byte-aligned.  Fix line alignment to 1 byte so odd-sized
+            # textures load right.
+            GL.glPixelStorei(GL.GL_UNPACK_ALIGNMENT, 1)
+
+            # cv2 stores data in BGR format. With a pixel buffer bound, the
+            # data argument is an offset into it.
+            GL.glTexSubImage2D(
+                GL.GL_TEXTURE_2D, 0, 0, up.row, w, rows,
+                GL.GL_BGR, GL.GL_UNSIGNED_BYTE, None,
+            )
+
+            up.row += rows
+            if up.row == h:
+                # Smooths out zoom levels between those of the pyramid
+                GL.glGenerateMipmap(GL.GL_TEXTURE_2D)
+
+        GL.glBindBuffer(GL.GL_PIXEL_UNPACK_BUFFER, 0)
+        self.__stats.upload("images", band.nbytes)
+
+        if up.row == h:
+            del self.__uploads[key]
+            self.__add_texture(key, up.tex, w * h * 4)
+
+        return band.nbytes
+
+    def __add_texture(self, key, tex, nbytes):
+        tkey = self.__texture_key(key)
+
+        # Another view of the same image may have got there first
+        if tkey in self.__textures:
+            GL.glDeleteTextures([tex])
+            return
+
+        # nbytes counts RGB plus a third for the mipmaps
+        self.__textures.get(tkey, lambda: tex, size=lambda _: nbytes)
+
+    def __load(self, keys):
+        """
+        Move the tiles in keys along from reading to uploading
+
+        :return: True if all of them are uploaded
+        """
+        for key, im in self.loader.collect():
+            if key in keys and key not in self.__uploads:
+                self.__uploads[key] = _TileUpload(im)
+
+        # Uploads that haven't started and are out of view are dropped
+        for key in [k for k, up in self.__uploads.items()
+                    if up.tex is None and k not in keys]:
+            del self.__uploads[key]
+
+        self.loader.retain(keys)
+
+        complete = True
+        for key in keys:
+            # Failed tiles are left to the coarser level drawn beneath
+            if self.__texture_key(key) in self.__textures or \
+                    self.loader.failed(key):
+                continue
+
+            complete = False
+            if key not in self.__uploads:
+                self.loader.request(key)
+
+        budget = UPLOAD_BYTES_PER_FRAME
+        for key, up in list(self.__uploads.items()):
+            if budget <= 0:
+                break
+            budget -= self.__upload_rows(key, up, budget)
+
+        return complete
+
+    def release(self):
+        """
+        Free the tile textures of the image
+        """
+        for up in self.__uploads.values():
+            if up.tex is not None:
+                GL.glDeleteTextures([up.tex])
+        self.__uploads.clear()
+
+        if self.__textures is not None and self.pyramid is not None:
+            path = self.pyramid.path
+            self.__textures.discard_where(lambda k: k[0] == path)
+
+    def __pixel_matrix(self):
+        """
+        :return: matrix mapping image pixels to the normalized image
+                 coordinates used by the transform matrix
+        """
+        p = self.pyramid
+        max_dim = float(max(p.width, p.height))
+        sf = 2. / max_dim
+        return numpy.array([
+            [sf, 0, -p.width / max_dim],
+            [0, sf, -p.height / max_dim],
+            [0, 0, 1],
+        ])
+
+    def __tile_matrix(self, key):
+        """
+        :return: matrix placing the unit quad over a tile, in image pixels
+        """
+        x0, y0, x1, y1 = self.pyramid.tile_rect(*key)
+        return numpy.array([
+            [x1 - x0, 0, x0],
+            [0, y1 - y0, y0],
+            [0, 0, 1],
+        ])
+
+    def __backdrop_rect(self, key):
+        """
+        :return: texrect of the part of the coarsest level, a single tile,
+                 that covers a tile
+        """
+        p = self.pyramid
+        x0, y0, x1, y1 = p.tile_rect(*key)
+        return (x0 / p.width, y0 / p.height,
+                (x1 - x0) / p.width, (y1 - y0) / p.height)
+
+    def __visible(self, pixel_to_clip):
+        """
+        :return: (rect, pixels per screen pixel) of the part of the image in
+                 the GL viewport
+        """
+        inv = numpy.linalg.inv(pixel_to_clip)
+        corners = inv.dot(numpy.array([
+            [-1, -1, 1, 1],
+            [-1, 1, -1, 1],
+            [1, 1, 1, 1],
+        ], dtype=numpy.float64))
+        xs = corners[0] / corners[2]
+        ys = corners[1] / corners[2]
+        rect = (xs.min(), ys.min(), xs.max(), ys.max())
+
+        _, _, vw, vh = GL.glGetIntegerv(GL.GL_VIEWPORT)
+        to_screen = numpy.diag([vw / 2., vh / 2.]).dot(pixel_to_clip[:2, :2])
+        screen_pixels = numpy.linalg.svd(to_screen, compute_uv=False).max()
+
+        return rect, 1. / screen_pixels
+
+    def __draw(self, pixel_to_clip, key, tex, texrect):
+        mat = pixel_to_clip.dot(self.__tile_matrix(key))
+        GL.glUniformMatrix3fv(self.mat_loc, 1, True, mat.astype(numpy.float32))
+        GL.glUniform4f(self.texrect_loc, *texrect)
+        with tex.on(GL.GL_TEXTURE_2D):
+            GL.glDrawArrays(GL.GL_TRIANGLE_STRIP, 0, 4)
+        self.__stats.draw("images")
+
     def render(self, viewPort):
+        """
+        :return: True if the image was drawn at full detail, False if it is
+                 still loading or fading in and the view should be redrawn
+        """
+        p = self.pyramid
+        if p is None:
+            # Nothing more will come of an image that failed to open
+            return self.loader.pyramid_failed
+
         m_pre = self.mat
         if self.mat is None:
             m_pre = self.il.transform_matrix
@@ -82,14 +306,40 @@ class ImageView(object):
         flip_y = pcbre.matrix.flip(1)
         m_pre = m_pre.dot(flip_y)
 
-        mat = viewPort.dot(m_pre)
+        pixel_to_clip = viewPort.dot(m_pre).dot(self.__pixel_matrix())
+
+        rect, scale = self.__visible(pixel_to_clip)
+        coarsest = (p.levels - 1, 0, 0)
+        level = p.level_for_scale(scale)
+
+        keys = [(level, tx, ty) for tx, ty in p.visible_tiles(level, rect)]
+        complete = self.__load(set(keys + [coarsest]))
+
+        # Nothing is drawn until the coarsest level is there to stand in for
+        # the rest
+        backdrop = self.__textures.get(self.__texture_key(coarsest))
+        if backdrop is None:
+            return self.loader.failed(coarsest)
+
+        now = time.monotonic()
+        if self.__shown_at is None:
+            self.__shown_at = now
+        alpha = min(1., (now - self.__shown_at) / FADE_SECONDS)
 
         GL.glActiveTexture(GL.GL_TEXTURE0)
-        with self.prog, self._tex.on(GL.GL_TEXTURE_2D), self.vao:
-            GL.glUniformMatrix3fv(self.mat_loc, 1, True, mat.astype(numpy.float32))
+        with self.prog, self.vao:
             GL.glUniform1i(self.tex1_loc, 0)
+            GL.glUniform1f(self.alpha_loc, alpha)
 
-            GL.glDrawArrays(GL.GL_TRIANGLE_STRIP, 0, 4)
+            for key in keys:
+                tex = self.__textures.get(self.__texture_key(key))
+                if tex is not None:
+                    self.__draw(pixel_to_clip, key, tex, _FULL_TEXTURE)
+                else:
+                    self.__draw(pixel_to_clip, key, backdrop,
+                                self.__backdrop_rect(key))
+
+        return complete and alpha == 1.
 
     def tfI2W(self, pt):
         x_, y_, t_ = self.il.transform_matrix.dot([pt[0], pt[1], 1.])
@@ -2,16 +2,17 @@ import math
 import numpy
 import ctypes
 import weakref
-from collections import defaultdict
+from collections import defaultdict, deque
 
 from OpenGL import GL
 from OpenGL.arrays.vbo import VBO
 
 from pcbre.matrix import Rect, translate, rotate, Point2, scale, Vec2
+from pcbre.model.artwork_geom import Trace
 from pcbre.ui.gl import VAO, vbobind, glimports as GLI
 
 from .rendersettings import RENDER_STANDARD, RENDER_OUTLINES, RENDER_SELECTED
-from .util import get_consolidated_draws_1
+from .util import get_consolidated_draws_np
 
 
 NUM_ENDCAP_SEGMENTS = 32
@@ -21,18 +22,312 @@ FIRST_LINE_LOOP = NUM_ENDCAP_SEGMENTS * 2 + 2
 LINE_LOOP_SIZE = NUM_ENDCAP_SEGMENTS * 2
 
 
+# Instance slots a layer starts out with. The buffer doubles when full.
+INITIAL_INSTANCE_SLOTS = 1024
+
+
+class TraceInstances:
+    """
+    Instance data of the traces on one layer, kept between frames so that
+    only the slots that change need to be uploaded.
+
+    Each trace is given a slot the first time it's drawn, and keeps it until
+    it is released or the trace is garbage collected. Freed slots are zeroed,
+    which draws nothing, and handed out again to later traces.
+    """
+
+    def __init__(self, dtype, capacity=INITIAL_INSTANCE_SLOTS):
+        self.array = numpy.zeros(capacity, dtype=dtype)
+
+        # Slots below high have been handed out at some point
+        self.high = 0
+
+        self.__slot_of = {}
+        self.__free = []
+        self.__dirty = []
+
+        # Whole array needs to be uploaded, because it was (re)allocated
+        self.__resized = True
+
+        # Filled by weakref callbacks, which may run on any thread
+        self.__dead = deque()
+
+    def __len__(self):
+        """
+        :return: number of slots in use
+        """
+        return len(self.__slot_of)
+
+    def __died(self, ref):
+        self.__dead.append(ref)
+
+    def __free_slot(self, slot):
+        self.array[slot] = 0
+        self.__free.append(slot)
+        self.__dirty.append(slot)
+
+    def __collect(self):
+        while self.__dead:
+            self.__free_slot(self.__slot_of.pop(self.__dead.popleft()))
+
+    def __allocate(self):
+        if self.__free:
+            return self.__free.pop()
+
+        if self.high == len(self.array):
+            grown = numpy.zeros(len(self.array) * 2, dtype=self.array.dtype)
+            grown[: self.high] = self.array
+            self.array = grown
+            self.__resized = True
+
+        self.high += 1
+        return self.high - 1
+
+    def slot(self, trace, selected=False):
+        """
+        :param trace: trace to be drawn
+        :param selected: whether the trace is drawn as selected
+        :return: slot of the trace's instance data
+        """
+        self.__collect()
+
+        # References compare and hash as their trace, so the plain ref finds
+        # the entry keyed by the one with the callback
+        slot = self.__slot_of.get(weakref.ref(trace))
+        if slot is None:
+            slot = self.__allocate()
+            self.__slot_of[weakref.ref(trace, self.__died)] = slot
+            self.array[slot] = (trace.p0, trace.p1, trace.thickness / 2, selected)
+            self.__dirty.append(slot)
+
+        elif bool(self.array["selected"][slot]) != selected:
+            self.array["selected"][slot] = selected
+            self.__dirty.append(slot)
+
+        return slot
+
+    def set_selected(self, trace, selected):
+        """
+        Update the selected flag of a trace that has a slot
+
+        :return: True if the flag changed
+        """
+        slot = self.__slot_of.get(weakref.ref(trace))
+        if slot is None or bool(self.array["selected"][slot]) == selected:
+            return False
+
+        self.array["selected"][slot] = selected
+        self.__dirty.append(slot)
+        return True
+
+    def release(self, trace):
+        """
+        Free the slot of trace now, rather than once the trace is collected.
+        Removed traces are often still referenced, by the undo stack for one.
+
+        :return: True if trace had a slot
+        """
+        # Dropping the key drops its callback along with it
+        slot = self.__slot_of.pop(weakref.ref(trace), None)
+        if slot is None:
+            return False
+
+        self.__free_slot(slot)
+        return True
+
+    def take_dirty(self):
+        """
+        :return: (resized, ranges). If resized the whole array needs to be
+                 uploaded, otherwise the (first, last) ranges of slots changed
+                 since the last call.
+        """
+        self.__collect()
+
+        resized = self.__resized
+        ranges = [] if resized else get_consolidated_draws_np(self.__dirty)
+
+        self.__resized = False
+        self.__dirty = []
+
+        return resized, ranges
+
+
 class _TraceRenderBatch:
+    """
+    Persistent GPU buffer of the instance data of one layer's traces.
+
+    The board's traces are set as a scene, which stays drawn from frame to
+    frame until it is replaced. Other traces, such as those of pads, are
+    deferred for a single frame.
+    """
+
     def __init__(self, parent):
         self.parent = parent
+        self.instances = TraceInstances(parent.instance_dtype)
+
+        self.scene_key = None
+        self.__scene = []
+        self.__scene_slots = numpy.zeros(0, dtype=numpy.int64)
+        self.__scene_ranges = None
+
+        self.filled = []
+        self.outline = []
+        self.selected = []
+
+    @property
+    def empty(self):
+        """
+        :return: True if there's nothing to draw in the prepared frame
+        """
+        return not self.filled and not self.outline
+
+    def set_scene(self, traces, key, selected):
+        """
+        :param traces: traces of the layer to draw every frame
+        :param key: identifies the scene, traces are only taken again once it
+                    changes
+        :param selected: set of the selected traces
+        """
+        if key == self.scene_key:
+            return
+
+        self.scene_key = key
+
+        # Held so that the slots aren't freed while drawn
+        self.__scene = list(traces)
+
+        slot = self.instances.slot
+        self.__scene_slots = numpy.array(
+            [slot(t, t in selected) for t in self.__scene], dtype=numpy.int64
+        )
+        self.__scene_ranges = None
+
+    def select(self, trace, selected):
+        if self.instances.set_selected(trace, selected):
+            self.__scene_ranges = None
+
+    def release(self, trace):
+        if self.instances.release(trace):
+            # The scene can't keep drawing a slot that may be handed out again
+            self.scene_key = None
+            self.__scene_ranges = None
+
+    def __get_scene_ranges(self):
+        """
+        :return: (filled, selected) draw ranges of the scene
+        """
+        if self.__scene_ranges is None:
+            slots = self.__scene_slots
+            sel = self.instances.array["selected"][slots] > 0.5
+            self.__scene_ranges = (
+                get_consolidated_draws_np(slots),
+                get_consolidated_draws_np(slots[sel]),
+            )
+
+        return self.__scene_ranges
 
     def _initializeGL(self):
-        pass
+        self.buffer = GL.glGenBuffers(1)
+
+        # Trace geometry is shared, instance data is the batch's own
+        self.vao = VAO()
+        with self.vao, self.parent.trace_vbo:
+            self.parent._bind_geometry()
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.buffer)
+            self.parent._base_rebind(0)
+            self.parent.index_vbo.bind()
+
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+
+    def _upload(self):
+        resized, ranges = self.instances.take_dirty()
+        array = self.instances.array
+
+        stats = self.parent.frame_stats
+
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.buffer)
+        if resized:
+            GL.glBufferData(
+                GL.GL_ARRAY_BUFFER, array.nbytes, array, GL.GL_DYNAMIC_DRAW
+            )
+            stats.upload("traces", array.nbytes)
+        else:
+            for first, last in ranges:
+                stats.upload("traces", (last - first) * array.itemsize)
+                GL.glBufferSubData(
+                    GL.GL_ARRAY_BUFFER,
+                    first * array.itemsize,
+                    (last - first) * array.itemsize,
+                    array[first:last],
+                )
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+
+    def prepare(self, trace_settings):
+        """
+        Assign slots to the traces deferred for this frame, upload those
+        that changed and work out the draw ranges
+        """
+        instances = self.instances
+
+        if not trace_settings:
+            # Nothing but the scene, whose ranges are kept until it or its
+            # selection changes
+            self._upload()
+            self.filled, self.selected = self.__get_scene_ranges()
+            self.outline = []
+            return
+
+        filled = []
+        outline = []
+        selected = []
+
+        for trace, rs in trace_settings:
+            is_selected = bool(rs & RENDER_SELECTED)
+            slot = instances.slot(trace, is_selected)
+            if rs & RENDER_OUTLINES:
+                outline.append(slot)
+            else:
+                filled.append(slot)
+                if is_selected:
+                    selected.append(slot)
+
+        self._upload()
+
+        scene = self.__scene_slots
+        filled = numpy.unique(numpy.concatenate(
+            (scene, numpy.array(filled, dtype=numpy.int64))
+        ))
+        if len(filled) == len(instances):
+            # Everything is drawn, freed slots in between are degenerate
+            self.filled = [(0, instances.high)]
+        else:
+            self.filled = get_consolidated_draws_np(filled)
+
+        scene_selected = scene[self.instances.array["selected"][scene] > 0.5]
+        self.outline = get_consolidated_draws_np(outline)
+        self.selected = get_consolidated_draws_np(
+            numpy.concatenate((scene_selected, numpy.array(selected, dtype=numpy.int64)))
+        )
 
 
 class TraceRender:
     def __init__(self, parent_view):
         self.parent = parent_view
 
+        self.instance_dtype = numpy.dtype(
+            [
+                ("pos_a", numpy.float32, 2),
+                ("pos_b", numpy.float32, 2),
+                ("thickness", numpy.float32),
+                ("selected", numpy.float32),
+            ]
+        )
+
+        self.__batches = {}
+
+        # Selected traces of the scene, maintained by select()
+        self.__selected = weakref.WeakSet()
+
         self.restart()
 
     def __initialize_uniform(self, gls):
@@ -58,11 +353,12 @@ class TraceRender:
         # the geometry is associated with
         self.__build_trace()
 
-        self.__attribute_shader_vao = VAO()
         self.__attribute_shader = gls.shader_cache.get(
             "line_vertex_shader", "frag1", defines={"INPUT_TYPE": "in"}
         )
 
+        self.frame_stats = gls.frame_stats
+
         # Now we build an index buffer that allows us to render filled geometry
         # from the same VBO.
         arr = []
@@ -86,52 +382,42 @@ class TraceRender:
         arr = numpy.array(arr, dtype=numpy.uint32)
         self.index_vbo = VBO(arr, target=GL.GL_ELEMENT_ARRAY_BUFFER)
 
-        self.instance_dtype = numpy.dtype(
-            [
-                ("pos_a", numpy.float32, 2),
-                ("pos_b", numpy.float32, 2),
-                ("thickness", numpy.float32, 1),
-                # ("color", numpy.float32, 4)
-            ]
+        self.__bind_vertex = vbobind(
+            self.__attribute_shader, self.trace_vbo.dtype, "lvertex"
+        )
+        self.__bind_ptid = vbobind(
+            self.__attribute_shader, self.trace_vbo.dtype, "ptid"
         )
 
-        # Use a fake array to get a zero-length VBO for initial binding
-        instance_array = numpy.ndarray(0, dtype=self.instance_dtype)
-        self.instance_vbo = VBO(instance_array)
-
-        with self.__attribute_shader_vao, self.trace_vbo:
-            vbobind(self.__attribute_shader, self.trace_vbo.dtype, "vertex").assign()
-            vbobind(self.__attribute_shader, self.trace_vbo.dtype, "ptid").assign()
+        self.__bind_instance = [
+            vbobind(self.__attribute_shader, self.instance_dtype, name, div=1)
+            for name in ("pos_a", "pos_b", "thickness", "selected")
+        ]
 
-        with self.__attribute_shader_vao, self.instance_vbo:
-            self.__bind_pos_a = vbobind(
-                self.__attribute_shader, self.instance_dtype, "pos_a", div=1
-            )
-            self.__bind_pos_b = vbobind(
-                self.__attribute_shader, self.instance_dtype, "pos_b", div=1
-            )
-            self.__bind_thickness = vbobind(
-                self.__attribute_shader, self.instance_dtype, "thickness", div=1
-            )
-            # vbobind(self.__attribute_shader, self.instance_dtype, "color",
-            #   div=1).assign()
-            self.__base_rebind(0)
+        self.__initialize_uniform(gls)
 
-            self.index_vbo.bind()
+        # Buffers of the previous context are gone, along with what was in
+        # them
+        self.__batches = {}
 
-        self.__initialize_uniform(gls)
+    def _bind_geometry(self):
+        self.__bind_vertex.assign()
+        self.__bind_ptid.assign()
 
-        self.__last_prepared = weakref.WeakKeyDictionary()
+    def _base_rebind(self, base):
+        for b in self.__bind_instance:
+            b.assign(base)
 
-    def __base_rebind(self, base):
-        self.__bind_pos_a.assign(base)
-        self.__bind_pos_b.assign(base)
-        self.__bind_thickness.assign(base)
+    def __batch(self, layer):
+        batch = self.__batches.get(layer)
+        if batch is None:
+            batch = self.__batches[layer] = _TraceRenderBatch(self)
+            batch._initializeGL()
+        return batch
 
     def restart(self):
         self.__deferred_layer = defaultdict(list)
         self.__prepared = False
-        self.__needs_rebuild = False
 
     def __build_trace(self):
         # Update trace VBO
@@ -165,88 +451,101 @@ class TraceRender:
             tr |= render_settings
             self.deferred(t, tr)
 
-    def deferred(self, trace, render_settings, render_hint):
-        assert not self.__prepared
-        self.__deferred_layer[trace.layer].append((trace, render_settings))
-        if trace not in self.__last_prepared:
-            self.__needs_rebuild = True
+    def set_scene(self, layer, traces, key):
+        """
+        Set the traces of layer that are drawn every frame, until replaced.
+        Their selection state is kept up to date by select().
 
-    def prepare(self):
+        :param key: identifies the scene, traces are only taken again once it
+                    changes
         """
-        Build VBOs and information for rendering pass.
+        self.__batch(layer).set_scene(traces, key, self.__selected)
+
+    def select(self, geoms, selected):
         """
-        self.__prepared = True
+        Mark the traces among geoms as selected or not
 
-        if not self.__needs_rebuild:
-            return
+        :param geoms: changed artwork of any type
+        """
+        for t in geoms:
+            if not isinstance(t, Trace):
+                continue
 
-        self.__last_prepared = weakref.WeakKeyDictionary()
+            if selected:
+                self.__selected.add(t)
+            else:
+                self.__selected.discard(t)
 
-        # Total trace count, across all layers
-        count = sum(len(i) for i in self.__deferred_layer.values())
+            batch = self.__batches.get(t.layer)
+            if batch is not None:
+                batch.select(t, selected)
 
-        # Allocate an array of that size
-        instance_array = numpy.ndarray(count, dtype=self.instance_dtype)
+    def artwork_added(self, aw):
+        pass
 
-        pos = 0
-        for layer, traces in self.__deferred_layer.items():
-            # We reorder the traces to batch them by outline, and net to
-            # encourage maximum draw call length. The rationale is that nets
-            # are commonly selected or may be commonly drawn in different
-            # colors.
-            traces = sorted(
-                traces, key=lambda i: (i[1] & RENDER_OUTLINES, id(i[0].net))
-            )
+    def artwork_removed(self, aw):
+        """
+        Free the instance slot of a trace removed from the board
+        """
+        if not isinstance(aw, Trace):
+            return
+
+        self.__selected.discard(aw)
 
-            for trace, _ in traces:
-                # Now insert into the array
-                instance_array[pos] = (trace.p0, trace.p1, trace.thickness / 2)
+        batch = self.__batches.get(aw.layer)
+        if batch is not None:
+            batch.release(aw)
 
-                # And memoize where the trace occurs
-                self.__last_prepared[trace] = pos
+    def deferred(self, trace, render_settings, render_hint):
+        assert not self.__prepared
+        self.__deferred_layer[trace.layer].append((trace, render_settings))
+
+    def prepare(self):
+        """
+        Upload the instance data of new and changed traces, and work out what
+        to draw of each layer for the rendering pass.
+        """
+        self.__prepared = True
 
-                pos += 1
+        for layer in self.__deferred_layer:
+            self.__batch(layer)
 
-        err = GL.glGetError()
-        if err != GL.GL_NO_ERROR:
-            print(err)
+        for layer, batch in self.__batches.items():
+            batch.prepare(self.__deferred_layer.get(layer))
 
-        # Force full resend of VBO
-        self.instance_vbo.data = instance_array
-        self.instance_vbo.size = None
-        self.instance_vbo.copied = False
-        self.instance_vbo.bind()
+    def __draw_ranges(self, batch, ranges, is_outline):
+        for first, last in ranges:
+            # No base instance support, so point the instance attributes at
+            # the first instance of the range instead
+            self._base_rebind(first)
+            self.frame_stats.draw("traces", last - first)
+            if not is_outline:
+                GL.glDrawElementsInstanced(
+                    GL.GL_TRIANGLES,
+                    TRIANGLES_SIZE,
+                    GL.GL_UNSIGNED_INT,
+                    ctypes.c_void_p(0),
+                    last - first,
+                )
+            else:
+                # We reuse the vertex data for the outside
+                GL.glDrawArraysInstanced(
+                    GL.GL_LINE_LOOP, 2, NUM_ENDCAP_SEGMENTS * 2, last - first,
+                )
 
     def render_deferred_layer(self, mat, layer):
         if not self.__prepared:
             self.prepare()
 
-        trace_settings = self.__deferred_layer[layer]
-
-        count = len(trace_settings)
-        if count == 0:
+        batch = self.__batches.get(layer)
+        if batch is None or batch.empty:
             return
 
-        # key format: is_selected, is_outline
-        draw_bins = defaultdict(list)
-        draw_range_bins = dict()
-
-        # Bin the traces by draw call
-        for t, tr in trace_settings:
-            is_selected = bool(tr & RENDER_SELECTED)
-            is_outline = bool(tr & RENDER_OUTLINES)
-            draw_bins[is_selected, is_outline].append(self.__last_prepared[t])
-
-        # Build draw ranges
-        for key, bin in draw_bins.items():
-            draw_range_bins[key] = get_consolidated_draws_1(draw_bins[key])
-
         # HACK / Fixme: Precalculate selected / nonselected colors
         color_a = self.parent.color_for_layer(layer) + [1]
         color_sel = self.parent.sel_colormod(True, color_a)
 
-        has_base_instance = False
-        with self.__attribute_shader, self.__attribute_shader_vao:
+        with self.__attribute_shader, batch.vao:
             # Setup overall calls
             GL.glUniformMatrix3fv(
                 self.__attribute_shader.uniforms.mat,
@@ -254,68 +553,20 @@ class TraceRender:
                 True,
                 mat.ctypes.data_as(GLI.c_float_p),
             )
+            GL.glUniform4f(self.__attribute_shader.uniforms.color, *color_a)
+            GL.glUniform4f(self.__attribute_shader.uniforms.color_sel, *color_sel)
 
-            # We order the draw calls such that selected areas are drawn on top
-            # of nonselected.
-            sorted_kvs = sorted(draw_range_bins.items(), key=lambda i: i[0][0])
-            for (is_selected, is_outline), ranges in sorted_kvs:
-                if is_selected:
-                    color = color_sel
-                else:
-                    color = color_a
-
-                GL.glUniform4f(self.__attribute_shader.uniforms.color, *color)
-
-                if has_base_instance:
-                    # Many instances backport
-                    # glDrawElementsInstancedBaseInstance. This is faster than
-                    # continually rebinding, so support if possible.
-                    if not is_outline:
-                        for first, last in ranges:
-                            # filled traces come first in the array
-                            GL.glDrawElementsInstancedBaseInstance(
-                                GL.GL_TRIANGLES,
-                                TRIANGLES_SIZE,
-                                GL.GL_UNSIGNED_INT,
-                                ctypes.c_void_p(0),
-                                last - first,
-                                first,
-                            )
-                    else:
-                        for first, last in ranges:
-                            # Then outline traces. We reuse the vertex data for
-                            # the outside
-                            GL.glDrawArraysInstancedBaseInstance(
-                                GL.GL_LINE_LOOP,
-                                2,
-                                NUM_ENDCAP_SEGMENTS * 2,
-                                last - first,
-                                first,
-                            )
-                else:
-                    with self.instance_vbo:
-                        if not is_outline:
-                            for first, last in ranges:
-                                # filled traces come first in the array
-                                self.__base_rebind(first)
-                                GL.glDrawElementsInstanced(
-                                    GL.GL_TRIANGLES,
-                                    TRIANGLES_SIZE,
-                                    GL.GL_UNSIGNED_INT,
-                                    ctypes.c_void_p(0),
-                                    last - first,
-                                )
-                        else:
-                            for first, last in ranges:
-                                self.__base_rebind(first)
-                                # Then outline traces. We reuse the vertex data
-                                # for the outside
-                                GL.glDrawArraysInstanced(
-                                    GL.GL_LINE_LOOP,
-                                    2,
-                                    NUM_ENDCAP_SEGMENTS * 2,
-                                    last - first,
-                                )
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, batch.buffer)
+
+            self.__draw_ranges(batch, batch.filled, False)
+
+            # Selected traces are drawn again so that they end up on top of
+            # nonselected ones
+            self.__draw_ranges(batch, batch.selected, False)
+
+            self.__draw_ranges(batch, batch.outline, True)
+
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
 
     # Immediate-mode render of a single trace. SLOW for bulk-rendering, but
     # useful for rendering UI elements.
@@ -336,7 +587,10 @@ class TraceRender:
                 mat.ctypes.data_as(GLI.c_float_p),
             )
             GL.glUniform4f(self.__uniform_shader.uniforms.color, *color_a)
+            GL.glUniform4f(self.__uniform_shader.uniforms.color_sel, *color_a)
+            GL.glUniform1f(self.__uniform_shader.uniforms.selected, 0)
 
+            self.frame_stats.draw("traces")
             if render_settings & RENDER_OUTLINES:
                 GL.glDrawArrays(GL.GL_LINE_LOOP, 2, NUM_ENDCAP_SEGMENTS * 2)
             else:
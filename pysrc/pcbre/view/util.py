@@ -1,3 +1,5 @@
+import numpy
+
 __author__ = "davidc"
 
 
@@ -60,3 +62,23 @@ def get_consolidated_draws_1(dl):
     consolidated.append((current_first, current_last))
 
     return consolidated
+
+
+def get_consolidated_draws_np(indices):
+    """
+    Vectorized get_consolidated_draws_1, for large arrays of indicies
+
+    :param indices: array-like of indicies, in any order and possibly repeated
+    :return: list[tuple[first, last]], first inclusive and last exclusive
+    """
+    indices = numpy.unique(numpy.asarray(indices, dtype=numpy.int64))
+    if not len(indices):
+        return []
+
+    # Positions where a run of consecutive indicies ends
+    breaks = numpy.flatnonzero(numpy.diff(indices) != 1)
+
+    firsts = indices[numpy.concatenate(([0], breaks + 1))]
+    lasts = indices[numpy.concatenate((breaks, [len(indices) - 1]))] + 1
+
+    return list(zip(firsts.tolist(), lasts.tolist()))
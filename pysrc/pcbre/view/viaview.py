@@ -14,75 +14,238 @@ from pcbre.view.rendersettings import (
 
 # from pcbre.matrix import Rect, translate, rotate, Point2, scale, Vec2
 from pcbre.ui.gl import VAO, vbobind, glimports as GLI
+from pcbre.view.util import get_consolidated_draws_np
 
 __author__ = "davidc"
 
 
 N_OUTLINE_SEGMENTS = 100
 
+# Instance slots a via pair batch starts out with. It doubles when full.
+INITIAL_VIA_SLOTS = 1024
+
+# Color of vias not drawn in a layer color
+VIA_COLOR = [0.6, 0.6, 0.6, 1]
+
 
 class ViaBoardBatcher:
     """
-    The ViaBoardBatcher manages via draw batches (per-layer). It automatically
-    updates the draw batches on-demand and only when necessary.
+    The ViaBoardBatcher manages via draw batches (per via pair). It keeps the
+    batches between frames, and only updates the vias that were added,
+    removed, selected or deselected since the last frame. Additions and
+    removals are reported by the artwork, so no frame has to look at every
+    via on the board.
     """
 
     def __init__(self, via_renderer, project):
         self.project = project
         self.renderer = via_renderer
-        self.batches = []
         self.__batch_for_vp = {}
+        self.__batch_for_via = {}
+        self.__via_pairs = None
         self.__selected_set = set()
-        self.__last_via_generation = None
 
-    def update_if_necessary(self, selection_list):
-        # Evaluate if we need to redraw
-        redraw = False
+        # Vias added (True) or removed (False) since the last frame, as
+        # reported by the artwork
+        self.__pending = {}
+        project.artwork.add_listener(self)
 
-        # Todo: check via_pairs the same
+    def __color(self, selected):
+        return self.renderer.parent.sel_colormod(selected, VIA_COLOR)
 
-        if self.__last_via_generation != self.project.artwork.vias_generation:
-            redraw = True
+    def __rebuild(self, via_pairs):
+        # One batch per via_pair
+        self.__via_pairs = via_pairs
+        self.__batch_for_vp = {vp: self.renderer.viapair_batch() for vp in via_pairs}
+        self.__batch_for_via = {}
 
-        via_sel_list = set(i for i in selection_list if isinstance(i, Via))
-        if via_sel_list != self.__selected_set:
-            redraw = True
+        self.__pending = {}
+        for via in self.project.artwork.vias:
+            self.__add(via)
 
-        # if not redraw:
-        #     return
+    def __add(self, via):
+        batch = self.__batch_for_vp[via.viapair]
+        batch.add(via, self.__color(via in self.__selected_set))
+        self.__batch_for_via[via] = batch
 
-        print("redraw vias")
+    def artwork_added(self, aw):
+        if isinstance(aw, Via):
+            self.__pending[aw] = True
 
-        self.__last_via_generation = self.project.artwork.vias_generation
-        self.__selected_set = via_sel_list
+    def artwork_removed(self, aw):
+        if isinstance(aw, Via):
+            self.__pending[aw] = False
 
-        # One batch per via_pair
-        while len(self.batches) < len(self.project.stackup.via_pairs):
-            self.batches.append(self.renderer.batch())
+            # Not held on to, and not drawn selected if restored by undo
+            self.__selected_set.discard(aw)
 
-        # Clear the batches and create a new batch<->viapair mapping
-        self.__batch_for_vp = {}
-        for i, vp in zip(self.batches, self.project.stackup.via_pairs):
-            i.restart()
-            self.__batch_for_vp[vp] = i
+    def select(self, geoms, selected):
+        """
+        Mark the vias among geoms as selected or not. Only those vias are
+        recolored.
 
-        # Batch vias by viapair
-        for via in self.project.artwork.vias:
-            self.__batch_for_vp[via.viapair].deferred(
-                via.pt,
-                via.r,
-                0,
-                RENDER_SELECTED if via in via_sel_list else 0,
-                RENDER_HINT_NORMAL,
-            )
+        :param geoms: changed artwork of any type
+        """
+        for via in geoms:
+            if not isinstance(via, Via):
+                continue
+
+            if selected:
+                self.__selected_set.add(via)
+            else:
+                self.__selected_set.discard(via)
+
+            batch = self.__batch_for_via.get(via)
+            if batch is not None:
+                batch.set_color(via, self.__color(selected))
+
+    def update_if_necessary(self):
+        via_pairs = list(self.project.stackup.via_pairs)
+        if self.__via_pairs is None or len(via_pairs) != len(self.__via_pairs) or \
+                any(a is not b for a, b in zip(via_pairs, self.__via_pairs)):
+            self.__rebuild(via_pairs)
 
-        for i in self.batches:
-            i.prepare()
+        pending, self.__pending = self.__pending, {}
+        for via, added in pending.items():
+            if added and via not in self.__batch_for_via:
+                self.__add(via)
+            elif not added and via in self.__batch_for_via:
+                self.__batch_for_via.pop(via).remove(via)
+
+        for batch in self.__batch_for_vp.values():
+            batch.prepare()
 
     def render_viapair(self, mat, viapair):
         self.__batch_for_vp[viapair].render_filled(mat)
 
 
+class _ViaPairBatch:
+    """
+    Filled vias of one via pair, kept in a GPU buffer between frames. Each via
+    has a slot in the buffer, and only slots that changed are uploaded. Freed
+    slots have a zero radius, which draws nothing, and are reused.
+    """
+
+    def __init__(self, parent):
+        self.parent = parent
+        self.array = numpy.zeros(INITIAL_VIA_SLOTS, dtype=parent._filled_instance_dtype)
+
+        # Slots below high have been handed out at some point
+        self.high = 0
+
+        self.__slot_of = {}
+        self.__free = []
+        self.__dirty = []
+        self.__resized = True
+
+        self.initialized = False
+
+    def __len__(self):
+        return len(self.__slot_of)
+
+    def _initializeGL(self):
+        self.initialized = True
+
+        self.__buffer = GL.glGenBuffers(1)
+        self.__vao = VAO()
+
+        with self.__vao, self.parent._sq_vbo:
+            vbobind(
+                self.parent._filled_shader, self.parent._sq_vbo.data.dtype, "vertex"
+            ).assign()
+
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.__buffer)
+        with self.__vao:
+            for name in ("pos", "r", "r_inside_frac_sq", "color"):
+                vbobind(
+                    self.parent._filled_shader,
+                    self.parent._filled_instance_dtype,
+                    name,
+                    div=1,
+                ).assign()
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+
+        # Whole array is uploaded into the new buffer
+        self.__resized = True
+
+    def add(self, via, color):
+        if self.__free:
+            slot = self.__free.pop()
+        else:
+            if self.high == len(self.array):
+                grown = numpy.zeros(len(self.array) * 2, dtype=self.array.dtype)
+                grown[: self.high] = self.array
+                self.array = grown
+                self.__resized = True
+
+            slot = self.high
+            self.high += 1
+
+        self.__slot_of[via] = slot
+        self.array[slot] = (via.pt, via.r, 0, color)
+        self.__dirty.append(slot)
+
+    def remove(self, via):
+        slot = self.__slot_of.pop(via)
+        self.array[slot] = 0
+        self.__free.append(slot)
+        self.__dirty.append(slot)
+
+    def set_color(self, via, color):
+        slot = self.__slot_of[via]
+        self.array["color"][slot] = color
+        self.__dirty.append(slot)
+
+    def prepare(self):
+        """
+        Upload the slots changed since the last call
+        """
+        if not self.initialized:
+            self._initializeGL()
+
+        if not self.__resized and not self.__dirty:
+            return
+
+        stats = self.parent.frame_stats
+
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.__buffer)
+        if self.__resized:
+            GL.glBufferData(
+                GL.GL_ARRAY_BUFFER, self.array.nbytes, self.array, GL.GL_DYNAMIC_DRAW
+            )
+            stats.upload("vias", self.array.nbytes)
+        else:
+            itemsize = self.array.itemsize
+            for first, last in get_consolidated_draws_np(self.__dirty):
+                stats.upload("vias", (last - first) * itemsize)
+                GL.glBufferSubData(
+                    GL.GL_ARRAY_BUFFER,
+                    first * itemsize,
+                    (last - first) * itemsize,
+                    self.array[first:last],
+                )
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+
+        self.__resized = False
+        self.__dirty = []
+
+    def render_filled(self, mat):
+        if not self.__slot_of:
+            return
+
+        with self.parent._filled_shader, self.__vao:
+            GL.glUniformMatrix3fv(
+                self.parent._filled_shader.uniforms.mat,
+                1,
+                True,
+                mat.ctypes.data_as(GLI.c_float_p),
+            )
+
+            # Freed slots in between are degenerate
+            GL.glDrawArraysInstanced(GL.GL_TRIANGLE_STRIP, 0, 4, self.high)
+            self.parent.frame_stats.draw("vias", self.high)
+
+
 class _THBatch:
     def __init__(self, parent):
         self.parent = parent
@@ -213,6 +376,7 @@ class _THBatch:
         self.filled_instance_vbo.size = None
         self.filled_instance_vbo.copied = False
         self.filled_instance_vbo.bind()
+        self.parent.frame_stats.upload("vias", instance_array.nbytes)
 
     def __prepare_outline(self):
         count = 0
@@ -247,6 +411,7 @@ class _THBatch:
         self.outline_instance_vbo.size = None
         self.outline_instance_vbo.copied = False
         self.outline_instance_vbo.bind()
+        self.parent.frame_stats.upload("vias", instance_array.nbytes)
 
     def render(self, mat):
         self.render_filled(mat)
@@ -266,6 +431,7 @@ class _THBatch:
             GL.glDrawArraysInstanced(
                 GL.GL_TRIANGLE_STRIP, 0, 4, len(self.__deferred_list_filled)
             )
+            self.parent.frame_stats.draw("vias", len(self.__deferred_list_filled))
 
     def render_outline(self, mat):
         if self.__outline_count == 0:
@@ -281,6 +447,7 @@ class _THBatch:
             GL.glDrawArraysInstanced(
                 GL.GL_LINE_LOOP, 0, N_OUTLINE_SEGMENTS, self.__outline_count
             )
+            self.parent.frame_stats.draw("vias", self.__outline_count)
 
 
 class THRenderer:
@@ -288,12 +455,36 @@ class THRenderer:
         self.parent = parent_view
         self.__batches = weakref.WeakSet()
 
+        self._filled_instance_dtype = numpy.dtype(
+            [
+                ("pos", numpy.float32, 2),
+                ("r", numpy.float32, 1),
+                ("r_inside_frac_sq", numpy.float32, 1),
+                ("color", numpy.float32, 4),
+            ]
+        )
+
+        self._outline_instance_dtype = numpy.dtype(
+            [
+                ("pos", numpy.float32, 2),
+                ("r", numpy.float32, 1),
+                ("color", numpy.float32, 4),
+            ]
+        )
+
     def batch(self):
         batch = _THBatch(self)
         self.__batches.add(batch)
         return batch
 
+    def viapair_batch(self):
+        batch = _ViaPairBatch(self)
+        self.__batches.add(batch)
+        return batch
+
     def initializeGL(self, glshared):
+        self.frame_stats = glshared.frame_stats
+
         self._filled_shader = glshared.shader_cache.get(
             "via_filled_vertex_shader", "via_filled_fragment_shader"
         )
@@ -320,22 +511,5 @@ class THRenderer:
 
         self._outline_vbo = VBO(outline_points_array, GL.GL_STATIC_DRAW)
 
-        self._filled_instance_dtype = numpy.dtype(
-            [
-                ("pos", numpy.float32, 2),
-                ("r", numpy.float32, 1),
-                ("r_inside_frac_sq", numpy.float32, 1),
-                ("color", numpy.float32, 4),
-            ]
-        )
-
-        self._outline_instance_dtype = numpy.dtype(
-            [
-                ("pos", numpy.float32, 2),
-                ("r", numpy.float32, 1),
-                ("color", numpy.float32, 4),
-            ]
-        )
-
         for i in self.__batches:
             i._initializeGL()
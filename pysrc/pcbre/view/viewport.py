@@ -1,6 +1,6 @@
 import numpy
 
-from pcbre.matrix import projectPoint
+from pcbre.matrix import projectPoint, Point2, Rect
 
 # We use 4 types of coordinates:
 #
@@ -88,6 +88,21 @@ class ViewPort(object):
         # XXX
         return projectPoint(self.__w2ndc, pt)
 
+    def visible_rect(self, margin=0):
+        """
+        :param margin: border added around the viewport, in viewport pixels
+        :return: Rect of the world coordinates shown in the viewport
+        """
+        r = None
+        for x in (-margin, self.width + margin):
+            for y in (-margin, self.height + margin):
+                pt = self.tfV2W(Point2(x, y))
+                if r is None:
+                    r = Rect.fromPoints(pt, pt)
+                else:
+                    r.bbox_merge(Rect.fromPoints(pt, pt))
+        return r
+
     def tfW2V_s(self, s):
         return abs(self.fwdMatrix[0][0]) * s
 
@@ -59,3 +59,35 @@ class test_airwire(unittest.TestCase):
 
         # Removal of endpoint geom should result in removal of airwire
         self.assertNotIn(airwire, self.p.artwork.airwires)
+
+    def test_remove_unanchored(self):
+        # Airwire passes over trace_top, but is anchored elsewhere
+        t = Trace(Point2(3000, 0), Point2(3000, 100), 10, self.top_layer)
+        self.p.artwork.merge_artwork(t)
+
+        airwire = Airwire(Point2(3000, 50), Point2(7000, 50),
+                          self.top_layer, self.bottom_layer, None)
+        self.p.artwork.merge_artwork(airwire)
+
+        crossing = Trace(Point2(5000, 0), Point2(5000, 100), 10, self.top_layer)
+        self.p.artwork.merge_artwork(crossing)
+        self.assertNotEqual(crossing.net, airwire.net)
+
+        self.p.artwork.remove_artwork(crossing)
+        self.assertIn(airwire, self.p.artwork.airwires)
+
+    def test_remove_component(self):
+        from pcbre.model.const import SIDE
+        from pcbre.model.dipcomponent import DIPComponent
+
+        cmp = DIPComponent(Point2(3000, 0), 0, SIDE.Top, self.p, 4, 1000, 2000, 500)
+        self.p.artwork.merge_component(cmp)
+        pad = cmp.get_pads()[0]
+
+        airwire = Airwire(pad.center, Point2(51, 7000),
+                          self.top_layer, self.bottom_layer, None)
+        self.p.artwork.merge_artwork(airwire)
+        self.assertEqual(pad.net, self.trace_bot.net)
+
+        self.p.artwork.remove_component(cmp)
+        self.assertNotIn(airwire, self.p.artwork.airwires)
@@ -0,0 +1,184 @@
+import random
+
+from pcbre.matrix import Point2, Rect
+from pcbre.model.artwork import ArtworkIndex
+from pcbre.model.artwork_geom import Trace, Via
+from pcbre.model.net import Net
+
+import unittest
+
+
+def random_geom(obj, rng, n_traces=60, n_vias=15):
+    def pt():
+        return Point2(rng.randint(0, 2000), rng.randint(0, 2000))
+
+    geoms = []
+    for _ in range(n_traces):
+        layer = rng.choice([obj.top_layer, obj.bottom_layer])
+        geoms.append(Trace(pt(), pt(), 20, layer))
+
+    for _ in range(n_vias):
+        geoms.append(Via(pt(), obj.via_pair, 30))
+
+    return geoms
+
+
+def partition(geoms):
+    groups = {}
+    for n, g in enumerate(geoms):
+        groups.setdefault(g.net, set()).add(n)
+
+    return sorted(sorted(i) for i in groups.values())
+
+
+class test_index_insert_many(unittest.TestCase):
+
+    def setUp(self):
+        from test.common import setup2Layer
+        setup2Layer(self)
+
+        self.geoms = random_geom(self, random.Random(42))
+
+    def __query_all(self, idx):
+        r = Rect.fromPoints(Point2(-100, -100), Point2(2100, 2100))
+        return set(idx.intersect(r))
+
+    def test_bulk_matches_incremental(self):
+        a = ArtworkIndex()
+        for g in self.geoms:
+            a.insert(g)
+
+        b = ArtworkIndex()
+        b.insert_many(self.geoms)
+
+        probe = Rect.fromPoints(Point2(500, 500), Point2(900, 900))
+        self.assertEqual(set(a.intersect(probe)), set(b.intersect(probe)))
+        self.assertEqual(self.__query_all(b), set(self.geoms))
+
+    def test_bulk_into_populated(self):
+        # Rebuilding a tree must keep the entries already present
+        idx = ArtworkIndex()
+        for g in self.geoms[:10]:
+            idx.insert(g)
+
+        idx.insert_many(self.geoms[10:])
+        self.assertEqual(self.__query_all(idx), set(self.geoms))
+
+        # And removal must still work on rebuilt trees
+        for g in self.geoms[:20]:
+            idx.remove(g)
+        self.assertEqual(self.__query_all(idx), set(self.geoms[20:]))
+
+
+class test_add_many(unittest.TestCase):
+
+    def setUp(self):
+        from test.common import setup2Layer
+        setup2Layer(self)
+
+    def test_generation_bumped_once(self):
+        n = Net()
+        self.p.nets.add_net(n)
+
+        traces = [Trace(Point2(0, i * 100), Point2(100, i * 100), 10,
+                        self.top_layer, n) for i in range(10)]
+
+        gen = self.p.artwork.traces_generation
+        self.p.artwork.add_many(traces)
+
+        self.assertEqual(self.p.artwork.traces_generation, gen + 1)
+        self.assertEqual(set(self.p.artwork.traces), set(traces))
+        self.assertEqual(set(self.p.artwork.get_geom_for_net(n)), set(traces))
+
+    def test_requires_net(self):
+        t = Trace(Point2(0, 0), Point2(100, 0), 10, self.top_layer)
+        with self.assertRaises(AssertionError):
+            self.p.artwork.add_many([t])
+
+
+class test_merge_many(unittest.TestCase):
+
+    def setUp(self):
+        from test.common import setup2Layer
+        setup2Layer(self)
+
+    def test_matches_sequential(self):
+        geoms = random_geom(self, random.Random(7))
+        self.p.artwork.merge_many(geoms)
+        got = partition(geoms)
+
+        from test.common import setup2Layer
+        other = type("other", (), {})()
+        setup2Layer(other)
+        seq = random_geom(other, random.Random(7))
+        for g in seq:
+            other.p.artwork.merge_artwork(g)
+
+        self.assertEqual(got, partition(seq))
+        self.assertEqual(len(self.p.nets.nets), len(other.p.nets.nets))
+
+    def test_merges_existing_nets(self):
+        a = Trace(Point2(0, 0), Point2(100, 0), 10, self.top_layer)
+        b = Trace(Point2(300, 0), Point2(400, 0), 10, self.top_layer)
+        self.p.artwork.merge_artwork(a)
+        self.p.artwork.merge_artwork(b)
+        self.assertIsNot(a.net, b.net)
+
+        # Two new traces that bridge the existing ones through each other
+        c = Trace(Point2(100, 0), Point2(200, 0), 10, self.top_layer)
+        d = Trace(Point2(200, 0), Point2(300, 0), 10, self.top_layer)
+        lone = Trace(Point2(0, 500), Point2(100, 500), 10, self.top_layer)
+
+        self.p.artwork.merge_many([c, d, lone])
+
+        self.assertIs(a.net, b.net)
+        self.assertIs(c.net, a.net)
+        self.assertIs(d.net, a.net)
+        self.assertIsNot(lone.net, a.net)
+        self.assertEqual(len(self.p.nets.nets), 2)
+        self.assertEqual(set(self.p.artwork.get_geom_for_net(a.net)),
+                         {a, b, c, d})
+
+
+class _Recorder:
+    def __init__(self):
+        self.added = []
+        self.removed = []
+
+    def artwork_added(self, aw):
+        self.added.append(aw)
+
+    def artwork_removed(self, aw):
+        self.removed.append(aw)
+
+
+class test_listeners(unittest.TestCase):
+
+    def setUp(self):
+        from test.common import setup2Layer
+        setup2Layer(self)
+
+        self.rec = _Recorder()
+        self.p.artwork.add_listener(self.rec)
+
+    def test_add_remove(self):
+        t = Trace(Point2(0, 0), Point2(100, 0), 10, self.top_layer)
+        v = Via(Point2(500, 500), self.via_pair, 30)
+        self.p.artwork.merge_many([t, v])
+        self.assertEqual(set(self.rec.added), {t, v})
+
+        self.p.artwork.remove_artwork(t)
+        self.assertEqual(self.rec.removed, [t])
+
+        self.p.artwork.remove_listener(self.rec)
+        self.p.artwork.remove_artwork(v)
+        self.assertEqual(self.rec.removed, [t])
+
+    def test_held_weakly(self):
+        import gc
+        del self.rec
+        gc.collect()
+
+        # Nothing left to call
+        self.p.artwork.merge_artwork(
+            Trace(Point2(0, 0), Point2(100, 0), 10, self.top_layer))
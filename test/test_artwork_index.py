@@ -0,0 +1,106 @@
+from pcbre.matrix import Point2, Rect
+from pcbre.model.artwork import ArtworkIndex
+from pcbre.model.artwork_geom import Trace, Via, Airwire
+from pcbre.model.component import Component
+from pcbre.model.const import SIDE, IntersectionClass
+from pcbre.model.pad import Pad
+from pcbre.model.project import Project
+from pcbre.model.stackup import Layer, ViaPair
+
+import unittest
+
+
+class test_layered_index(unittest.TestCase):
+
+    def setUp(self):
+        self.p = Project()
+        self.layers = []
+        for i in range(4):
+            l = Layer("l%d" % i, (1, 1, 1))
+            self.p.stackup.add_layer(l)
+            self.layers.append(l)
+
+        self.vp_top = ViaPair(self.layers[0], self.layers[1])
+        self.vp_bot = ViaPair(self.layers[2], self.layers[3])
+        self.p.stackup.add_via_pair(self.vp_top)
+        self.p.stackup.add_via_pair(self.vp_bot)
+
+        self.index = ArtworkIndex()
+
+        # Same footprint on every layer
+        self.traces = [Trace(Point2(0, 0), Point2(100, 0), 10, l)
+                       for l in self.layers]
+        for t in self.traces:
+            self.index.insert(t)
+
+        self.bbox = Rect.fromPoints(Point2(40, -5), Point2(60, 5))
+
+    def test_layer_partition(self):
+        r = list(self.index.intersect_layers(self.bbox, [self.layers[2]]))
+        self.assertEqual(r, [self.traces[2]])
+
+    def test_unlayered_query(self):
+        self.assertEqual(set(self.index.intersect(self.bbox)),
+                         set(self.traces))
+
+    def test_through_always_visited(self):
+        v = Via(Point2(50, 0), self.vp_bot, 5)
+        self.index.insert(v)
+
+        r = set(self.index.intersect_layers(self.bbox, [self.layers[0]]))
+        self.assertEqual(r, {self.traces[0], v})
+
+    def test_class_filter(self):
+        aw = Airwire(Point2(50, 0), Point2(50, 500),
+                     self.layers[0], self.layers[3], None)
+        self.index.insert(aw)
+
+        r = set(self.index.intersect_layers(
+            self.bbox, [self.layers[0], self.layers[3]],
+            classes=(IntersectionClass.VIRTUAL_LINE,)))
+        self.assertEqual(r, {aw})
+
+    def test_remove(self):
+        self.index.remove(self.traces[1])
+        r = list(self.index.intersect_layers(self.bbox, [self.layers[1]]))
+        self.assertEqual(r, [])
+
+
+class test_layered_query(unittest.TestCase):
+
+    def setUp(self):
+        from test.common import setup2Layer
+        setup2Layer(self)
+
+        self.t_top = Trace(Point2(0, 0), Point2(100, 0), 10, self.top_layer)
+        self.t_bot = Trace(Point2(0, 0), Point2(100, 0), 10, self.bottom_layer)
+        self.p.artwork.merge_artwork(self.t_top)
+        self.p.artwork.merge_artwork(self.t_bot)
+
+    def test_no_cross_layer_merge(self):
+        self.assertNotEqual(self.t_top.net, self.t_bot.net)
+
+    def test_via_joins_layers(self):
+        v = Via(Point2(50, 0), self.via_pair, 5)
+        self.p.artwork.merge_artwork(v)
+        self.assertEqual(self.t_top.net, self.t_bot.net)
+
+    def test_th_pad_joins_layers(self):
+        class Dummy(Component):
+            pass
+
+        cmp = Dummy(Point2(50, 0), 0, SIDE.Top, side_layer_oracle=self.p)
+        pad = Pad(cmp, 0, Point2(0, 0), 0, 20, 20, th_diam=5)
+
+        qr = self.p.artwork.query_intersect(pad)
+        self.assertEqual(set(i for _, i in qr), {self.t_top, self.t_bot})
+
+    def test_smd_pad_single_layer(self):
+        class Dummy(Component):
+            pass
+
+        cmp = Dummy(Point2(50, 0), 0, SIDE.Bottom, side_layer_oracle=self.p)
+        pad = Pad(cmp, 0, Point2(0, 0), 0, 20, 20, side=SIDE.Bottom)
+
+        qr = self.p.artwork.query_intersect(pad)
+        self.assertEqual([i for _, i in qr], [self.t_bot])
@@ -0,0 +1,125 @@
+import os
+import tempfile
+
+from pcbre.model import blobstore
+from pcbre.model.blobstore import BlobStore
+from pcbre.model.imagelayer import ImageLayer
+from pcbre.model.project import Project
+
+import unittest
+
+
+def chunk_files(store):
+    return sorted(os.path.join(d, f)
+                  for d, _, files in os.walk(store.path) for f in files)
+
+
+class test_blob_store(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.store = BlobStore(os.path.join(self.dir.name, "blobs"))
+
+        self.old_chunk_size = blobstore.CHUNK_SIZE
+        blobstore.CHUNK_SIZE = 1024
+
+    def tearDown(self):
+        blobstore.CHUNK_SIZE = self.old_chunk_size
+        self.dir.cleanup()
+
+    def test_roundtrip(self):
+        data = os.urandom(3000)
+        keys = self.store.put(data)
+
+        self.assertEqual(len(keys), 3)
+        self.assertEqual(keys[0], BlobStore.hash(data[:1024]))
+        self.assertTrue(self.store.has_all(keys))
+        self.assertEqual(self.store.get(keys), data)
+
+    def test_dedup(self):
+        a = os.urandom(2048)
+        self.store.put(a)
+        self.assertEqual(len(chunk_files(self.store)), 2)
+
+        # Only the changed chunk is added
+        b = a[:1024] + os.urandom(1024)
+        self.store.put(b)
+        self.assertEqual(len(chunk_files(self.store)), 3)
+
+
+class test_project_blobs(unittest.TestCase):
+
+    def setUp(self):
+        from test.common import setup2Layer
+        setup2Layer(self)
+
+        self.image_data = os.urandom(4096)
+        self.p.imagery.add_imagelayer(ImageLayer("scan", self.image_data))
+
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "test.pcbre")
+        self.p.blob_store = BlobStore.sidecar(self.path)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_save_open(self):
+        self.p.save(self.path)
+
+        self.assertEqual(self.p.blob_store.location, "test.pcbre.blobs")
+        self.assertLess(os.path.getsize(self.path), len(self.image_data))
+
+        p = Project.open(self.path)
+        il, = p.imagery.imagelayers
+        self.assertEqual(il.blob_chunks,
+                         self.p.imagery.imagelayers[0].blob_chunks)
+        self.assertIsNone(il._ImageLayer__data)
+        self.assertEqual(il.data, self.image_data)
+
+        # Data from the blob store stays readable after the file is released
+        p2 = Project.open(self.path)
+        p2.close()
+        self.assertEqual(p2.imagery.imagelayers[0].data, self.image_data)
+
+    def test_resave_skips_image(self):
+        self.p.save(self.path)
+        before = chunk_files(self.p.blob_store)
+
+        p = Project.open(self.path)
+        p.save()
+
+        # The image is neither read nor rewritten
+        self.assertIsNone(p.imagery.imagelayers[0]._ImageLayer__data)
+        self.assertEqual(chunk_files(p.blob_store), before)
+
+    def test_save_as_elsewhere(self):
+        self.p.save(self.path)
+
+        p = Project.open(self.path)
+        os.mkdir(os.path.join(self.dir.name, "sub"))
+        other = os.path.join(self.dir.name, "sub", "other.pcbre")
+        p.save(other)
+
+        self.assertEqual(p.blob_store.location,
+                         os.path.join("..", "test.pcbre.blobs"))
+
+        p2 = Project.open(other)
+        self.assertEqual(p2.imagery.imagelayers[0].data, self.image_data)
+
+    def test_embed_again(self):
+        self.p.save(self.path)
+
+        p = Project.open(self.path)
+        p.blob_store = None
+        p.save()
+
+        p2 = Project.open(self.path)
+        self.assertIsNone(p2.blob_store)
+        self.assertEqual(p2.imagery.imagelayers[0].data, self.image_data)
+
+    def test_save_empty_image(self):
+        self.p.imagery.add_imagelayer(ImageLayer("empty", None))
+        self.p.save(self.path)
+
+        p = Project.open(self.path)
+        self.assertEqual(p.imagery.imagelayers[1].data, b"")
@@ -0,0 +1,159 @@
+import os
+import random
+import tempfile
+
+import numpy
+
+from pcbre.matrix import Point2
+from pcbre.model.artwork_geom import Trace, Via
+from pcbre.model.columns import ColumnStore
+from pcbre.model.project import Project
+from pcbre.model.stackup import Layer, ViaPair
+
+import unittest
+
+
+class _Store(ColumnStore):
+    FIELDS = (("v", numpy.float64, (2,)),)
+
+
+class test_column_store(unittest.TestCase):
+
+    def test_grow_and_reuse(self):
+        s = _Store(capacity=2)
+
+        slots = [s.alloc(n) for n in range(5)]
+        self.assertEqual(slots, [0, 1, 2, 3, 4])
+        self.assertGreaterEqual(s.capacity, 5)
+        self.assertEqual(s.v.shape[1:], (2,))
+
+        s.v[3] = 1, 2
+        s.free(1)
+        self.assertEqual(len(s), 4)
+        self.assertEqual(list(s.live_slots()), [0, 2, 3, 4])
+
+        # Freed slots are handed out again before growing
+        self.assertEqual(s.alloc("x"), 1)
+        self.assertEqual(s.handles[1], "x")
+        self.assertEqual(list(s.v[3]), [1, 2])
+
+
+def setup_columnar(obj):
+    obj.p = Project(columnar_artwork=True)
+    obj.top_layer = Layer("top", (1, 0, 0))
+    obj.bottom_layer = Layer("bottom", (0, 0, 1))
+    obj.p.stackup.add_layer(obj.top_layer)
+    obj.p.stackup.add_layer(obj.bottom_layer)
+
+    obj.via_pair = ViaPair(obj.top_layer, obj.bottom_layer)
+    obj.p.stackup.add_via_pair(obj.via_pair)
+
+
+class test_columnar_artwork(unittest.TestCase):
+
+    def setUp(self):
+        setup_columnar(self)
+
+    def test_attach(self):
+        t = Trace(Point2(0, 0), Point2(100, 0), 10, self.top_layer)
+        v = Via(Point2(100, 0), self.via_pair, 5)
+        self.p.artwork.merge_artwork(t)
+        self.p.artwork.merge_artwork(v)
+
+        tc = self.p.artwork.trace_columns
+        self.assertEqual(len(tc), 1)
+        self.assertEqual(list(tc.p1[t._slot]), [100, 0])
+        self.assertIs(tc.handles[t._slot], t)
+
+        # Handles read back from the store
+        self.assertEqual((t.p1.x, t.p1.y), (100, 0))
+        self.assertEqual(t.thickness, 10)
+        self.assertIs(t.layer, self.top_layer)
+        self.assertIs(v.viapair, self.via_pair)
+        self.assertEqual(v.bbox.right, 105)
+
+        # Net column follows net merges
+        self.assertIs(t.net, v.net)
+        self.assertEqual(tc.net[t._slot], t.net._id)
+        self.assertEqual(self.p.artwork.via_columns.net[v._slot], t.net._id)
+
+    def test_attached_bbox_cached(self):
+        t = Trace(Point2(0, 0), Point2(100, 0), 10, self.top_layer)
+        self.p.artwork.merge_artwork(t)
+
+        self.assertIs(t.bbox, t.bbox)
+        self.assertEqual(t.bbox.right, 105)
+        self.assertFalse(hasattr(t, "__dict__"))
+
+    def test_attached_points_cached(self):
+        t = Trace(Point2(0, 0), Point2(100, 0), 10, self.top_layer)
+        v = Via(Point2(100, 0), self.via_pair, 5)
+        self.p.artwork.merge_artwork(t)
+        self.p.artwork.merge_artwork(v)
+
+        self.assertIs(t.p0, t.p0)
+        self.assertIs(t.p1, t.p1)
+        self.assertIs(v.pt, v.pt)
+        self.assertEqual((v.pt.x, v.pt.y), (100, 0))
+
+    def test_open_columnar(self):
+        t = Trace(Point2(0, 0), Point2(100, 0), 10, self.top_layer)
+        self.p.artwork.merge_artwork(t)
+
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "columnar.pcbre")
+            self.p.save(path)
+
+            p = Project.open(path, columnar_artwork=True)
+            t2, = p.artwork.traces
+            self.assertEqual(len(p.artwork.trace_columns), 1)
+            self.assertEqual((t2.p1.x, t2.p1.y), (100, 0))
+            p.close()
+
+    def test_remove_detaches(self):
+        t = Trace(Point2(0, 0), Point2(100, 0), 10, self.top_layer)
+        self.p.artwork.merge_artwork(t)
+        self.p.artwork.remove_artwork(t)
+
+        self.assertEqual(len(self.p.artwork.trace_columns), 0)
+        self.assertIsNone(t._columns)
+        self.assertEqual((t.p1.x, t.p1.y), (100, 0))
+        self.assertIs(t.layer, self.top_layer)
+
+    def test_nets_match_object_store(self):
+        from test.common import setup2Layer
+
+        ref = type("ref", (), {})()
+        setup2Layer(ref)
+
+        def build(obj):
+            rng = random.Random(5)
+
+            def pt():
+                return Point2(rng.randint(0, 1000), rng.randint(0, 1000))
+
+            out = []
+            for _ in range(60):
+                out.append(Trace(pt(), pt(), 20,
+                                 rng.choice([obj.top_layer, obj.bottom_layer])))
+            for _ in range(10):
+                out.append(Via(pt(), obj.via_pair, 30))
+
+            for g in out:
+                obj.p.artwork.merge_artwork(g)
+
+            # Exercise net splitting as well
+            for g in out[::4]:
+                obj.p.artwork.remove_artwork(g)
+
+            return out
+
+        a = build(self)
+        b = build(ref)
+
+        def labels(geoms):
+            ids = {}
+            return [ids.setdefault(g.net, len(ids)) if g.net else None
+                    for g in geoms]
+
+        self.assertEqual(labels(a), labels(b))
@@ -0,0 +1,134 @@
+import random
+
+from pcbre.algo.geom import intersect
+from pcbre.matrix import Point2
+from pcbre.model.artwork_geom import Trace, Via
+
+import unittest
+
+
+def brute_force_groups(geoms):
+    geoms = list(geoms)
+    label = {g: n for n, g in enumerate(geoms)}
+
+    for a in geoms:
+        for b in geoms:
+            if a is not b and intersect(a, b) and label[a] != label[b]:
+                old = label[b]
+                for k, v in label.items():
+                    if v == old:
+                        label[k] = label[a]
+
+    groups = {}
+    for g, n in label.items():
+        groups.setdefault(n, set()).add(g)
+    return groups.values()
+
+
+class test_compute_connected(unittest.TestCase):
+
+    def setUp(self):
+        from test.common import setup2Layer
+        setup2Layer(self)
+
+        rng = random.Random(1234)
+
+        def pt():
+            return Point2(rng.randint(0, 2000), rng.randint(0, 2000))
+
+        for _ in range(80):
+            layer = rng.choice([self.top_layer, self.bottom_layer])
+            self.p.artwork.merge_artwork(Trace(pt(), pt(), 20, layer))
+
+        for _ in range(20):
+            self.p.artwork.merge_artwork(Via(pt(), self.via_pair, 30))
+
+    def test_matches_brute_force(self):
+        all_geom = list(self.p.artwork.get_all_artwork())
+
+        expected = sorted(sorted(id(i) for i in g)
+                          for g in brute_force_groups(all_geom))
+        got = sorted(sorted(id(i) for i in g)
+                     for g in self.p.artwork.compute_connected(all_geom))
+
+        self.assertEqual(got, expected)
+
+    def test_groups_match_nets(self):
+        # Incremental merges and a full recompute must agree
+        for g in self.p.artwork.compute_connected(
+                self.p.artwork.get_all_artwork()):
+            self.assertEqual(len(set(i.net for i in g)), 1)
+
+    def test_progress(self):
+        calls = []
+        self.p.artwork.compute_connected(
+            self.p.artwork.get_all_artwork(),
+            progress_cb=lambda x, y: calls.append((x, y)))
+        self.assertEqual(calls[0], (0, 100))
+        self.assertEqual(calls[-1], (99, 100))
+
+
+class test_localized_split(unittest.TestCase):
+
+    def setUp(self):
+        from test.common import setup2Layer
+        setup2Layer(self)
+
+    def test_three_way_split(self):
+        center = Trace(Point2(-10, 0), Point2(10, 0), 30, self.top_layer)
+        self.p.artwork.merge_artwork(center)
+
+        # Arms only touch the center, not each other
+        arms = [Trace(Point2(25, 0), Point2(1000, 0), 10, self.top_layer),
+                Trace(Point2(-25, 0), Point2(-1000, 0), 10, self.top_layer),
+                Trace(Point2(0, 20), Point2(0, 1000), 10, self.top_layer)]
+        for t in arms:
+            self.p.artwork.merge_artwork(t)
+
+        self.assertEqual(len(set(t.net for t in arms)), 1)
+
+        self.p.artwork.remove_artwork(center)
+        self.assertEqual(len(set(t.net for t in arms)), 3)
+        self.assertEqual(len(self.p.nets.nets), 3)
+
+    def test_ring_no_split(self):
+        pts = [Point2(0, 0), Point2(100, 0), Point2(100, 100), Point2(0, 100)]
+        ring = [Trace(a, b, 10, self.top_layer)
+                for a, b in zip(pts, pts[1:] + pts[:1])]
+        for t in ring:
+            self.p.artwork.merge_artwork(t)
+
+        net = ring[0].net
+        self.p.artwork.remove_artwork(ring[0])
+
+        for t in ring[1:]:
+            self.assertIs(t.net, net)
+        self.assertEqual(len(self.p.nets.nets), 1)
+
+    def test_random_removals(self):
+        rng = random.Random(4321)
+
+        def pt():
+            return Point2(rng.randint(0, 1500), rng.randint(0, 1500))
+
+        for _ in range(120):
+            layer = rng.choice([self.top_layer, self.bottom_layer])
+            self.p.artwork.merge_artwork(Trace(pt(), pt(), 20, layer))
+
+        for _ in range(15):
+            self.p.artwork.merge_artwork(Via(pt(), self.via_pair, 30))
+
+        for _ in range(40):
+            aw = rng.choice(list(self.p.artwork.get_all_artwork()))
+            self.p.artwork.remove_artwork(aw)
+
+            all_geom = list(self.p.artwork.get_all_artwork())
+            groups = self.p.artwork.compute_connected(all_geom)
+
+            # Each connected group has exactly one net, and no two groups
+            # share a net
+            nets = [set(i.net for i in g) for g in groups]
+            for n in nets:
+                self.assertEqual(len(n), 1)
+            self.assertEqual(len(set(n.pop() for n in nets)), len(groups))
+            self.assertEqual(len(self.p.nets.nets), len(groups))
@@ -0,0 +1,87 @@
+import csv
+import io
+import json
+import os
+import tempfile
+
+from pcbre.view.framestats import FrameStats
+
+import unittest
+
+
+class test_frame_stats(unittest.TestCase):
+
+    def setUp(self):
+        self.stats = FrameStats(history=3)
+
+    def frame(self, calls=1):
+        self.stats.begin_frame()
+        with self.stats.phase("draw"):
+            for _ in range(calls):
+                self.stats.draw("traces", 10)
+        with self.stats.phase("draw"):
+            pass
+        self.stats.upload("vias", 24)
+        return self.stats.end_frame()
+
+    def test_record(self):
+        f = self.frame(calls=2)
+        self.assertEqual(f.draw_calls["traces"], 2)
+        self.assertEqual(f.instances["traces"], 20)
+        self.assertEqual(f.upload_bytes["vias"], 24)
+        self.assertEqual(list(f.phases), ["draw"])
+        self.assertGreaterEqual(f.total, f.phases["draw"])
+
+    def test_subphases(self):
+        self.stats.begin_frame()
+        with self.stats.phase("draw"):
+            with self.stats.phase("layer a/b"):
+                pass
+        f = self.stats.end_frame()
+
+        self.assertEqual(list(f.phases), ["draw/layer a_b", "draw"])
+        self.assertGreaterEqual(f.phases["draw"], f.phases["draw/layer a_b"])
+        self.assertEqual(list(f.to_dict()["phases_ms"]), ["draw"])
+
+        out = io.StringIO()
+        self.stats.write_csv(out)
+        header = out.getvalue().splitlines()[0].split(",")
+        self.assertEqual(header[3:5], ["draw_ms", "draw/layer a_b_ms"])
+
+        self.assertIn("\n    layer a_b", self.stats.hud_text())
+
+    def test_ring(self):
+        for i in range(5):
+            self.frame()
+        self.assertEqual([f.number for f in self.stats.frames], [2, 3, 4])
+
+    def test_summary(self):
+        self.frame(calls=1)
+        self.frame(calls=3)
+        mean = self.stats.summary()
+        self.assertEqual(mean.draw_calls["traces"], 2)
+        self.assertEqual(mean.upload_bytes["vias"], 24)
+        self.assertIn("traces", self.stats.hud_text())
+
+    def test_csv(self):
+        self.frame(calls=2)
+        f = io.StringIO()
+        self.stats.write_csv(f)
+
+        rows = list(csv.DictReader(io.StringIO(f.getvalue())))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["draw_calls:traces"], "2")
+        self.assertEqual(rows[0]["instances:traces"], "20")
+        self.assertEqual(rows[0]["upload_bytes:vias"], "24")
+        self.assertIn("draw_ms", rows[0])
+
+    def test_export_json(self):
+        self.frame()
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "stats.json")
+            self.stats.export(path)
+            with open(path) as f:
+                data = json.load(f)
+
+        self.assertEqual(len(data["frames"]), 1)
+        self.assertEqual(data["frames"][0]["draw_calls"], {"traces": 1})
@@ -0,0 +1,102 @@
+import random
+
+import numpy
+
+from pcbre.algo.geom import (
+    capsule_arrays,
+    dist_capsule_many,
+    dist_seg_seg_many,
+    distance,
+    distance_many,
+    distance_pairs,
+)
+from pcbre.matrix import Point2, line_distance_segment
+from pcbre.model.artwork_geom import Trace, Via, Airwire
+from pcbre.model.component import Component
+from pcbre.model.const import SIDE
+from pcbre.model.pad import Pad
+
+import unittest
+
+
+class Dummy(Component):
+    pass
+
+
+class test_geom_batch(unittest.TestCase):
+
+    def setUp(self):
+        from test.common import setup2Layer
+        setup2Layer(self)
+
+        rng = random.Random(99)
+
+        def pt():
+            return Point2(rng.randint(0, 400), rng.randint(0, 400))
+
+        self.geoms = []
+        for _ in range(40):
+            layer = rng.choice([self.top_layer, self.bottom_layer])
+            self.geoms.append(Trace(pt(), pt(), rng.randint(1, 30), layer))
+
+        for _ in range(15):
+            self.geoms.append(Via(pt(), self.via_pair, rng.randint(2, 20)))
+
+        for _ in range(15):
+            side = rng.choice([SIDE.Top, SIDE.Bottom])
+            cmp = Dummy(pt(), rng.uniform(0, 6.28), side,
+                        side_layer_oracle=self.p)
+            w = rng.randint(5, 40)
+            l = rng.choice([w, rng.randint(5, 40)])
+            th = rng.choice([0, 3])
+            self.geoms.append(
+                Pad(cmp, 0, Point2(0, 0), rng.uniform(0, 6.28), w, l,
+                    th_diam=th, side=side))
+
+    def test_seg_seg(self):
+        rng = numpy.random.RandomState(3)
+        pts = rng.randint(0, 100, size=(4, 200, 2)).astype(float)
+
+        got = dist_seg_seg_many(*pts)
+        expected = [line_distance_segment(*(Point2(*p[n]) for p in pts))
+                    for n in range(200)]
+
+        numpy.testing.assert_allclose(got, expected, atol=1e-9)
+
+    def test_seg_seg_crossing(self):
+        a0 = numpy.array([[0., 0.]])
+        a1 = numpy.array([[10., 10.]])
+        b0 = numpy.array([[0., 10.]])
+        b1 = numpy.array([[10., 0.]])
+        self.assertEqual(dist_seg_seg_many(a0, a1, b0, b1)[0], 0)
+
+    def test_pairs_match_scalar(self):
+        a = []
+        b = []
+        for i in self.geoms:
+            for j in self.geoms:
+                a.append(i)
+                b.append(j)
+
+        expected = [distance(i, j) for i, j in zip(a, b)]
+        numpy.testing.assert_allclose(distance_pairs(a, b), expected,
+                                      atol=1e-6)
+
+    def test_one_to_many(self):
+        aw = Airwire(Point2(0, 0), Point2(100, 100),
+                     self.top_layer, self.bottom_layer, None)
+        others = self.geoms + [aw]
+
+        for g in self.geoms[::7]:
+            expected = [distance(g, o) for o in others]
+            numpy.testing.assert_allclose(distance_many(g, others), expected,
+                                          atol=1e-6)
+
+    def test_layer_disjoint(self):
+        t1 = Trace(Point2(0, 0), Point2(10, 0), 5, self.top_layer)
+        t2 = Trace(Point2(0, 0), Point2(10, 0), 5, self.bottom_layer)
+
+        c = capsule_arrays([t1, t2])
+        d = dist_capsule_many(capsule_arrays([t1]), c)
+        self.assertLess(d[0], 0)
+        self.assertEqual(d[1], numpy.inf)
@@ -0,0 +1,112 @@
+import cv2
+import numpy
+
+from pcbre.model.imagecache import ImageCache
+from pcbre.model.imagelayer import ImageLayer
+from pcbre.model.project import Project
+
+import unittest
+
+
+class test_image_cache(unittest.TestCase):
+
+    def setUp(self):
+        self.evicted = []
+        self.cache = ImageCache(300, on_evict=self.evicted.append)
+
+    def load(self, n):
+        return lambda: numpy.full(100, n, dtype=numpy.uint8)
+
+    def test_lru(self):
+        for i in range(3):
+            self.cache.get(i, self.load(i))
+        self.assertEqual(self.cache.size, 300)
+
+        # Using 0 makes 1 the least recently used
+        self.cache.get(0, self.load(-1))
+        self.cache.get(3, self.load(3))
+
+        self.assertEqual([int(a[0]) for a in self.evicted], [1])
+        self.assertNotIn(1, self.cache)
+        self.assertEqual(self.cache.size, 300)
+        self.assertEqual(int(self.cache.peek(0)[0]), 0)
+
+    def test_over_budget(self):
+        big = self.cache.get("big", lambda: numpy.zeros(1000, numpy.uint8))
+        self.assertIs(self.cache.peek("big"), big)
+
+        self.cache.get(0, self.load(0))
+        self.assertNotIn("big", self.cache)
+        self.assertEqual(len(self.cache), 1)
+
+    def test_budget_change(self):
+        for i in range(3):
+            self.cache.get(i, self.load(i))
+
+        self.cache.budget = 100
+        self.assertEqual(len(self.cache), 1)
+        self.assertIn(2, self.cache)
+
+    def test_sized(self):
+        self.cache.get("a", lambda: "texture", size=lambda v: 250)
+        self.cache.get("b", lambda: "texture", size=lambda v: 100)
+        self.assertEqual(self.evicted, ["texture"])
+
+        self.cache.discard_where(lambda k: k == "b")
+        self.assertEqual(self.cache.size, 0)
+
+
+class test_decode_cache(unittest.TestCase):
+
+    def setUp(self):
+        self.p = Project()
+
+        im = numpy.zeros((30, 40, 3), dtype=numpy.uint8)
+        ok, buf = cv2.imencode(".png", im)
+
+        self.layers = [ImageLayer("scan%d" % i, buf.tobytes())
+                       for i in range(3)]
+        for il in self.layers:
+            self.p.imagery.add_imagelayer(il)
+
+        self.p.image_cache.budget = 2 * im.nbytes
+
+    def test_evicted(self):
+        a, b, c = self.layers
+        decoded = a.decoded_image
+        self.assertIs(a.decoded_image, decoded)
+
+        b.decoded_image
+        c.decoded_image
+        self.assertNotIn(a, self.p.image_cache)
+        self.assertEqual(self.p.image_cache.size, 2 * decoded.nbytes)
+
+        # Decoded again on demand
+        self.assertEqual(a.decoded_image.shape, (30, 40, 3))
+        self.assertIsNot(a.decoded_image, decoded)
+
+    def test_shape_kept(self):
+        a = self.layers[0]
+        self.assertEqual(a.shape, (30, 40, 3))
+        a.release_decode()
+
+        # Neither needs the image decoded again
+        self.assertEqual(a.shape, (30, 40, 3))
+        a.pixel_to_normalized
+        self.assertNotIn(a, self.p.image_cache)
+
+    def test_set_decoded_data_pinned(self):
+        a = self.layers[0]
+        ar = numpy.zeros((10, 20, 3), dtype=numpy.float32)
+        a.set_decoded_data(ar)
+
+        for il in self.layers[1:]:
+            il.decoded_image
+        self.assertIs(a.decoded_image, ar)
+        self.assertEqual(a.shape, (10, 20, 3))
+
+    def test_close_releases(self):
+        for il in self.layers:
+            il.decoded_image
+        self.p.close()
+        self.assertEqual(len(self.p.image_cache), 0)
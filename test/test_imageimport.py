@@ -0,0 +1,80 @@
+import concurrent.futures
+import os
+import tempfile
+
+import cv2
+import numpy
+
+from pcbre.model import imageimport
+from pcbre.model.imageimport import ImageImport
+from pcbre.model.imagepyramid import ImagePyramid
+
+import unittest
+
+
+class test_image_import(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.dir.name, "cache")
+
+        self.files = []
+        for i, shape in enumerate([(300, 200, 3), (50, 80, 3)]):
+            im = numpy.full(shape, i * 100, dtype=numpy.uint8)
+            fname = os.path.join(self.dir.name, "scan%d.png" % i)
+            cv2.imwrite(fname, im)
+            self.files.append(fname)
+
+        self.bad = os.path.join(self.dir.name, "notes.png")
+        with open(self.bad, "wb") as f:
+            f.write(b"not an image")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def run_import(self, files, executor=None):
+        if executor is None:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+        task = ImageImport(files, executor=executor, cache_dir=self.cache_dir)
+        return task, task.finish()
+
+    def test_import(self):
+        task, (layers, errors) = self.run_import(self.files)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(task.progress, (2, 2))
+        self.assertEqual([il.name for il in layers], ["scan0.png", "scan1.png"])
+
+        il = layers[0]
+        with open(self.files[0], "rb") as f:
+            self.assertEqual(il.data, f.read())
+
+        # Shape and pyramid are known without decoding the image again
+        self.assertEqual(il.shape, (300, 200, 3))
+        p = ImagePyramid.open(os.path.join(self.cache_dir, il.content_key))
+        self.assertEqual((p.width, p.height), (200, 300))
+
+    def test_errors(self):
+        old = imageimport.MAX_DIMENSION
+        imageimport.MAX_DIMENSION = 100
+        try:
+            _, (layers, errors) = self.run_import(
+                self.files + [self.bad, self.bad + ".missing"])
+        finally:
+            imageimport.MAX_DIMENSION = old
+
+        self.assertEqual([il.name for il in layers], ["scan1.png"])
+        self.assertEqual([os.path.basename(e.filename) for e in errors],
+                         ["scan0.png", "notes.png", "notes.png.missing"])
+        self.assertIn("200 x 300", str(errors[0]))
+
+    def test_worker_processes(self):
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=2)
+        try:
+            _, (layers, errors) = self.run_import(self.files + [self.bad],
+                                                  executor)
+        finally:
+            executor.shutdown()
+
+        self.assertEqual(len(layers), 2)
+        self.assertEqual(str(errors[0]), "notes.png: not a readable image")
@@ -0,0 +1,135 @@
+import concurrent.futures
+import tempfile
+import threading
+
+import cv2
+import numpy
+
+from pcbre.model import imagepyramid
+from pcbre.model.imagelayer import ImageLayer
+from pcbre.view.imageloader import ImageLoader
+
+import unittest
+
+
+class test_image_loader(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+        self.old_tile_size = imagepyramid.TILE_SIZE
+        imagepyramid.TILE_SIZE = 64
+
+        self.im = numpy.random.randint(0, 255, (100, 150, 3), dtype=numpy.uint8)
+        ok, buf = cv2.imencode(".png", self.im)
+        self.il = ImageLayer("scan", buf.tobytes())
+
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    def tearDown(self):
+        self.executor.shutdown()
+        imagepyramid.TILE_SIZE = self.old_tile_size
+        self.dir.cleanup()
+
+    def loader(self):
+        return ImageLoader(self.il, executor=self.executor,
+                           cache_dir=self.dir.name)
+
+    def block(self):
+        """
+        Occupy the worker until the returned event is set
+        """
+        ev = threading.Event()
+        self.executor.submit(ev.wait)
+        return ev
+
+    def test_load(self):
+        ev = self.block()
+        loader = self.loader()
+
+        # Opening the pyramid doesn't wait for the worker
+        self.assertIsNone(loader.pyramid)
+        ev.set()
+        loader.wait()
+        self.assertEqual(loader.pyramid.levels, 3)
+
+        loader.request((0, 2, 1))
+        self.assertTrue(loader.pending((0, 2, 1)))
+        loader.wait()
+
+        (key, tile), = loader.collect()
+        self.assertEqual(key, (0, 2, 1))
+        numpy.testing.assert_array_equal(tile, self.im[64:, 128:])
+        self.assertFalse(loader.pending(key))
+        self.assertEqual(loader.collect(), [])
+
+    def test_retain(self):
+        loader = self.loader()
+        loader.wait()
+
+        ev = self.block()
+        loader.request((0, 0, 0))
+        loader.request((0, 1, 0))
+
+        # Tiles that scrolled out of view before being read are dropped
+        loader.retain({(0, 1, 0)})
+        self.assertFalse(loader.pending((0, 0, 0)))
+        ev.set()
+        loader.wait()
+
+        self.assertEqual([k for k, _ in loader.collect()], [(0, 1, 0)])
+
+    def test_tile_error(self):
+        loader = self.loader()
+        loader.wait()
+
+        # No such tile, reading it fails
+        key = (0, 9, 9)
+        loader.request(key)
+        loader.wait()
+
+        with self.assertLogs("pcbre.view.imageloader", "ERROR"):
+            self.assertEqual(loader.collect(), [])
+        self.assertTrue(loader.failed(key))
+
+        # Not tried again
+        loader.request(key)
+        self.assertFalse(loader.pending(key))
+
+    def test_pyramid_error(self):
+        il = ImageLayer("broken", b"not an image")
+        loader = ImageLoader(il, executor=self.executor,
+                             cache_dir=self.dir.name)
+        loader.wait()
+
+        with self.assertLogs("pcbre.view.imageloader", "ERROR"):
+            self.assertIsNone(loader.pyramid)
+        self.assertTrue(loader.pyramid_failed)
+
+        # The failure is kept rather than raised again on every access
+        with self.assertNoLogs("pcbre.view.imageloader"):
+            self.assertIsNone(loader.pyramid)
+
+        loader.request((0, 0, 0))
+        self.assertFalse(loader.pending((0, 0, 0)))
+
+    def test_source_read_on_caller(self):
+        data = self.il.data
+        threads = []
+
+        def source():
+            threads.append(threading.current_thread())
+            return data
+
+        il = ImageLayer("lazy", None)
+        il._set_data_source(source)
+
+        ev = self.block()
+        loader = ImageLoader(il, executor=self.executor,
+                             cache_dir=self.dir.name)
+
+        # The project file may be released once the loader is created
+        self.assertEqual(threads, [threading.current_thread()])
+        ev.set()
+        loader.wait()
+        self.assertEqual(loader.pyramid.levels, 3)
@@ -0,0 +1,109 @@
+import os
+import tempfile
+
+import cv2
+import numpy
+
+from pcbre.model.imagelayer import ImageLayer
+from pcbre.model.imagepyramid import ImagePyramid, prune_cache
+
+import unittest
+
+
+class test_image_pyramid(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+        # Horizontal gradient, so downsampled levels are easy to check
+        row = numpy.linspace(0, 255, 1000).astype(numpy.uint8)
+        im = numpy.dstack([numpy.tile(row, (600, 1))] * 3)
+        ok, buf = cv2.imencode(".png", im)
+        self.im = im
+        self.il = ImageLayer("scan", buf.tobytes())
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def build(self):
+        return ImagePyramid.build(os.path.join(self.dir.name, "p"), self.im,
+                                  tile_size=256)
+
+    def test_levels(self):
+        p = self.build()
+
+        self.assertEqual(p.levels, 3)
+        self.assertEqual(p.level_size(1), (500, 300))
+        self.assertEqual(p.level_size(2), (250, 150))
+        self.assertEqual(p.tile_count(0), (4, 3))
+
+        # Edge tiles are cropped to the image
+        self.assertEqual(p.tile(0, 0, 0).shape, (256, 256, 3))
+        self.assertEqual(p.tile(0, 3, 2).shape, (600 - 512, 1000 - 768, 3))
+        numpy.testing.assert_array_equal(p.tile(0, 3, 2),
+                                         self.im[512:, 768:])
+
+        # Coarser levels are the image scaled down
+        top = p.tile(2, 0, 0)
+        self.assertEqual(top.shape, (150, 250, 3))
+        self.assertLess(abs(int(top[0, 125, 0]) - int(self.im[0, 500, 0])), 3)
+
+    def test_tiles_cover_image(self):
+        p = self.build()
+        for level in range(p.levels):
+            cols, rows = p.tile_count(level)
+            self.assertEqual(p.tile_rect(level, cols - 1, rows - 1)[2:],
+                             (1000, 600))
+
+    def test_visible_tiles(self):
+        p = self.build()
+
+        self.assertEqual(p.visible_tiles(0, (300, 0, 600, 100)),
+                         [(1, 0), (2, 0)])
+        self.assertEqual(p.visible_tiles(1, (-500, -500, 5000, 5000)),
+                         [(0, 0), (1, 0), (0, 1), (1, 1)])
+
+        self.assertEqual(p.level_for_scale(0.5), 0)
+        self.assertEqual(p.level_for_scale(3), 1)
+        self.assertEqual(p.level_for_scale(100), 2)
+
+    def test_cached(self):
+        p = ImagePyramid.open_or_build(self.il, cache_dir=self.dir.name)
+        self.assertEqual((p.width, p.height), (1000, 600))
+        self.assertEqual(os.path.dirname(p.path), self.dir.name)
+        meta = os.path.join(p.path, "meta.json")
+        mtime = os.path.getmtime(meta)
+
+        # Another layer with the same image reuses the pyramid
+        il2 = ImageLayer("copy", self.il.data)
+        p2 = ImagePyramid.open_or_build(il2, cache_dir=self.dir.name)
+        self.assertEqual(p2.path, p.path)
+        self.assertEqual(os.path.getmtime(meta), mtime)
+
+    def test_incomplete_rebuilt(self):
+        p = ImagePyramid.open_or_build(self.il, cache_dir=self.dir.name)
+        os.unlink(os.path.join(p.path, "meta.json"))
+
+        self.assertIsNone(ImagePyramid.open(p.path))
+        p2 = ImagePyramid.open_or_build(self.il, cache_dir=self.dir.name)
+        self.assertEqual(p2.levels, p.levels)
+
+    def test_prune(self):
+        paths = []
+        for n in range(3):
+            p = ImagePyramid.build(os.path.join(self.dir.name, str(n)),
+                                   self.im, tile_size=256)
+            os.utime(p.path, (1000 + n, 1000 + n))
+            paths.append(p.path)
+
+        # Pyramids built by open_or_build are in use, and kept
+        used = ImagePyramid.open_or_build(self.il, cache_dir=self.dir.name)
+        os.utime(used.path, (0, 0))
+
+        size = sum(os.path.getsize(os.path.join(d, f))
+                   for d, _, files in os.walk(paths[2]) for f in files)
+        removed = prune_cache(self.dir.name, max_bytes=3 * size)
+
+        self.assertEqual(removed, [paths[0]])
+        self.assertTrue(os.path.isdir(used.path))
+        self.assertTrue(os.path.isdir(paths[1]))
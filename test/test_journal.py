@@ -0,0 +1,181 @@
+import os
+import tempfile
+
+import pcbre.model.project
+from pcbre.matrix import Point2
+from pcbre.model.artwork_geom import Trace, Via
+from pcbre.model.const import SIDE
+from pcbre.model.dipcomponent import DIPComponent
+from pcbre.model.journal import journal_path
+from pcbre.model.project import Project
+from pcbre.model.stackup import Layer
+
+import unittest
+
+
+def describe(p):
+    """
+    Artwork and nets of p in a form comparable between projects
+    """
+    nets = {}
+
+    def net(n):
+        return nets.setdefault(n, len(nets)) if n is not None else None
+
+    out = []
+    for t in sorted(p.artwork.traces,
+                    key=lambda t: (t.p0.x, t.p0.y, t.p1.x, t.p1.y)):
+        out.append(("t", t.p0.x, t.p0.y, t.p1.x, t.p1.y, t.layer.name,
+                    net(t.net)))
+
+    for v in sorted(p.artwork.vias, key=lambda v: (v.pt.x, v.pt.y)):
+        out.append(("v", v.pt.x, v.pt.y, net(v.net)))
+
+    for c in sorted(p.artwork.components, key=lambda c: c.refdes):
+        out.append(("c", c.refdes, tuple(net(pad.net) for pad in c.get_pads())))
+
+    out.append(sorted((n.name, n.net_class) for n in p.nets.nets))
+    return out
+
+
+class test_journal(unittest.TestCase):
+
+    def setUp(self):
+        from test.common import setup2Layer
+        setup2Layer(self)
+
+        # Test snapshots are tiny, don't compact just because the journal
+        # outgrows them
+        self.old_ratio = pcbre.model.project.COMPACT_RATIO
+        pcbre.model.project.COMPACT_RATIO = float("inf")
+
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "test.pcbre")
+        self.jpath = journal_path(self.path)
+
+        self.chain = [Trace(Point2(i * 100, 0), Point2(i * 100 + 100, 0), 10,
+                            self.top_layer) for i in range(4)]
+        for t in self.chain:
+            self.p.artwork.merge_artwork(t)
+
+        self.p.save(self.path, update_path=True)
+
+        # The first journaled save writes the snapshot
+        self.p.save_journaled()
+        self.assertFalse(os.path.exists(self.jpath))
+
+    def tearDown(self):
+        pcbre.model.project.COMPACT_RATIO = self.old_ratio
+        self.dir.cleanup()
+
+    def assertReopens(self):
+        p2 = Project.open(self.path)
+        self.assertEqual(describe(p2), describe(self.p))
+        return p2
+
+    def test_append(self):
+        snapshot = os.path.getmtime(self.path), os.path.getsize(self.path)
+
+        self.p.artwork.merge_artwork(Via(Point2(400, 0), self.via_pair, 20))
+        self.p.artwork.merge_artwork(
+            Trace(Point2(400, 0), Point2(400, 300), 10, self.bottom_layer))
+        self.p.save_journaled()
+
+        # Nothing changed, nothing written
+        size = os.path.getsize(self.jpath)
+        self.p.save_journaled()
+        self.assertEqual(os.path.getsize(self.jpath), size)
+
+        self.assertEqual(
+            (os.path.getmtime(self.path), os.path.getsize(self.path)), snapshot)
+        self.assertReopens()
+
+    def test_remove_and_split(self):
+        self.p.artwork.remove_artwork(self.chain[1])
+        self.assertIsNot(self.chain[0].net, self.chain[3].net)
+        self.p.nets.nets[0].name = "GND"
+        self.p.save_journaled()
+
+        p2 = self.assertReopens()
+
+        # The reopened project continues the same journal
+        t = next(t for t in p2.artwork.traces if t.p0.x == 0)
+        p2.artwork.remove_artwork(t)
+        p2.save_journaled()
+
+        self.p = p2
+        self.assertReopens()
+
+    def test_components(self):
+        cmp = DIPComponent(Point2(0, 0), 0, SIDE.Top, self.p, 4, 1000, 2000, 500)
+        cmp.refdes = "U1"
+        self.p.artwork.merge_component(cmp)
+        self.p.save_journaled()
+
+        # Bridging two pads moves one of them to the net of the other
+        a, b = cmp.get_pads()[:2]
+        self.assertIsNot(a.net, b.net)
+        self.p.artwork.merge_artwork(
+            Trace(a.center, b.center, 10, self.top_layer))
+        self.assertIs(a.net, b.net)
+        self.p.save_journaled()
+        self.assertTrue(os.path.exists(self.jpath))
+        self.assertReopens()
+
+        self.p.artwork.remove_component(cmp)
+        self.p.save_journaled()
+        self.assertReopens()
+
+    def test_torn_entry(self):
+        self.p.artwork.merge_artwork(Via(Point2(400, 0), self.via_pair, 20))
+        self.p.save_journaled()
+        good = os.path.getsize(self.jpath)
+
+        with open(self.jpath, "ab") as f:
+            f.write(b"\x40\x00\x00\x00\x00\x00\x00\x00\x00\x00")
+
+        self.assertReopens()
+        self.assertEqual(os.path.getsize(self.jpath), good)
+
+    def test_compaction(self):
+        old = pcbre.model.project.COMPACT_ENTRIES
+        pcbre.model.project.COMPACT_ENTRIES = 2
+        try:
+            for i in range(2):
+                self.p.artwork.merge_artwork(
+                    Via(Point2(i * 1000, 500), self.via_pair, 20))
+                self.p.save_journaled()
+
+            self.assertTrue(os.path.exists(self.jpath))
+
+            self.p.artwork.merge_artwork(Via(Point2(0, 2000), self.via_pair, 20))
+            self.p.save_journaled()
+            self.assertFalse(os.path.exists(self.jpath))
+        finally:
+            pcbre.model.project.COMPACT_ENTRIES = old
+
+        self.assertReopens()
+
+    def test_stackup_change_compacts(self):
+        self.p.stackup.add_layer(Layer("inner", (0, 1, 0)))
+        self.p.save_journaled()
+
+        self.assertFalse(os.path.exists(self.jpath))
+        p2 = self.assertReopens()
+        self.assertEqual(len(p2.stackup.layers), 3)
+
+    def test_stale_journal_ignored(self):
+        self.p.artwork.merge_artwork(Via(Point2(400, 0), self.via_pair, 20))
+        self.p.save_journaled()
+        with open(self.jpath, "rb") as f:
+            stale = f.read()
+
+        self.p.save()
+
+        # As if a crash happened after the snapshot, before the old journal
+        # was removed
+        with open(self.jpath, "wb") as f:
+            f.write(stale)
+
+        self.assertReopens()
+        self.assertEqual(os.path.getsize(self.jpath), 0)
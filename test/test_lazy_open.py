@@ -0,0 +1,62 @@
+import os
+import tempfile
+
+from pcbre.matrix import Point2
+from pcbre.model.artwork_geom import Trace
+from pcbre.model.imagelayer import ImageLayer
+from pcbre.model.project import Project
+
+import unittest
+
+
+class test_lazy_open(unittest.TestCase):
+
+    def setUp(self):
+        from test.common import setup2Layer
+        setup2Layer(self)
+
+        self.image_data = os.urandom(4096)
+        il = ImageLayer("scan", self.image_data)
+        self.p.imagery.add_imagelayer(il)
+
+        for i in range(10):
+            self.p.artwork.merge_artwork(
+                Trace(Point2(0, i * 100), Point2(100, i * 100), 10,
+                      self.top_layer))
+
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "test.pcbre")
+        self.p.save(self.path)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_deferred(self):
+        p = Project.open(self.path)
+
+        il, = p.imagery.imagelayers
+        self.assertIsNone(il._ImageLayer__data)
+        self.assertIsNotNone(p._Project__artwork_msg)
+
+        self.assertEqual(il.data, self.image_data)
+        self.assertEqual(len(p.artwork.traces), 10)
+        self.assertEqual(len(p.nets.nets), 10)
+
+    def test_resave_in_place(self):
+        p = Project.open(self.path)
+
+        # Saving over the file the project is read from must load everything
+        # first
+        p.save()
+        self.assertIsNone(p._Project__source)
+
+        p2 = Project.open(self.path)
+        self.assertEqual(p2.imagery.imagelayers[0].data, self.image_data)
+        self.assertEqual(len(p2.artwork.traces), 10)
+
+    def test_closed(self):
+        p = Project.open(self.path)
+        p.close()
+
+        with self.assertRaises(IOError):
+            p.imagery.imagelayers[0].data
@@ -65,3 +65,68 @@ class test_nets(unittest.TestCase):
         self.assertEqual(self.x.container, self.p.nets)
         self.assertEqual(self.x.what, self.net1)
         self.assertEqual(self.x.reason, ChangeType.REMOVE)
+
+
+class test_net_registry(unittest.TestCase):
+
+    def setUp(self):
+        from test.common import setup2Layer
+        setup2Layer(self)
+
+    def assertRegistryConsistent(self):
+        aw = self.p.artwork
+        for net in self.p.nets.nets:
+            expected = set(i for i in aw.get_all_artwork() if i.net is net)
+            self.assertEqual(set(aw.get_geom_for_net(net)), expected)
+
+    def test_merge_split(self):
+        from pcbre.model.artwork_geom import Trace
+
+        t1 = Trace(Point2(0, 0), Point2(100, 0), 10, self.top_layer)
+        t2 = Trace(Point2(0, 100), Point2(100, 100), 10, self.top_layer)
+        t3 = Trace(Point2(50, 0), Point2(50, 100), 10, self.top_layer)
+
+        for t in (t1, t2, t3):
+            self.p.artwork.merge_artwork(t)
+
+        self.assertEqual(set(self.p.artwork.get_geom_for_net(t1.net)),
+                         {t1, t2, t3})
+        self.assertEqual(len(self.p.nets.nets), 1)
+        self.assertRegistryConsistent()
+
+        self.p.artwork.remove_artwork(t3)
+        self.assertNotEqual(t1.net, t2.net)
+        self.assertEqual(self.p.artwork.get_geom_for_net(t1.net), [t1])
+        self.assertEqual(self.p.artwork.get_geom_for_net(t2.net), [t2])
+        self.assertRegistryConsistent()
+
+        self.p.artwork.remove_artwork(t2)
+        self.assertEqual(len(self.p.nets.nets), 1)
+        self.assertRegistryConsistent()
+
+    def test_rebuild(self):
+        from pcbre.model.artwork_geom import Trace
+
+        n1 = self.p.nets.new()
+        t1 = Trace(Point2(0, 0), Point2(100, 0), 10, self.top_layer, n1)
+        t2 = Trace(Point2(500, 0), Point2(600, 0), 10, self.top_layer, n1)
+        self.p.artwork.add_artwork(t1)
+        self.p.artwork.add_artwork(t2)
+
+        self.p.artwork.rebuild_connectivity()
+        self.assertNotEqual(t1.net, t2.net)
+        self.assertRegistryConsistent()
+
+    def test_no_net_unregistered(self):
+        from pcbre.model.const import SIDE
+        from pcbre.model.dipcomponent import DIPComponent
+
+        # Pads of an added, not merged, component have no net
+        cmp = DIPComponent(Point2(0, 0), 0, SIDE.Top, self.p, 4, 1000, 2000, 500)
+        self.p.artwork.add_component(cmp)
+        self.assertEqual(self.p.artwork.get_geom_for_net(None), [])
+
+        self.p.artwork.remove_component(cmp)
+        self.assertEqual(self.p.artwork.get_geom_for_net(None), [])
+        self.assertRegistryConsistent()
+
@@ -0,0 +1,43 @@
+from pcbre.matrix import Point2
+from pcbre.model.artwork_geom import Trace, Via, poly_repr_cache
+
+import unittest
+
+
+class test_poly_repr(unittest.TestCase):
+
+    def setUp(self):
+        from test.common import setup2Layer
+        setup2Layer(self)
+
+    def tearDown(self):
+        poly_repr_cache.maxsize = None
+
+    def test_lazy(self):
+        t = Trace(Point2(0, 0), Point2(100, 0), 10, self.top_layer)
+        v = Via(Point2(0, 0), self.via_pair, 5)
+
+        self.assertIsNone(t._Trace__poly_repr)
+        self.assertIsNone(v._Via__poly_repr)
+
+        r = t.get_poly_repr()
+        self.assertIs(t.get_poly_repr(), r)
+        self.assertAlmostEqual(r.bounds[2], 105)
+
+        self.assertAlmostEqual(v.get_poly_repr().bounds[0], -5)
+
+    def test_bounded(self):
+        poly_repr_cache.maxsize = 2
+
+        traces = [Trace(Point2(0, i), Point2(100, i), 10, self.top_layer)
+                  for i in range(3)]
+
+        for t in traces:
+            t.get_poly_repr()
+            self.assertIsNone(t._Trace__poly_repr)
+
+        self.assertEqual(len(poly_repr_cache), 2)
+
+        # Identical geometry shares a representation
+        dup = Trace(Point2(0, 2), Point2(100, 2), 10, self.top_layer)
+        self.assertIs(dup.get_poly_repr(), traces[2].get_poly_repr())
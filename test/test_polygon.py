@@ -67,3 +67,46 @@ class test_p2t_exc(unittest.TestCase):
 
         self.p.stackup.add_layer(self.l1)
         self.p.stackup.add_layer(self.l2)
+
+
+class test_polygon_tris(unittest.TestCase):
+
+    def setUp(self):
+        self.p = Project()
+        self.l1 = Layer("l1", (1, 1, 1))
+        self.p.stackup.add_layer(self.l1)
+
+        ext = [Point2(0, 0), Point2(10, 0), Point2(10, 10), Point2(0, 10)]
+        inner = [Point2(3, 3), Point2(7, 3), Point2(7, 7), Point2(3, 7)]
+        self.poly = Polygon(self.l1, ext, [inner])
+
+    def test_tris_arrays(self):
+        vertices, indices = self.poly.get_tris_arrays()
+        self.assertEqual(vertices.shape[1], 2)
+        self.assertEqual(indices.shape[1], 3)
+
+        # Triangles must exactly tile the polygon, less the hole
+        a, b, c = (vertices[indices[:, i]] for i in range(3))
+        ab = b - a
+        ac = c - a
+        area = abs(ab[:, 0] * ac[:, 1] - ab[:, 1] * ac[:, 0]).sum() / 2
+        self.assertAlmostEqual(area, 100 - 16)
+
+    def test_tris_saved(self):
+        from tempfile import TemporaryFile
+
+        self.p.artwork.merge_artwork(self.poly)
+        expected = self.poly.get_tris_arrays()
+
+        with TemporaryFile(buffering=0) as fd:
+            self.p.save_fd(fd)
+            fd.seek(0)
+            p_new = Project.open_fd(fd)
+
+        poly, = p_new.artwork.polygons
+        self.assertTrue(poly.has_tris())
+
+        vertices, indices = poly.get_tris_arrays()
+        self.assertEqual(vertices.tolist(), expected[0].tolist())
+        self.assertEqual(indices.tolist(), expected[1].tolist())
+        self.assertAlmostEqual(poly.get_poly_repr().area, 100 - 16)
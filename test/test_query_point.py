@@ -0,0 +1,49 @@
+from pcbre.matrix import Point2
+from pcbre.model.artwork_geom import Trace, Via
+
+import unittest
+
+
+class test_query_point(unittest.TestCase):
+
+    def setUp(self):
+        from test.common import setup2Layer
+        setup2Layer(self)
+
+        self.t_top = Trace(Point2(0, 0), Point2(100, 0), 10, self.top_layer)
+        self.t_bot = Trace(Point2(0, 0), Point2(100, 0), 10, self.bottom_layer)
+        self.p.artwork.merge_artwork(self.t_top)
+        self.p.artwork.merge_artwork(self.t_bot)
+
+    def test_miss(self):
+        self.assertIsNone(self.p.artwork.query_point(Point2(50, 50)))
+
+    def test_top_first(self):
+        self.assertIs(self.p.artwork.query_point(Point2(50, 0)), self.t_top)
+
+    def test_include_order(self):
+        r = self.p.artwork.query_point_all(
+            Point2(50, 0), layers_include=[self.bottom_layer, self.top_layer])
+        self.assertEqual(r, [self.t_bot, self.t_top])
+
+    def test_include(self):
+        r = self.p.artwork.query_point_all(
+            Point2(50, 0), layers_include=[self.bottom_layer])
+        self.assertEqual(r, [self.t_bot])
+
+    def test_exclude(self):
+        r = self.p.artwork.query_point_all(
+            Point2(50, 0), layers_exclude=[self.top_layer])
+        self.assertEqual(r, [self.t_bot])
+
+    def test_via_priority(self):
+        v = Via(Point2(50, 0), self.via_pair, 3)
+        self.p.artwork.merge_artwork(v)
+
+        r = self.p.artwork.query_point_all(Point2(50, 0))
+        self.assertEqual(r, [v, self.t_top, self.t_bot])
+
+        # Through geometry is found on either layer
+        r = self.p.artwork.query_point_all(
+            Point2(50, 0), layers_include=[self.bottom_layer])
+        self.assertEqual(r, [v, self.t_bot])
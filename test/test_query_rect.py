@@ -0,0 +1,73 @@
+from pcbre.matrix import Point2, Rect, scale, translate
+from pcbre.model.artwork_geom import Airwire, Trace, Via
+from pcbre.model.const import SIDE
+from pcbre.model.dipcomponent import DIPComponent
+from pcbre.view.viewport import ViewPort
+
+from test.test_columns import setup_columnar
+
+import unittest
+
+
+class test_query_rect(unittest.TestCase):
+
+    def setUp(self):
+        from test.common import setup2Layer
+        setup2Layer(self)
+
+    def populate(self):
+        self.t_near = Trace(Point2(0, 0), Point2(100, 0), 10, self.top_layer)
+        self.t_far = Trace(Point2(5000, 5000), Point2(5100, 5000), 10,
+                           self.bottom_layer)
+        self.v_near = Via(Point2(100, 0), self.via_pair, 20)
+        for i in (self.t_near, self.t_far, self.v_near):
+            self.p.artwork.merge_artwork(i)
+
+        self.cmp = DIPComponent(Point2(-2000, -2000), 0, SIDE.Top, self.p,
+                                4, 1000, 2000, 500)
+        self.p.artwork.merge_component(self.cmp)
+
+    def check_cull(self):
+        self.populate()
+        r = self.p.artwork.query_rect(Rect.fromXY(-50, -50, 200, 50))
+
+        self.assertEqual(set(r), {self.t_near, self.v_near})
+        self.assertEqual(self.p.artwork.query_rect_components(
+            Rect.fromXY(-50, -50, 200, 50)), [])
+        self.assertEqual(self.p.artwork.query_rect_components(
+            Rect.fromXY(-2100, -2100, -1900, -1900)), [self.cmp])
+
+    def test_cull(self):
+        self.check_cull()
+
+    def test_cull_columnar(self):
+        setup_columnar(self)
+        self.check_cull()
+
+    def test_airwire_crossing(self):
+        self.populate()
+        aw = Airwire(Point2(100, 0), Point2(5000, 5000),
+                     self.top_layer, self.bottom_layer, None)
+        self.p.artwork.merge_artwork(aw)
+
+        # Both endpoints are outside the rect, the wire crosses it
+        r = self.p.artwork.query_rect(Rect.fromXY(2000, 2000, 2100, 2100))
+        self.assertEqual(r, [aw])
+
+
+class test_visible_rect(unittest.TestCase):
+
+    def test_visible_rect(self):
+        vp = ViewPort(200, 100)
+        vp._transform = scale(0.01).dot(translate(-1000, 0))
+
+        r = vp.visible_rect()
+        self.assertAlmostEqual(r.left, 900, places=3)
+        self.assertAlmostEqual(r.right, 1100, places=3)
+        self.assertAlmostEqual(r.bottom, -50, places=3)
+        self.assertAlmostEqual(r.top, 50, places=3)
+
+        # One pixel is one world unit
+        r = vp.visible_rect(10)
+        self.assertAlmostEqual(r.left, 890, places=3)
+        self.assertAlmostEqual(r.top, 60, places=3)
@@ -0,0 +1,95 @@
+import os
+import tempfile
+
+from pcbre.matrix import Point2
+from pcbre.model.artwork_geom import Trace, Via
+from pcbre.model.journal import journal_path
+from pcbre.model.project import Project
+
+from test.test_columns import setup_columnar
+from test.test_journal import describe
+
+import unittest
+
+
+class test_save_async(unittest.TestCase):
+
+    def setUp(self):
+        from test.common import setup2Layer
+        setup2Layer(self)
+
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "test.pcbre")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def populate(self):
+        self.traces = [Trace(Point2(0, i * 100), Point2(100, i * 100), 10,
+                             self.top_layer) for i in range(10)]
+        for t in self.traces:
+            self.p.artwork.merge_artwork(t)
+
+    def check_isolated(self):
+        self.populate()
+        self.p.save(self.path, update_path=True)
+        expected = describe(Project.open(self.path))
+
+        self.p.artwork.merge_artwork(Via(Point2(100, 0), self.via_pair, 20))
+        expected_after = describe(self.p)
+
+        task = self.p.save_async()
+
+        # Edits during the save aren't part of it
+        self.p.artwork.remove_artwork(self.traces[0])
+        self.p.artwork.merge_artwork(
+            Trace(Point2(500, 0), Point2(500, 500), 10, self.bottom_layer))
+
+        self.assertTrue(task.finish())
+        self.assertIsNone(self.p.save_task)
+        self.assertEqual(task.progress, (11, 11))
+
+        self.assertNotEqual(expected, expected_after)
+        self.assertEqual(describe(Project.open(self.path)), expected_after)
+
+    def test_isolated(self):
+        self.check_isolated()
+
+    def test_isolated_columnar(self):
+        setup_columnar(self)
+        self.check_isolated()
+
+    def test_cancel(self):
+        self.populate()
+        self.p.save(self.path)
+        with open(self.path, "rb") as f:
+            before = f.read()
+
+        self.p.artwork.remove_artwork(self.traces[0])
+
+        task = self.p._Project__begin_save(self.path, False)
+        task.cancel()
+        task.run()
+
+        self.assertFalse(task.finish())
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), before)
+        self.assertFalse(os.path.exists(self.path + ".saving"))
+
+    def test_compaction_keeps_later_edits(self):
+        self.populate()
+        self.p.save(self.path, update_path=True)
+        self.p.save_journaled()
+
+        self.p.artwork.merge_artwork(Via(Point2(100, 0), self.via_pair, 20))
+        self.p.save_journaled()
+        self.assertTrue(os.path.exists(journal_path(self.path)))
+
+        task = self.p.save_async()
+        self.p.artwork.remove_artwork(self.traces[5])
+
+        # Waits for the compaction, then journals the edit made during it
+        self.p.save_journaled()
+        self.assertTrue(task.finish())
+
+        self.assertEqual(describe(Project.open(self.path)), describe(self.p))
@@ -0,0 +1,133 @@
+import gc
+
+import numpy
+
+from pcbre.matrix import Point2
+from pcbre.model.artwork_geom import Trace
+from pcbre.view.traceview import TraceInstances
+from pcbre.view.util import get_consolidated_draws_np, get_consolidated_draws_1
+
+import unittest
+
+_dtype = numpy.dtype([
+    ("pos_a", numpy.float32, 2),
+    ("pos_b", numpy.float32, 2),
+    ("thickness", numpy.float32),
+    ("selected", numpy.float32),
+])
+
+
+class test_trace_instances(unittest.TestCase):
+
+    def setUp(self):
+        self.inst = TraceInstances(_dtype, capacity=4)
+
+        # Drop the initial full upload
+        self.inst.take_dirty()
+
+    def trace(self, x):
+        return Trace(Point2(x, 0), Point2(x, 10), 2, None)
+
+    def test_stable_slots(self):
+        traces = [self.trace(i) for i in range(3)]
+        slots = [self.inst.slot(t) for t in traces]
+        self.assertEqual(slots, [0, 1, 2])
+        self.assertEqual(self.inst.take_dirty(), (False, [(0, 3)]))
+
+        # Drawing again changes nothing
+        self.assertEqual([self.inst.slot(t) for t in traces], slots)
+        self.assertEqual(self.inst.take_dirty(), (False, []))
+
+        row = self.inst.array[1]
+        self.assertEqual(tuple(row["pos_b"]), (1, 10))
+        self.assertEqual(row["thickness"], 1)
+
+    def test_new_trace_partial(self):
+        traces = [self.trace(i) for i in range(3)]
+        for t in traces:
+            self.inst.slot(t)
+        self.inst.take_dirty()
+
+        t = self.trace(3)
+        self.assertEqual(self.inst.slot(t), 3)
+        self.assertEqual(self.inst.take_dirty(), (False, [(3, 4)]))
+
+    def test_selection(self):
+        t = self.trace(0)
+        self.inst.slot(t)
+        self.inst.take_dirty()
+
+        self.inst.slot(t, True)
+        self.assertEqual(self.inst.array["selected"][0], 1)
+        self.assertEqual(self.inst.take_dirty(), (False, [(0, 1)]))
+
+        self.inst.slot(t, True)
+        self.assertEqual(self.inst.take_dirty(), (False, []))
+
+    def test_set_selected(self):
+        t = self.trace(0)
+        self.assertFalse(self.inst.set_selected(t, True))
+
+        other = self.trace(1)
+        self.inst.slot(other)
+        self.inst.slot(t)
+        self.inst.take_dirty()
+
+        self.assertTrue(self.inst.set_selected(t, True))
+        self.assertFalse(self.inst.set_selected(t, True))
+        self.assertEqual(self.inst.take_dirty(), (False, [(1, 2)]))
+        self.assertEqual(list(self.inst.array["selected"][:2]), [0, 1])
+
+    def test_freed_reused(self):
+        traces = [self.trace(i) for i in range(3)]
+        for t in traces:
+            self.inst.slot(t)
+        self.inst.take_dirty()
+
+        del traces[1]
+        gc.collect()
+
+        self.assertEqual(self.inst.take_dirty(), (False, [(1, 2)]))
+        self.assertEqual(len(self.inst), 2)
+        self.assertEqual(self.inst.array["thickness"][1], 0)
+
+        self.assertEqual(self.inst.slot(self.trace(5)), 1)
+        self.assertEqual(self.inst.high, 3)
+
+    def test_release(self):
+        traces = [self.trace(i) for i in range(3)]
+        for t in traces:
+            self.inst.slot(t)
+        self.inst.take_dirty()
+
+        # Freed while the trace is still referenced
+        self.assertTrue(self.inst.release(traces[1]))
+        self.assertFalse(self.inst.release(traces[1]))
+        self.assertEqual(self.inst.take_dirty(), (False, [(1, 2)]))
+        self.assertEqual(len(self.inst), 2)
+        self.assertEqual(self.inst.array["thickness"][1], 0)
+
+        # The dropped reference doesn't free the slot a second time
+        t = self.trace(5)
+        self.assertEqual(self.inst.slot(t), 1)
+        del traces[1]
+        gc.collect()
+        self.assertEqual(self.inst.take_dirty(), (False, [(1, 2)]))
+        self.assertEqual(len(self.inst), 3)
+
+    def test_grow(self):
+        traces = [self.trace(i) for i in range(6)]
+        for t in traces:
+            self.inst.slot(t)
+
+        self.assertEqual(len(self.inst.array), 8)
+        self.assertEqual(self.inst.take_dirty(), (True, []))
+        self.assertEqual(tuple(self.inst.array["pos_a"][2]), (2, 0))
+
+
+class test_consolidated_draws_np(unittest.TestCase):
+
+    def test_matches(self):
+        for indices in ([], [3], [5, 1, 2, 3, 9, 10, 2], list(range(10))):
+            self.assertEqual(get_consolidated_draws_np(indices),
+                             get_consolidated_draws_1(sorted(set(indices))))
@@ -0,0 +1,65 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from pcbre.matrix import Point2
+from pcbre.model.artwork_geom import Polygon, triangulate
+from pcbre.model.triangulation import TriangulationPool
+
+import unittest
+
+
+def square(x, size=10):
+    return [Point2(x, 0), Point2(x + size, 0),
+            Point2(x + size, size), Point2(x, size)]
+
+
+class test_triangulation_pool(unittest.TestCase):
+
+    def setUp(self):
+        from test.common import setup2Layer
+        setup2Layer(self)
+
+    def test_process_pool(self):
+        pool = TriangulationPool(max_workers=2)
+        try:
+            polys = [Polygon(self.top_layer, square(i * 20)) for i in range(4)]
+            pool.submit_many(polys)
+            self.assertTrue(all(pool.pending(p) for p in polys))
+
+            done = pool.wait()
+            self.assertEqual(set(done), set(polys))
+            self.assertFalse(pool.busy)
+
+            for p in polys:
+                self.assertTrue(p.has_tris())
+                ext = p.get_poly_repr().exterior.coords[:-1]
+                vertices, indices = triangulate(ext, [])
+                self.assertEqual(p.get_tris_arrays()[1].tolist(),
+                                 indices.tolist())
+        finally:
+            pool.shutdown()
+
+    def test_artwork_submits(self):
+        pool = TriangulationPool(executor=ThreadPoolExecutor(1))
+
+        existing = Polygon(self.top_layer, square(0))
+        self.p.artwork.merge_artwork(existing)
+
+        self.p.artwork.set_triangulation_pool(pool)
+        self.assertTrue(pool.pending(existing))
+
+        added = Polygon(self.top_layer, square(100))
+        removed = Polygon(self.top_layer, square(200))
+        self.p.artwork.merge_artwork(added)
+        self.p.artwork.merge_artwork(removed)
+        self.p.artwork.remove_artwork(removed)
+
+        self.assertTrue(pool.pending(added))
+        self.assertFalse(pool.pending(removed))
+
+        pool.wait()
+        self.assertTrue(existing.has_tris())
+        self.assertTrue(added.has_tris())
+
+        # Already triangulated polygons aren't resubmitted
+        pool.submit(added)
+        self.assertFalse(pool.busy)
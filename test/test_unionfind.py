@@ -0,0 +1,39 @@
+from pcbre.algo.unionfind import UnionFind
+
+import unittest
+
+
+class test_unionfind(unittest.TestCase):
+
+    def test_singletons(self):
+        uf = UnionFind(range(4))
+        self.assertEqual(len(uf), 4)
+        self.assertEqual(sorted(map(sorted, uf.groups())),
+                         [[0], [1], [2], [3]])
+
+    def test_union(self):
+        uf = UnionFind(range(6))
+        uf.union(0, 1)
+        uf.union(2, 3)
+        uf.union(1, 3)
+
+        self.assertTrue(uf.connected(0, 2))
+        self.assertFalse(uf.connected(0, 4))
+        self.assertEqual(sorted(map(sorted, uf.groups())),
+                         [[0, 1, 2, 3], [4], [5]])
+
+    def test_chain(self):
+        uf = UnionFind(range(1000))
+        for i in range(999):
+            uf.union(i, i + 1)
+
+        self.assertEqual(uf.find(0), uf.find(999))
+        self.assertEqual(len(uf.groups()), 1)
+
+    def test_add(self):
+        uf = UnionFind()
+        uf.add("a")
+        uf.add("a")
+        self.assertIn("a", uf)
+        self.assertNotIn("b", uf)
+        self.assertEqual(len(uf), 1)